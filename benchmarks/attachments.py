@@ -0,0 +1,150 @@
+"""
+Бенчмарк передачи вложений.
+
+Сервер запускается в том же процессе; для файлов разного размера замеряются пиковая память Python (tracemalloc)
+и скорость загрузки и скачивания вложения. Для сравнения приводится пиковая память разбора того же файла,
+встроенного в JSON-запрос в base64 (embedded): она растет с размером файла, а память передачи - нет.
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.attachments
+"""
+from argparse import ArgumentParser
+from argparse import Namespace
+from asyncio import create_task
+from asyncio import run
+from base64 import b64decode
+from base64 import b64encode
+from json import dumps
+from json import loads
+from os import urandom
+from os.path import join
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from tracemalloc import get_traced_memory
+from tracemalloc import reset_peak
+from tracemalloc import start
+from tracemalloc import stop
+from typing import Any
+from typing import Awaitable
+from typing import Callable
+from typing import Dict
+
+from benchmarks.load import get_free_port
+from benchmarks.load import wait_for_server
+from client import Client
+from server import Server
+from utils import Factories
+
+MEGABYTE = 1024 * 1024
+
+
+def parse_embedded(body: bytes) -> bytes:
+    """
+    Разбор запроса со встроенным в JSON файлом.
+
+    :param body: Тело запроса.
+    :return: Содержимое файла.
+    """
+    return b64decode(loads(body)['file'])
+
+
+async def measure(operation: Callable[[], Awaitable[Any]]) -> Dict[str, float]:
+    """
+    Пиковая память и время операции.
+
+    :param operation: Операция.
+    :return: Прирост пиковой памяти, КиБ, и время, с.
+    """
+    reset_peak()
+    baseline, _ = get_traced_memory()
+    started = perf_counter()
+    await operation()
+    elapsed = perf_counter() - started
+    _, peak = get_traced_memory()
+    return {'peak_kib': (peak - baseline) / 1024, 'seconds': elapsed}
+
+
+async def run_case(client: Client, directory: str, size: int) -> None:
+    """
+    Замер одного размера файла и вывод строки результатов.
+
+    :param client: Клиент зарегистрированного пользователя.
+    :param directory: Каталог для файлов.
+    :param size: Размер файла.
+    :return: None.
+    """
+    path = join(directory, f'{size}.bin')
+    with open(path, 'wb') as file:
+        file.write(urandom(size))
+    attachment = ''
+
+    async def upload() -> None:
+        nonlocal attachment
+        attachment = await client.upload(path)
+
+    uploaded = await measure(upload)
+    downloaded = await measure(lambda: client.download(attachment, f'{path}.out'))
+    with open(path, 'rb') as file:
+        body = dumps({'endpoint': 'upload', 'file': b64encode(file.read()).decode()}).encode()
+
+    async def parse() -> None:
+        parse_embedded(body)
+
+    embedded = await measure(parse)
+    print(
+        f'{size / MEGABYTE:>8.2f} {uploaded["peak_kib"]:>10.1f} {downloaded["peak_kib"]:>10.1f} '
+        f'{embedded["peak_kib"]:>10.1f} {size / MEGABYTE / uploaded["seconds"]:>8.1f} '
+        f'{size / MEGABYTE / downloaded["seconds"]:>8.1f}'
+    )
+
+
+async def run_benchmark(args: Namespace) -> None:
+    """
+    Запуск сервера и замеры.
+
+    :param args: Аргументы командной строки.
+    :return: None.
+    """
+    host = '127.0.0.1'
+    port = get_free_port()
+    with TemporaryDirectory() as directory:
+        server = Server(
+            host=host, port=port, common_chat=Factories.get_empty_common_chat(), private_chats=dict(), users=dict(),
+            attachments_path=join(directory, 'attachments')
+        )
+        server_task = create_task(server.listen())
+        await wait_for_server(host, port)
+        client = Client('bench', host, port)
+        await client.connect_user()
+        print('Peak traced memory, KiB; throughput, MiB/s')
+        print(f'{"MiB":>8} {"upload":>10} {"download":>10} {"embedded":>10} {"up":>8} {"down":>8}')
+        start()
+        try:
+            for size in args.sizes:
+                await run_case(client, directory, size)
+        finally:
+            stop()
+            await client.close()
+            server_task.cancel()
+
+
+def parse_args() -> Namespace:
+    """
+    Парсинг аргументов командной строки.
+
+    :return: Аргументы командной строки.
+    """
+    parser = ArgumentParser()
+    parser.add_argument(
+        '--sizes', type=int, nargs='+', default=[64 * 1024, MEGABYTE, 5 * MEGABYTE], help='File sizes, bytes'
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    run(run_benchmark(parse_args()))
+
+
+if __name__ == '__main__':
+    main()
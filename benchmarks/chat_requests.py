@@ -0,0 +1,187 @@
+"""
+Микробенчмарк обработки запросов к общему чату.
+
+Сравнивает затраты процессора на один запрос чтения и отправки при разном количестве хранимых сообщений:
+
+- async_iterator - прежняя реализация: перебор сообщений через асинхронный итератор, пересборка списка
+  при актуализации и возврат всей истории;
+- sync - текущая реализация: синхронные методы Chat, возврат непрочитанных сообщений после курсора;
+- sync_full_history - текущая реализация при чтении всей истории (since=0).
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.chat_requests
+"""
+from argparse import ArgumentParser
+from argparse import Namespace
+from asyncio import run
+from datetime import datetime
+from datetime import timedelta
+from time import process_time
+from typing import Callable
+from typing import List
+
+from builtin_types import Chat
+from builtin_types import Message
+from settings import SHARED_CHAT_MESSAGES_LIMIT
+
+
+class AsyncListIterator:
+    """
+    Асинхронный итератор для списков, как в прежней реализации.
+    """
+
+    def __init__(self, items: list):
+        self._items = items
+        self._index = 0
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._index < len(self._items):
+            item = self._items[self._index]
+            self._index += 1
+            return item
+        raise StopAsyncIteration
+
+
+class AsyncIteratorChat:
+    """
+    Прежняя реализация чата: список сообщений, перебираемый асинхронным итератором.
+    """
+
+    def __init__(self, messages: List[Message], actuality_period: timedelta):
+        self._messages = messages
+        self._actuality_period = actuality_period
+
+    async def get_messages(self, user_registration_datetime: datetime) -> List[Message]:
+        before_registration_message_index = 0
+        async for i in AsyncListIterator(list(range(len(self._messages)))):
+            if self._messages[i].sending_time < user_registration_datetime:
+                before_registration_message_index += 1
+            else:
+                break
+        if before_registration_message_index > SHARED_CHAT_MESSAGES_LIMIT - 1:
+            return self._messages[before_registration_message_index - SHARED_CHAT_MESSAGES_LIMIT:]
+        return self._messages
+
+    async def actualize(self) -> None:
+        self._messages = [
+            msg async for msg in AsyncListIterator(self._messages)
+            if msg.sending_time > datetime.now() - self._actuality_period
+        ]
+
+    async def read(self, user_registration_datetime: datetime) -> str:
+        await self.actualize()
+        messages = await self.get_messages(user_registration_datetime)
+        return '\n'.join([str(msg) async for msg in AsyncListIterator(list(messages))])
+
+    async def send(self, message: Message, user_registration_datetime: datetime) -> str:
+        self._messages.append(message)
+        messages = await self.get_messages(user_registration_datetime)
+        await self.actualize()
+        return '\n'.join([str(msg) async for msg in AsyncListIterator(list(messages))])
+
+
+def build_messages(count: int, now: datetime) -> List[Message]:
+    """
+    Создание сообщений, равномерно распределенных по последним 30 минутам.
+
+    :param count: Количество сообщений.
+    :param now: Текущее время.
+    :return: Список сообщений.
+    """
+    step = timedelta(minutes=30) / count
+    start = now - timedelta(minutes=30)
+    return [
+        Message(sending_time=start + step * i, sender_name='user', text=f'message {i}', seq=i + 1)
+        for i in range(count)
+    ]
+
+
+def measure(function: Callable[[], object], repeat: int) -> float:
+    """
+    Среднее процессорное время одного вызова в микросекундах.
+
+    :param function: Измеряемая функция.
+    :param repeat: Количество повторов.
+    :return: Время одного вызова, мкс.
+    """
+    started = process_time()
+    for _ in range(repeat):
+        function()
+    return (process_time() - started) / repeat * 1_000_000
+
+
+def run_case(count: int, repeat: int) -> None:
+    """
+    Замер одного размера истории и вывод строки результатов.
+
+    :param count: Количество хранимых сообщений.
+    :param repeat: Количество повторов.
+    :return: None.
+    """
+    now = datetime.now()
+    registration = now - timedelta(minutes=15)
+
+    legacy_chat = AsyncIteratorChat(build_messages(count, now), timedelta(hours=1))
+    chat = Chat(name='Common', messages=build_messages(count, now), actuality_period=1)
+
+    def legacy_read() -> None:
+        run(legacy_chat.read(registration))
+
+    def legacy_send() -> None:
+        run(legacy_chat.send(Message(datetime.now(), 'user', 'new'), registration))
+
+    def sync_read() -> None:
+        chat.actualize()
+        '\n'.join(map(str, chat.get_messages(registration, since=chat.last_seq - 1)))
+
+    def sync_send() -> None:
+        messages = chat.add_message(Message(datetime.now(), 'user', 'new'), registration, since=chat.last_seq)
+        chat.actualize()
+        '\n'.join(map(str, messages))
+
+    def sync_full_history() -> None:
+        chat.actualize()
+        '\n'.join(map(str, chat.get_messages(registration)))
+
+    # Пустой цикл событий измеряется отдельно, чтобы не приписывать его стоимость прежней реализации.
+    async def noop() -> None:
+        pass
+
+    loop_overhead = measure(lambda: run(noop()), repeat)
+    results = [
+        measure(legacy_read, repeat) - loop_overhead,
+        measure(legacy_send, repeat) - loop_overhead,
+        measure(sync_read, repeat),
+        measure(sync_send, repeat),
+        measure(sync_full_history, repeat),
+    ]
+    print(f'{count:>8} ' + ' '.join(f'{value:>18.1f}' for value in results))
+
+
+def parse_args() -> Namespace:
+    """
+    Парсинг аргументов командной строки.
+
+    :return: Аргументы командной строки.
+    """
+    parser = ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 100_000], help='Retained messages')
+    parser.add_argument('--repeat', type=int, default=20, help='Requests per measurement')
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    print('CPU time per request, us')
+    columns = ['async_iterator_read', 'async_iterator_send', 'sync_read', 'sync_send', 'sync_full_history']
+    print(f'{"messages":>8} ' + ' '.join(f'{column:>18}' for column in columns))
+    for count in args.sizes:
+        run_case(count, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
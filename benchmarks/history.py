@@ -0,0 +1,118 @@
+"""
+Бенчмарк холодной истории чата.
+
+В чат с горячим окном из --hot сообщений добавляются сообщения; вышедшие из окна переносятся в сжатые сегменты
+холодной истории. После каждого шага выводятся общее количество сообщений, RSS процесса, объем истории на диске
+в байтах на сообщение и задержка чтения случайной страницы старой истории (по номеру и по времени отправки).
+RSS не должен расти вместе с историей: в памяти остаются горячее окно и разреженный индекс.
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.history
+"""
+from argparse import ArgumentParser
+from argparse import Namespace
+from asyncio import run
+from datetime import datetime
+from datetime import timedelta
+from gc import collect
+from os import getpid
+from os import listdir
+from os.path import getsize
+from os.path import join
+from random import randint
+from random import seed
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from benchmarks.load import get_rss
+from builtin_types import Chat
+from builtin_types import ChatHistory
+from builtin_types import Message
+
+MEGABYTE = 1024 * 1024
+
+
+def get_directory_size(path: str) -> int:
+    """
+    Объем файлов каталога.
+
+    :param path: Путь к каталогу.
+    :return: Байт.
+    """
+    return sum(getsize(join(path, name)) for name in listdir(path))
+
+
+async def measure_reads(chat: Chat, first_timestamp: int, step: int, count: int, reads: int) -> float:
+    """
+    Средняя задержка чтения случайной страницы старой истории.
+
+    :param chat: Чат.
+    :param first_timestamp: Время отправки первого сообщения, микросекунды epoch.
+    :param step: Интервал между сообщениями, микросекунды.
+    :param count: Количество сообщений в холодной истории.
+    :param reads: Количество чтений.
+    :return: Миллисекунд на страницу.
+    """
+    started = perf_counter()
+    for _ in range(reads // 2):
+        await chat.get_history(since=randint(0, count))
+        await chat.get_history(start=first_timestamp + randint(0, count) * step)
+    return (perf_counter() - started) / (reads // 2 * 2) * 1000
+
+
+async def run_benchmark(args: Namespace) -> None:
+    """
+    Наполнение чата и замеры после каждого шага.
+
+    :param args: Аргументы командной строки.
+    :return: None.
+    """
+    seed(0)
+    step = timedelta(milliseconds=10)
+    first_time = datetime.now() - step * args.total
+    first_timestamp = Message.get_timestamp(first_time)
+    texts = [f'message {i} ' + 'lorem ipsum dolor sit amet ' * (i % 5) for i in range(1000)]
+    print(f'{"messages":>10} {"rss MiB":>10} {"disk B/msg":>11} {"raw B/msg":>10} {"blocks":>8} {"page ms":>8}')
+    with TemporaryDirectory() as directory:
+        chat = Chat(name='Common', messages=list(), actuality_period=24 * 365, max_count=args.hot, search_index=False)
+        chat.history = ChatHistory(join(directory, 'common'))
+        raw_size = 0
+        added = 0
+        for total in range(args.step, args.total + 1, args.step):
+            for i in range(added, total):
+                message = Message(first_time + step * i, f'user{i % 100}', texts[i % len(texts)])
+                raw_size += message.size
+                chat.add_message(message)
+            added = total
+            await chat.history.flush()
+            collect()
+            cold = total - args.hot
+            page = await measure_reads(chat, first_timestamp, step // timedelta(microseconds=1), cold, args.reads)
+            print(
+                f'{total:>10} {get_rss([getpid()])["rss"] / MEGABYTE:>10.1f} '
+                f'{get_directory_size(join(directory, "common")) / cold:>11.1f} {raw_size / total:>10.1f} '
+                f'{chat.history.blocks:>8} {page:>8.3f}'
+            )
+
+
+def parse_args() -> Namespace:
+    """
+    Парсинг аргументов командной строки.
+
+    :return: Аргументы командной строки.
+    """
+    parser = ArgumentParser()
+    parser.add_argument('--hot', type=int, default=10_000, help='Messages kept in memory')
+    parser.add_argument('--step', type=int, default=500_000, help='Messages added between measurements')
+    parser.add_argument('--total', type=int, default=2_000_000, help='Total messages')
+    parser.add_argument('--reads', type=int, default=200, help='Random history pages read per measurement')
+    return parser.parse_args()
+
+
+def main() -> None:
+    run(run_benchmark(parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+"""
+Микробенчмарк разбора HTTP-запросов в сравнении с протоколом на JSON.
+
+Для запросов read_chat (GET, поля в строке запроса) и send (POST, поля в JSON-теле) с типичным набором заголовков
+сравнивает процессорное время разбора запроса в RequestDto:
+
+- json - тело запроса кадрированного протокола, RequestDtoRowMapper.get_from_bytes;
+- http - HttpConnection.parse_head (один проход регулярным выражением по копии заголовка в нижнем регистре)
+  и RequestDtoRowMapper.get_from_query;
+- http-dict - разбор заголовка в словарь всех заголовков со строками в нижнем регистре
+  и RequestDtoRowMapper.get_from_query.
+
+Дополнительно выводится пиковая память Python (tracemalloc) на разбор заголовка обоими способами.
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.http_parsing
+"""
+import json
+from argparse import ArgumentParser
+from argparse import Namespace
+from time import process_time
+from tracemalloc import get_traced_memory
+from tracemalloc import reset_peak
+from tracemalloc import start
+from tracemalloc import stop
+from typing import Callable
+from typing import Dict
+from typing import Tuple
+
+from data_transfer_objects import RequestDto
+from utils import HttpConnection
+from utils import RequestDtoRowMapper
+
+HEADERS = (
+    'Host: chat.example.com\r\n'
+    'User-Agent: Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) '
+    'Chrome/120.0 Safari/537.36\r\n'
+    'Accept: application/json\r\n'
+    'Accept-Language: ru-RU,ru;q=0.9,en-US;q=0.8\r\n'
+    'Accept-Encoding: gzip, deflate, br\r\n'
+    'Connection: keep-alive\r\n'
+    'X-Forwarded-For: 10.0.0.17\r\n'
+    'X-Request-Id: 7f6c0d8e-1b2a-4c3d-9e8f-0a1b2c3d4e5f\r\n'
+)
+
+
+def build_requests() -> Dict[str, Tuple[bytes, bytes, bytes]]:
+    """
+    Запросы для замера: тело JSON-протокола, заголовок и тело HTTP-запроса.
+
+    :return: Словарь "эндпоинт - (тело JSON-протокола, заголовок HTTP, тело HTTP)".
+    """
+    text = 'Привет, как дела? ' * 4
+    send_body = json.dumps({'client_name': 'user42', 'message': text, 'recipient': ''}).encode()
+    return {
+        'read_chat': (
+            json.dumps(
+                {'endpoint': 'read_chat', 'client_name': 'user42', 'chat_name': 'Common', 'since': 120}
+            ).encode(),
+            f'GET /read_chat?client_name=user42&chat_name=Common&since=120 HTTP/1.1\r\n{HEADERS}\r\n'.encode(),
+            b''
+        ),
+        'send': (
+            json.dumps({'endpoint': 'send', 'client_name': 'user42', 'message': text, 'recipient': ''}).encode(),
+            (
+                f'POST /send HTTP/1.1\r\n{HEADERS}Content-Type: application/json\r\n'
+                f'Content-Length: {len(send_body)}\r\n\r\n'
+            ).encode(),
+            send_body
+        ),
+    }
+
+
+def parse_head_dict(head: bytes) -> Tuple[bytes, bytes, Dict[str, str]]:
+    """
+    Разбор заголовка в словарь всех заголовков.
+
+    :param head: Заголовок запроса.
+    :return: Метод, цель запроса и словарь заголовков.
+    """
+    request_line, *lines = head.decode('latin-1').split('\r\n')
+    method, target, _ = request_line.split(' ')
+    headers = dict()
+    for line in lines:
+        if line:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+    return method.encode(), target.encode(), headers
+
+
+def parse_http(endpoint: str, head: bytes, body: bytes) -> RequestDto:
+    """
+    Разбор HTTP-запроса сервером.
+
+    :param endpoint: Эндпоинт.
+    :param head: Заголовок запроса.
+    :param body: Тело запроса.
+    :return: Объект запроса.
+    """
+    request = HttpConnection.parse_head(head)
+    return RequestDtoRowMapper.get_from_query(endpoint, request.query, body)
+
+
+def parse_http_dict(endpoint: str, head: bytes, body: bytes) -> RequestDto:
+    """
+    Разбор HTTP-запроса со словарем заголовков.
+
+    :param endpoint: Эндпоинт.
+    :param head: Заголовок запроса.
+    :param body: Тело запроса.
+    :return: Объект запроса.
+    """
+    _, target, headers = parse_head_dict(head)
+    HttpConnection.choose_encoding(headers.get('accept-encoding', '').encode())
+    return RequestDtoRowMapper.get_from_query(endpoint, target.partition(b'?')[2], body)
+
+
+def measure(function: Callable[[], object], repeat: int) -> float:
+    """
+    Среднее процессорное время одного вызова в микросекундах.
+
+    :param function: Функция.
+    :param repeat: Количество повторов.
+    :return: Время одного вызова, мкс.
+    """
+    started = process_time()
+    for _ in range(repeat):
+        function()
+    return (process_time() - started) / repeat * 1_000_000
+
+
+def measure_peak(function: Callable[[], object]) -> int:
+    """
+    Пиковая память Python одного вызова.
+
+    :param function: Функция.
+    :return: Байт.
+    """
+    start()
+    try:
+        reset_peak()
+        baseline, _ = get_traced_memory()
+        function()
+        _, peak = get_traced_memory()
+    finally:
+        stop()
+    return peak - baseline
+
+
+def run_case(endpoint: str, json_body: bytes, head: bytes, body: bytes, repeat: int) -> None:
+    """
+    Замер одного запроса и вывод строки результатов.
+
+    :param endpoint: Эндпоинт.
+    :param json_body: Тело запроса JSON-протокола.
+    :param head: Заголовок HTTP-запроса.
+    :param body: Тело HTTP-запроса.
+    :param repeat: Количество повторов.
+    :return: None.
+    """
+    results = [
+        measure(lambda: RequestDtoRowMapper.get_from_bytes(json_body), repeat),
+        measure(lambda: parse_http(endpoint, head, body), repeat),
+        measure(lambda: parse_http_dict(endpoint, head, body), repeat),
+    ]
+    peaks = [measure_peak(lambda: HttpConnection.parse_head(head)), measure_peak(lambda: parse_head_dict(head))]
+    print(
+        f'{endpoint:>10} {len(head) + len(body):>6} ' + ' '.join(f'{value:>10.2f}' for value in results)
+        + ' ' + ' '.join(f'{value:>10}' for value in peaks)
+    )
+
+
+def parse_args() -> Namespace:
+    """
+    Парсинг аргументов командной строки.
+
+    :return: Аргументы командной строки.
+    """
+    parser = ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=20000, help='Parses per measurement')
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    print('CPU time per parsed request, us; peak memory of head parsing, bytes')
+    columns = ['json', 'http', 'http-dict', 'head B', 'dict B']
+    print(f'{"endpoint":>10} {"bytes":>6} ' + ' '.join(f'{column:>10}' for column in columns))
+    for endpoint, (json_body, head, body) in build_requests().items():
+        run_case(endpoint, json_body, head, body, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
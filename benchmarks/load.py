@@ -0,0 +1,436 @@
+"""
+Нагрузочный тест сервера.
+
+N пользователей одновременно выполняют запросы в заданной пропорции:
+
+- connect - повторное подключение пользователя;
+- status - запрос статуса;
+- send - сообщение в общий чат;
+- private - сообщение случайному пользователю в приватный чат;
+- read_chat - чтение общего или одного из приватных чатов пользователя.
+
+Сервер запускается в том же процессе (по умолчанию), отдельным процессом (--spawn, можно указать --workers)
+или используется уже запущенный (--port, для замера памяти - --server-pid); запущенный тестом сервер
+не ограничивает частоту отправки сообщений. Результаты - пропускная способность,
+задержки p50/p95/p99 по типам запросов, объем переданных данных и память сервера (RSS) - выводятся в консоль
+и записываются в JSON-файл для сравнения запусков между коммитами.
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.load --users 50 --duration 10 --mix status=1,send=3,private=2,read_chat=4
+"""
+from argparse import ArgumentParser
+from argparse import Namespace
+from asyncio import create_task
+from asyncio import gather
+from asyncio import open_connection
+from asyncio import run
+from asyncio import sleep
+from datetime import datetime
+from json import dumps
+from os import getpid
+from os.path import abspath
+from os.path import dirname
+from os.path import join
+from random import Random
+from socket import socket
+from subprocess import DEVNULL
+from subprocess import PIPE
+from subprocess import Popen
+from subprocess import run as run_process
+from sys import executable
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from uuid import uuid4
+
+from client import Client
+from server import Server
+from utils import Factories
+
+OPERATIONS = ['connect', 'status', 'send', 'private', 'read_chat']
+SERVER_SCRIPT = join(dirname(dirname(abspath(__file__))), 'server.py')
+
+
+def parse_mix(value: str) -> Dict[str, int]:
+    """
+    Разбор пропорции запросов вида `status=1,send=3`.
+
+    :param value: Строка пропорции.
+    :return: Веса запросов.
+    """
+    mix = dict()
+    for item in value.split(','):
+        operation, weight = item.split('=')
+        if operation not in OPERATIONS:
+            raise ValueError(f'Unknown operation {operation}, expected one of {OPERATIONS}')
+        mix[operation] = int(weight)
+    return mix
+
+
+def get_free_port() -> int:
+    """
+    Свободный локальный порт.
+
+    :return: Номер порта.
+    """
+    with socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def get_rss(pids: List[int]) -> Dict[str, int]:
+    """
+    Текущий и пиковый объем резидентной памяти процессов в байтах.
+
+    :param pids: Идентификаторы процессов.
+    :return: Суммарные rss и peak_rss.
+    """
+    result = {'rss': 0, 'peak_rss': 0}
+    for pid in pids:
+        with open(f'/proc/{pid}/status') as file:
+            for line in file:
+                if line.startswith('VmRSS:'):
+                    result['rss'] += int(line.split()[1]) * 1024
+                elif line.startswith('VmHWM:'):
+                    result['peak_rss'] += int(line.split()[1]) * 1024
+    return result
+
+
+def get_child_pids(pid: int) -> List[int]:
+    """
+    Идентификаторы дочерних процессов-шардов сервера (служебные процессы multiprocessing не учитываются).
+
+    :param pid: Идентификатор процесса.
+    :return: Список идентификаторов.
+    """
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as file:
+            children = [int(child) for child in file.read().split()]
+    except FileNotFoundError:
+        return list()
+    shards = list()
+    for child in children:
+        with open(f'/proc/{child}/cmdline', 'rb') as file:
+            if b'spawn_main' in file.read():
+                shards.append(child)
+    return shards
+
+
+def get_percentile(sorted_values: List[float], percentile: float) -> float:
+    """
+    Перцентиль по методу ближайшего ранга.
+
+    :param sorted_values: Отсортированные значения.
+    :param percentile: Перцентиль, 0-100.
+    :return: Значение перцентиля.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(percentile / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize(latencies: List[float], errors: int) -> Dict[str, Any]:
+    """
+    Сводка задержек одного типа запросов.
+
+    :param latencies: Задержки успешных запросов, с.
+    :param errors: Количество ошибок.
+    :return: Количество, ошибки и задержки в миллисекундах.
+    """
+    values = sorted(latencies)
+    return {
+        'count': len(values),
+        'errors': errors,
+        'mean_ms': round(sum(values) / len(values) * 1000, 3) if values else 0.0,
+        'p50_ms': round(get_percentile(values, 50) * 1000, 3),
+        'p95_ms': round(get_percentile(values, 95) * 1000, 3),
+        'p99_ms': round(get_percentile(values, 99) * 1000, 3),
+        'max_ms': round(values[-1] * 1000, 3) if values else 0.0,
+    }
+
+
+class LoadGenerator:
+    """
+    Генератор нагрузки: пользователи выполняют запросы в цикле до истечения времени теста.
+    """
+
+    def __init__(self, args: Namespace, host: str, port: int):
+        self._args = args
+        self._host = host
+        self._port = port
+        self._mix = parse_mix(args.mix)
+        self._names = [f'load-{uuid4().hex[:6]}-{index}' for index in range(args.users)]
+        self._clients = [
+            Client(name, host, port, persistent=not args.legacy) for name in self._names
+        ]
+        self._private_chats: Dict[frozenset, str] = dict()
+        self._user_chats: List[List[str]] = [['Common'] for _ in self._names]
+        self._latencies: Dict[str, List[float]] = {operation: list() for operation in OPERATIONS}
+        self._errors: Dict[str, int] = {operation: 0 for operation in OPERATIONS}
+        self._text = 'x' * args.message_size
+
+    @property
+    def bytes_sent(self) -> int:
+        return sum(client.bytes_sent for client in self._clients)
+
+    @property
+    def bytes_received(self) -> int:
+        return sum(client.bytes_received for client in self._clients)
+
+    async def _execute(self, operation: str, index: int, random: Random) -> None:
+        """
+        Выполнение одного запроса с замером задержки.
+
+        :param operation: Тип запроса.
+        :param index: Номер пользователя.
+        :param random: Генератор случайных чисел пользователя.
+        :return: None.
+        """
+        client = self._clients[index]
+        name = self._names[index]
+        started = perf_counter()
+        try:
+            if operation == 'connect':
+                await client.connect_user()
+            elif operation == 'status':
+                await client.get_status()
+            elif operation == 'send':
+                await client.send_message(self._text)
+            elif operation == 'private':
+                recipient_index = random.randrange(len(self._names) - 1)
+                recipient_index += recipient_index >= index
+                recipient = self._names[recipient_index]
+                members = frozenset((name, recipient))
+                if members not in self._private_chats:
+                    # Название чата задает тот, кто написал первым.
+                    self._private_chats[members] = f'{name} and {recipient}'
+                    self._user_chats[index].append(self._private_chats[members])
+                    self._user_chats[recipient_index].append(self._private_chats[members])
+                await client.send_message(self._text, recipient)
+            elif operation == 'read_chat':
+                await client.read_chat(random.choice(self._user_chats[index]))
+        except (ConnectionError, OSError):
+            self._errors[operation] += 1
+            return
+        self._latencies[operation].append(perf_counter() - started)
+
+    async def _run_user(self, index: int, deadline: float) -> None:
+        """
+        Цикл запросов одного пользователя.
+
+        :param index: Номер пользователя.
+        :param deadline: Момент окончания теста (perf_counter).
+        :return: None.
+        """
+        random = Random(self._args.seed + index)
+        operations = list(self._mix.keys())
+        weights = list(self._mix.values())
+        while perf_counter() < deadline:
+            await self._execute(random.choices(operations, weights)[0], index, random)
+
+    async def run(self) -> Dict[str, Any]:
+        """
+        Подключение пользователей и выполнение теста.
+
+        :return: Результаты теста.
+        """
+        connect_started = perf_counter()
+        await gather(*[self._execute('connect', index, Random()) for index in range(len(self._clients))])
+        connect_elapsed = perf_counter() - connect_started
+        connect_latencies, self._latencies['connect'] = self._latencies['connect'], list()
+        connect_errors, self._errors['connect'] = self._errors['connect'], 0
+
+        started = perf_counter()
+        await gather(*[
+            self._run_user(index, started + self._args.duration) for index in range(len(self._clients))
+        ])
+        elapsed = perf_counter() - started
+
+        total = [latency for operation in OPERATIONS for latency in self._latencies[operation]]
+        return {
+            'setup': {
+                'connect': summarize(connect_latencies, connect_errors),
+                'elapsed_s': round(connect_elapsed, 3),
+            },
+            'elapsed_s': round(elapsed, 3),
+            'throughput_rps': round(len(total) / elapsed, 1),
+            'operations': {
+                operation: summarize(self._latencies[operation], self._errors[operation])
+                for operation in OPERATIONS if operation in self._mix
+            },
+            'total': summarize(total, sum(self._errors.values())),
+        }
+
+    async def close(self) -> None:
+        """
+        Закрытие соединений пользователей.
+
+        :return: None.
+        """
+        await gather(*[client.close() for client in self._clients], return_exceptions=True)
+
+
+async def wait_for_server(host: str, port: int, timeout: float = 10) -> None:
+    """
+    Ожидание, пока сервер начнет принимать соединения.
+
+    :param host: Хост сервера.
+    :param port: Порт сервера.
+    :param timeout: Максимальное время ожидания, с.
+    :return: None.
+    """
+    deadline = perf_counter() + timeout
+    while True:
+        try:
+            _, writer = await open_connection(host, port)
+        except OSError:
+            if perf_counter() > deadline:
+                raise
+            await sleep(0.05)
+            continue
+        writer.close()
+        return
+
+
+def get_git_commit() -> Optional[str]:
+    """
+    Текущий коммит репозитория.
+
+    :return: Хэш коммита или None.
+    """
+    result = run_process(
+        ['git', 'rev-parse', 'HEAD'], cwd=dirname(SERVER_SCRIPT), stdout=PIPE, stderr=DEVNULL, text=True
+    )
+    return result.stdout.strip() or None
+
+
+async def run_benchmark(args: Namespace) -> Dict[str, Any]:
+    """
+    Запуск сервера (если нужно) и нагрузочного теста.
+
+    :param args: Аргументы командной строки.
+    :return: Результаты теста.
+    """
+    host = args.host
+    port = args.port or get_free_port()
+    server_pids: List[int] = list(args.server_pid)
+    server_task = None
+    server_process: Optional[Popen] = None
+    working_directory = TemporaryDirectory()
+
+    if args.spawn:
+        server_process = Popen(
+            [
+                executable, SERVER_SCRIPT, '-s', host, '-p', str(port), '-w', str(args.workers), '-l', 'WARNING',
+                '--user-send-limit', '0'
+            ],
+            cwd=working_directory.name,
+            stdout=DEVNULL,
+            stderr=DEVNULL
+        )
+    elif not args.port:
+        server = Server(
+            host=host, port=port, common_chat=Factories.get_empty_common_chat(), private_chats=dict(), users=dict(),
+            user_send_limit=None
+        )
+        server_task = create_task(server.listen())
+        server_pids = [getpid()]
+    await wait_for_server(host, port)
+    if server_process is not None:
+        await sleep(0.5)
+        server_pids = [server_process.pid, *get_child_pids(server_process.pid)]
+
+    rss_before = get_rss(server_pids) if server_pids else None
+    generator = LoadGenerator(args, host, port)
+    try:
+        result = await generator.run()
+    finally:
+        await generator.close()
+    rss_after = get_rss(server_pids) if server_pids else None
+
+    if server_task is not None:
+        server_task.cancel()
+        await gather(server_task, return_exceptions=True)
+    if server_process is not None:
+        server_process.terminate()
+        server_process.wait()
+    working_directory.cleanup()
+
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'git_commit': get_git_commit(),
+        'config': {
+            'server': 'spawn' if args.spawn else 'external' if args.port else 'in-process',
+            'workers': args.workers if args.spawn else None,
+            'users': args.users,
+            'duration_s': args.duration,
+            'mix': parse_mix(args.mix),
+            'message_size': args.message_size,
+            'legacy': args.legacy,
+            'seed': args.seed,
+        },
+        **result,
+        'bytes_sent': generator.bytes_sent,
+        'bytes_received': generator.bytes_received,
+        'server_memory': {'before': rss_before, 'after': rss_after},
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    """
+    Вывод результатов в консоль.
+
+    :param report: Результаты теста.
+    :return: None.
+    """
+    print(f'{report["config"]["users"]} users, {report["elapsed_s"]} s, {report["throughput_rps"]} requests/s')
+    columns = ['count', 'errors', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms']
+    print(f'{"operation":>10} ' + ' '.join(f'{column:>9}' for column in columns))
+    rows = {**report['operations'], 'total': report['total']}
+    for operation, summary in rows.items():
+        print(f'{operation:>10} ' + ' '.join(f'{summary[column]:>9}' for column in columns))
+    print(f'bytes sent {report["bytes_sent"]}, received {report["bytes_received"]}')
+    if report['server_memory']['after'] is not None:
+        print(f'server rss {report["server_memory"]["after"]["rss"]} bytes, '
+              f'peak {report["server_memory"]["after"]["peak_rss"]} bytes')
+
+
+def parse_args() -> Namespace:
+    """
+    Парсинг аргументов командной строки.
+
+    :return: Аргументы командной строки.
+    """
+    parser = ArgumentParser()
+    parser.add_argument('--users', type=int, default=20, help='Concurrent users')
+    parser.add_argument('--duration', type=float, default=5, help='Test duration, s')
+    parser.add_argument(
+        '--mix', type=str, default='status=1,send=3,private=2,read_chat=4', help=f'Request weights of {OPERATIONS}'
+    )
+    parser.add_argument('--message-size', type=int, default=64, help='Message length, chars')
+    parser.add_argument('--legacy', action='store_true', help='Open a new connection for every request')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Host of server')
+    parser.add_argument('--port', type=int, default=0, help='Port of already running server')
+    parser.add_argument('--server-pid', type=int, nargs='*', default=list(), help='PIDs of running server processes')
+    parser.add_argument('--spawn', action='store_true', help='Start server in a separate process')
+    parser.add_argument('--workers', type=int, default=1, help='Server worker processes for --spawn')
+    parser.add_argument('--output', type=str, default='load_results.json', help='JSON file for results')
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    report = run(run_benchmark(args))
+    print_report(report)
+    with open(args.output, 'w') as file:
+        file.write(dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
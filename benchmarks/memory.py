@@ -0,0 +1,126 @@
+"""
+Бенчмарк памяти, занимаемой хранимыми сообщениями.
+
+Сравнивает количество байт на одно сообщение в хранилище чата:
+
+- legacy - прежнее представление: объект со словарем атрибутов, время отправки datetime, имя отправителя
+  строкой в каждом сообщении, заранее посчитанный размер и список времен отправки float;
+- compact - текущее представление: Message со __slots__, отправитель - номер в таблице имен,
+  время отправки - целое число микросекунд, времена отправки хранилища - массив array('q').
+
+Учитывается память, выделенная при построении хранилища (tracemalloc), без текстов сообщений,
+которые одинаковы в обоих представлениях, и без поискового индекса (его замеряет benchmarks.search).
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.memory
+"""
+from argparse import ArgumentParser
+from argparse import Namespace
+from datetime import datetime
+from datetime import timedelta
+from tracemalloc import get_traced_memory
+from tracemalloc import start
+from tracemalloc import stop
+from typing import Callable
+from typing import List
+
+from builtin_types import Chat
+from builtin_types import Message
+
+
+class LegacyMessage:
+    """
+    Прежнее представление сообщения.
+    """
+
+    def __init__(self, sending_time: datetime, sender_name: str, text: str, seq: int = 0):
+        self._sending_time = sending_time
+        self._sender = sender_name
+        self._text = text
+        self._seq = seq
+        self._size = len(sender_name.encode()) + len(text.encode())
+
+
+class LegacyStore:
+    """
+    Прежнее хранилище: список сообщений и список времен отправки float.
+    """
+
+    def __init__(self, messages: List[LegacyMessage]):
+        self._items = list()
+        self._timestamps = list()
+        for message in messages:
+            self._items.append(message)
+            self._timestamps.append(message._sending_time.timestamp())
+
+
+def measure(build: Callable[[], object], count: int) -> float:
+    """
+    Память, удерживаемая построенным объектом, в байтах на сообщение.
+
+    :param build: Функция построения хранилища.
+    :param count: Количество сообщений.
+    :return: Байт на сообщение.
+    """
+    start()
+    retained = build()
+    current, _ = get_traced_memory()
+    stop()
+    del retained
+    return current / count
+
+
+def run_case(count: int, senders: int) -> None:
+    """
+    Замер одного количества сообщений и вывод строки результатов.
+
+    :param count: Количество хранимых сообщений.
+    :param senders: Количество различных отправителей.
+    :return: None.
+    """
+    now = datetime.now()
+    step = timedelta(minutes=30) / count
+    start_time = now - timedelta(minutes=30)
+    texts = [f'message {i}' for i in range(count)]
+
+    def build_legacy() -> LegacyStore:
+        # Имя отправителя прежде приходило из разобранного запроса, поэтому у каждого сообщения своя строка.
+        return LegacyStore([
+            LegacyMessage(start_time + step * i, ''.join(['user', str(i % senders)]), texts[i], i + 1)
+            for i in range(count)
+        ])
+
+    def build_compact() -> Chat:
+        return Chat(name='Common', actuality_period=1, search_index=False, messages=[
+            Message(start_time + step * i, ''.join(['user', str(i % senders)]), texts[i], i + 1)
+            for i in range(count)
+        ])
+
+    legacy = measure(build_legacy, count)
+    compact = measure(build_compact, count)
+    print(f'{count:>10} {legacy:>12.1f} {compact:>12.1f} {legacy / compact:>8.2f}x')
+
+
+def parse_args() -> Namespace:
+    """
+    Парсинг аргументов командной строки.
+
+    :return: Аргументы командной строки.
+    """
+    parser = ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000], help='Retained messages')
+    parser.add_argument('--senders', type=int, default=100, help='Distinct sender names')
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    print('Retained memory per message (without text), bytes')
+    print(f'{"messages":>10} {"legacy":>12} {"compact":>12} {"ratio":>9}')
+    for count in args.sizes:
+        run_case(count, args.senders)
+
+
+if __name__ == '__main__':
+    main()
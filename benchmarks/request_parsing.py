@@ -0,0 +1,145 @@
+"""
+Микробенчмарк разбора запросов.
+
+Сравнивает процессорное время разбора тела запроса в RequestDto для запросов разного размера:
+
+- legacy - прежний путь: декодирование байтов в строку, json.loads и построение RequestDto без проверок;
+- json - RequestDtoRowMapper.get_from_bytes со стандартным модулем json;
+- orjson - RequestDtoRowMapper.get_from_bytes с orjson (если установлен).
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.request_parsing
+"""
+import json
+from argparse import ArgumentParser
+from argparse import Namespace
+from time import process_time
+from typing import Any
+from typing import Callable
+from typing import Dict
+
+from data_transfer_objects import RequestDto
+from utils import RequestDtoRowMapper
+from utils import request_dto_row_mapper
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def legacy_parse(body: bytes) -> RequestDto:
+    """
+    Прежний разбор запроса.
+
+    :param body: Тело запроса.
+    :return: Объект запроса.
+    """
+    request_data = json.loads(body.decode())
+    return RequestDto(
+        client_name=request_data['client_name'],
+        endpoint=request_data['endpoint'],
+        message=request_data['message'],
+        recipient=request_data['recipient'],
+        chat_name=request_data['chat_name'],
+        since=request_data.get('since'),
+        messages=request_data.get('messages'),
+    )
+
+
+def build_request(batch_size: int) -> bytes:
+    """
+    Тело запроса: отправка одного сообщения или пакета сообщений.
+
+    :param batch_size: Количество сообщений пакета, 0 - запрос send.
+    :return: Тело запроса.
+    """
+    request: Dict[str, Any] = {
+        'client_name': 'user42',
+        'endpoint': 'send_batch' if batch_size else 'send',
+        'message': '' if batch_size else 'Привет, как дела? ' * 4,
+        'recipient': '',
+        'chat_name': '',
+        'since': None,
+        'request_id': 12345,
+    }
+    if batch_size:
+        request['messages'] = [
+            {'text': f'Сообщение номер {i} из пакета', 'recipient': 'user7' if i % 2 else ''}
+            for i in range(batch_size)
+        ]
+    return json.dumps(request).encode()
+
+
+def measure(function: Callable[[bytes], object], body: bytes, repeat: int) -> float:
+    """
+    Среднее процессорное время одного разбора в микросекундах.
+
+    :param function: Функция разбора.
+    :param body: Тело запроса.
+    :param repeat: Количество повторов.
+    :return: Время одного разбора, мкс.
+    """
+    started = process_time()
+    for _ in range(repeat):
+        function(body)
+    return (process_time() - started) / repeat * 1_000_000
+
+
+def measure_mapper(loads: Callable[[bytes], Any], body: bytes, repeat: int) -> float:
+    """
+    Среднее процессорное время разбора RequestDtoRowMapper с заданной функцией разбора JSON.
+
+    :param loads: Функция разбора JSON.
+    :param body: Тело запроса.
+    :param repeat: Количество повторов.
+    :return: Время одного разбора, мкс.
+    """
+    backend = request_dto_row_mapper.loads
+    request_dto_row_mapper.loads = loads
+    try:
+        return measure(RequestDtoRowMapper.get_from_bytes, body, repeat)
+    finally:
+        request_dto_row_mapper.loads = backend
+
+
+def run_case(batch_size: int, repeat: int) -> None:
+    """
+    Замер одного размера запроса и вывод строки результатов.
+
+    :param batch_size: Количество сообщений пакета, 0 - запрос send.
+    :param repeat: Количество повторов.
+    :return: None.
+    """
+    body = build_request(batch_size)
+    results = [
+        measure(legacy_parse, body, repeat),
+        measure_mapper(json.loads, body, repeat),
+        measure_mapper(orjson.loads, body, repeat) if orjson is not None else float('nan'),
+    ]
+    print(f'{batch_size:>6} {len(body):>9} ' + ' '.join(f'{value:>10.2f}' for value in results))
+
+
+def parse_args() -> Namespace:
+    """
+    Парсинг аргументов командной строки.
+
+    :return: Аргументы командной строки.
+    """
+    parser = ArgumentParser()
+    parser.add_argument('--batches', type=int, nargs='+', default=[0, 10, 100, 1000], help='Batch sizes, 0 - send')
+    parser.add_argument('--repeat', type=int, default=2000, help='Parses per measurement')
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    print('CPU time per parsed request, us')
+    print(f'{"batch":>6} {"bytes":>9} ' + ' '.join(f'{column:>10}' for column in ['legacy', 'json', 'orjson']))
+    for batch_size in args.batches:
+        run_case(batch_size, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""
+Бенчмарк поиска по сообщениям чата.
+
+Строит хранилище сообщений с поисковым индексом и замеряет:
+
+- память индекса в байтах на сообщение (tracemalloc, без самих сообщений);
+- время индексации одного сообщения;
+- задержку поиска первой страницы (20 сообщений) для запросов разного вида: редкое слово, частое слово,
+  два слова, префикс, частое слово с фильтром по отправителю и с интервалом времени.
+
+Тексты сообщений - 8 слов из словаря с распределением Ципфа, как в естественном языке.
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.search
+"""
+from argparse import ArgumentParser
+from argparse import Namespace
+from datetime import datetime
+from datetime import timedelta
+from random import Random
+from statistics import median
+from time import perf_counter
+from tracemalloc import get_traced_memory
+from tracemalloc import start
+from tracemalloc import stop
+from typing import Callable
+from typing import Dict
+from typing import List
+
+from builtin_types import Message
+from builtin_types import MessageStore
+from builtin_types import SearchIndex
+from builtin_types import SearchQuery
+
+PAGE_SIZE = 20
+
+
+def build_messages(count: int, vocabulary: int, senders: int, words: int) -> List[Message]:
+    """
+    Создание сообщений, равномерно распределенных по последним 30 минутам.
+
+    :param count: Количество сообщений.
+    :param vocabulary: Размер словаря.
+    :param senders: Количество отправителей.
+    :param words: Количество слов в сообщении.
+    :return: Список сообщений.
+    """
+    random = Random(42)
+    terms = [f'w{rank}' for rank in range(vocabulary)]
+    weights = [1 / (rank + 1) for rank in range(vocabulary)]
+    sampled = random.choices(terms, weights, k=count * words)
+    start_time = datetime.now() - timedelta(minutes=30)
+    step = timedelta(minutes=30) / count
+    return [
+        Message(start_time + step * i, f'user{i % senders}', ' '.join(sampled[i * words:(i + 1) * words]), i + 1)
+        for i in range(count)
+    ]
+
+
+def measure_index(messages: List[Message]) -> Dict[str, float]:
+    """
+    Память и время построения индекса.
+
+    :param messages: Сообщения.
+    :return: Байт на сообщение и микросекунд на сообщение.
+    """
+    start()
+    started = perf_counter()
+    index = SearchIndex()
+    for message in messages:
+        index.add(message.seq, message.text)
+    elapsed = perf_counter() - started
+    current, _ = get_traced_memory()
+    stop()
+    del index
+    return {'bytes': current / len(messages), 'add_us': elapsed / len(messages) * 1_000_000}
+
+
+def measure_query(search: Callable[[], object], repeat: int) -> Dict[str, float]:
+    """
+    Задержка поиска.
+
+    :param search: Функция поиска.
+    :param repeat: Количество повторов.
+    :return: Медиана и максимум, мс.
+    """
+    latencies = list()
+    for _ in range(repeat):
+        started = perf_counter()
+        search()
+        latencies.append((perf_counter() - started) * 1000)
+    return {'p50': median(latencies), 'max': max(latencies)}
+
+
+def run_case(count: int, args: Namespace) -> None:
+    """
+    Замер одного количества сообщений и вывод результатов.
+
+    :param count: Количество хранимых сообщений.
+    :param args: Аргументы командной строки.
+    :return: None.
+    """
+    messages = build_messages(count, args.vocabulary, args.senders, args.words)
+    index_stats = measure_index(messages)
+    store = MessageStore(messages=messages, last_seq=count, search_index=True)
+    recent = Message.get_timestamp(datetime.now() - timedelta(minutes=3))
+    queries = {
+        'rare_term': SearchQuery.parse(f'w{args.vocabulary - 1}'),
+        'common_term': SearchQuery.parse('w0'),
+        'two_terms': SearchQuery.parse('w10 w1000'),
+        'prefix': SearchQuery.parse('w123*'),
+        'sender': SearchQuery.parse('w0', sender='user7'),
+        'time_range': SearchQuery.parse('w5', start=recent),
+    }
+    print(
+        f'messages: {count}, index: {index_stats["bytes"]:.1f} bytes/message, '
+        f'{index_stats["add_us"]:.2f} us/message'
+    )
+    print(f'{"query":>12} {"found":>8} {"p50, ms":>9} {"max, ms":>9}')
+    for name, query in queries.items():
+        found = len(store.search(query, count))
+        latency = measure_query(lambda: store.search(query, PAGE_SIZE), args.repeat)
+        print(f'{name:>12} {found:>8} {latency["p50"]:>9.3f} {latency["max"]:>9.3f}')
+
+
+def parse_args() -> Namespace:
+    """
+    Парсинг аргументов командной строки.
+
+    :return: Аргументы командной строки.
+    """
+    parser = ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100_000, 1_000_000], help='Retained messages')
+    parser.add_argument('--vocabulary', type=int, default=50_000, help='Distinct words')
+    parser.add_argument('--words', type=int, default=8, help='Words per message')
+    parser.add_argument('--senders', type=int, default=100, help='Distinct sender names')
+    parser.add_argument('--repeat', type=int, default=20, help='Searches per query')
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    for count in args.sizes:
+        run_case(count, args)
+
+
+if __name__ == '__main__':
+    main()
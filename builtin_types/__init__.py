@@ -1,4 +1,12 @@
 from .chat import Chat
-from .list_async_iterator import ListAsyncIterator
+from .chat_history import ChatHistory
+from .encoded_text import EncodedText
 from .message import Message
+from .message_store import MessageStore
+from .message_store import MessagesView
+from .names import Names
+from .scheduled_message import ScheduledMessage
+from .search_index import SearchIndex
+from .search_index import SearchQuery
+from .status_view import StatusView
 from .user import User
@@ -1,82 +1,325 @@
 from datetime import datetime
 from datetime import timedelta
+from itertools import islice
+from sys import intern
 from typing import Any
 from typing import Dict
 from typing import List
 from typing import Optional
+from typing import Tuple
 
+from settings import CHAT_MESSAGES_MAX_BYTES
+from settings import CHAT_MESSAGES_MAX_COUNT
+from settings import HISTORY_PAGE_SIZE
+from settings import SEARCH_INDEX_ENABLED
 from settings import SHARED_CHAT_MESSAGES_LIMIT
-from .list_async_iterator import ListAsyncIterator
+from .chat_history import ChatHistory
 from .message import Message
+from .message_store import MessageStore
+from .message_store import MessagesView
+from .search_index import SearchQuery
 
 
 class Chat:
     """
     Класс чата.
+
+    У приватного чата хранятся его участники в порядке, образующем название; у общего чата их нет.
+    Сообщения в памяти - горячее окно: период актуальности и ограничения по количеству и объему. Если к чату
+    подключена холодная история, вышедшие из окна сообщения переносятся в нее, а не удаляются.
     """
 
-    def __init__(self, name: str, messages: List[Message], actuality_period: int):
-        self._name = name
-        self._messages = messages
+    __slots__ = (
+        '_name', '_members', '_actuality_period', '_last_seq', '_max_count', '_max_bytes', '_messages_source',
+        '_message_store', '_search_index', '_history'
+    )
+
+    def __init__(
+        self,
+        name: str,
+        messages: List[Message],
+        actuality_period: int,
+        last_seq: int = 0,
+        max_count: Optional[int] = CHAT_MESSAGES_MAX_COUNT,
+        max_bytes: Optional[int] = CHAT_MESSAGES_MAX_BYTES,
+        messages_source: Optional[Any] = None,
+        members: Optional[List[str]] = None,
+        search_index: bool = SEARCH_INDEX_ENABLED
+    ):
+        self._name = intern(name)
+        self._members = members
         self._actuality_period = timedelta(hours=actuality_period)
+        self._last_seq = last_seq
+        self._max_count = max_count
+        self._max_bytes = max_bytes
+        self._messages_source = messages_source
+        self._search_index = search_index
+        self._history: Optional[ChatHistory] = None
+        self._message_store: Optional[MessageStore] = None
+        if messages_source is None:
+            self._message_store = MessageStore(
+                messages=messages, last_seq=last_seq, max_count=max_count, max_bytes=max_bytes,
+                search_index=search_index
+            )
 
     @property
     def name(self) -> str:
         return self._name
 
-    async def get_messages(self, user_registration_datetime: Optional[datetime] = None) -> List[Message]:
+    @property
+    def members(self) -> Optional[List[str]]:
+        return self._members
+
+    @members.setter
+    def members(self, value: Optional[List[str]]) -> None:
+        self._members = value
+
+    @property
+    def history(self) -> Optional[ChatHistory]:
+        return self._history
+
+    @history.setter
+    def history(self, value: Optional[ChatHistory]) -> None:
+        self._history = value
+        if self._message_store is not None:
+            self._message_store.history = value
+
+    @property
+    def _store(self) -> MessageStore:
         """
-        Возвращает список сообщений.
+        Хранилище сообщений; при отложенной загрузке сообщения читаются из источника при первом обращении.
 
-        :param user_registration_datetime: Время регистрации пользователя.
-        :return: Список сообщений чата.
+        Если подключена холодная история, загружаются и устаревшие сообщения: они сразу переносятся в историю.
+        """
+        if self._message_store is None:
+            self._message_store = MessageStore(
+                messages=self._messages_source.load(  # type: ignore
+                    None if self._history is not None else self._actuality_period
+                ),
+                last_seq=self._last_seq,
+                max_count=self._max_count,
+                max_bytes=self._max_bytes,
+                search_index=self._search_index,
+                history=self._history
+            )
+            self._messages_source = None
+            if self._history is not None:
+                self._message_store.expire(datetime.now() - self._actuality_period)
+        return self._message_store
+
+    @property
+    def first_seq(self) -> int:
+        return self._store.first_seq
+
+    @property
+    def messages_count(self) -> Optional[int]:
+        if self._message_store is None:
+            return None
+        return len(self._message_store)
+
+    @property
+    def messages_size(self) -> Optional[int]:
+        if self._message_store is None:
+            return None
+        return self._message_store.size
+
+    @property
+    def last_seq(self) -> int:
+        if self._message_store is None:
+            return self._last_seq
+        return self._message_store.last_seq
+
+    def _get_window_start(self, user_registration_datetime: Optional[datetime]) -> int:
+        """
+        Индекс первого хранимого сообщения, доступного пользователю: последние SHARED_CHAT_MESSAGES_LIMIT
+        сообщений до регистрации и все сообщения после нее; граница находится бинарным поиском.
+
+        :param user_registration_datetime: Время регистрации пользователя; если не указано, доступны все сообщения.
+        :return: Индекс сообщения.
         """
         if not user_registration_datetime:
-            return self._messages
-        else:
-            messages_indexes_iterator = ListAsyncIterator(list(range(len(self._messages))))
-            before_registration_message_index = 0
-            async for i in messages_indexes_iterator:
-                if self._messages[i].sending_time < user_registration_datetime:
-                    before_registration_message_index += 1
-                else:
-                    break
-            if before_registration_message_index > SHARED_CHAT_MESSAGES_LIMIT - 1:
-                return self._messages[before_registration_message_index - SHARED_CHAT_MESSAGES_LIMIT:]
-            else:
-                return self._messages
-
-    async def add_message(self, message: Message, user_registration_datetime: Optional[datetime] = None) -> List[
-        Message]:
+            return 0
+        return max(self._store.index_before(user_registration_datetime) - SHARED_CHAT_MESSAGES_LIMIT, 0)
+
+    def get_messages(
+        self, user_registration_datetime: Optional[datetime] = None, since: int = 0
+    ) -> MessagesView:
+        """
+        Возвращает сообщения чата.
+
+        Если указано время регистрации пользователя, возвращаются последние SHARED_CHAT_MESSAGES_LIMIT
+        сообщений до регистрации и все сообщения после нее; граница находится бинарным поиском.
+
+        :param user_registration_datetime: Время регистрации пользователя.
+        :param since: Порядковый номер сообщения, после которого нужно вернуть сообщения.
+        :return: Представление сообщений чата.
+        """
+        start = self._get_window_start(user_registration_datetime)
+        return self._store.view(max(start, self._store.index_after(since)))
+
+    async def _get_history_start(self, since: int, start: Optional[int]) -> int:
+        """
+        Номер первого сообщения страницы истории.
+
+        :param since: Номер сообщения, после которого нужно вернуть сообщения.
+        :param start: Наиболее ранний момент отправки, микросекунды epoch.
+        :return: Номер сообщения.
+        """
+        first_seq = since + 1
+        if start is None:
+            return first_seq
+        hot_first_seq = self._store.first_seq
+        first_timestamp = self._store.first_timestamp
+        if self._history is not None and (first_timestamp is None or start < first_timestamp):
+            history_seq = await self._history.find_seq(start)
+            return max(first_seq, hot_first_seq if history_seq is None else history_seq)
+        return max(first_seq, hot_first_seq + self._store.index_from(start))
+
+    async def _get_history_window_start(self, user_registration_datetime: datetime) -> int:
+        """
+        Номер первого сообщения истории, доступного пользователю: последние SHARED_CHAT_MESSAGES_LIMIT сообщений
+        до регистрации и все сообщения после нее, как в get_messages.
+
+        Если пользователь зарегистрирован раньше первого сообщения в памяти, граница находится по разреженному
+        индексу холодной истории.
+
+        :param user_registration_datetime: Время регистрации пользователя.
+        :return: Номер сообщения.
+        """
+        timestamp = Message.get_timestamp(user_registration_datetime)
+        first_timestamp = self._store.first_timestamp
+        if self._history is None or (first_timestamp is not None and timestamp > first_timestamp):
+            return self._store.first_seq + self._get_window_start(user_registration_datetime)
+        history_seq = await self._history.find_seq(timestamp)
+        seq = self._store.first_seq if history_seq is None else history_seq
+        return max(seq - SHARED_CHAT_MESSAGES_LIMIT, 0)
+
+    async def get_history(
+        self,
+        since: int = 0,
+        start: Optional[int] = None,
+        count: int = HISTORY_PAGE_SIZE,
+        user_registration_datetime: Optional[datetime] = None
+    ) -> List[Message]:
+        """
+        Страница истории чата, включая сообщения, вышедшие из горячего окна.
+
+        Сообщения старше горячего окна читаются из холодной истории (файлы - в пуле потоков), остальные -
+        из памяти. Если указано время регистрации пользователя, страница ограничивается сообщениями, которые
+        он может прочитать.
+
+        :param since: Номер сообщения, после которого нужно вернуть сообщения.
+        :param start: Наиболее ранний момент отправки, микросекунды epoch.
+        :param count: Наибольшее количество сообщений.
+        :param user_registration_datetime: Время регистрации пользователя.
+        :return: Сообщения в порядке номеров.
+        """
+        first_seq = await self._get_history_start(since, start)
+        if user_registration_datetime:
+            first_seq = max(first_seq, await self._get_history_window_start(user_registration_datetime))
+        messages: List[Message] = list()
+        # Пока история читается с диска, из горячего окна в нее могут перейти следующие сообщения.
+        while self._history is not None and first_seq < self._store.first_seq and len(messages) < count:
+            page = await self._history.read(first_seq, count - len(messages))
+            if not page:
+                break
+            messages.extend(page)
+            first_seq = page[-1].seq + 1
+        if len(messages) < count:
+            messages.extend(islice(self._store.iter_range(first_seq, self._store.last_seq), count - len(messages)))
+        return messages
+
+    def add_message(
+        self, message: Message, user_registration_datetime: Optional[datetime] = None, since: int = 0
+    ) -> MessagesView:
         """
         Добавление сообщения в чат.
 
         :param message: Объект сообщения.
         :param user_registration_datetime: Время регистрации пользователя.
-        :return: Список сообщений.
+        :param since: Порядковый номер сообщения, после которого нужно вернуть сообщения.
+        :return: Представление сообщений чата.
+        """
+        self._store.append(message)
+        return self.get_messages(user_registration_datetime, since)
+
+    def add_replica_message(self, message: Message) -> bool:
+        """
+        Добавление сообщения, номер которого назначен владельцем чата в другом процессе.
+
+        :param message: Объект сообщения.
+        :return: True, если сообщение добавлено, False - если оно уже есть в чате.
+        """
+        return self._store.append_replica(message)
+
+    def search(
+        self, query: SearchQuery, count: int, user_registration_datetime: Optional[datetime] = None
+    ) -> List[Tuple[int, Message]]:
+        """
+        Поиск сообщений чата по индексу, который обновляется при добавлении и удалении сообщений.
+
+        Если указано время регистрации пользователя, поиск ограничивается сообщениями, которые он может прочитать
+        (как в get_messages).
+
+        :param query: Поисковый запрос.
+        :param count: Наибольшее количество сообщений.
+        :param user_registration_datetime: Время регистрации пользователя.
+        :return: Пары (количество совпавших слов запроса, сообщение) по убыванию релевантности.
+        """
+        first_seq = self._store.first_seq + self._get_window_start(user_registration_datetime)
+        return self._store.search(query, count, first_seq)
+
+    def get_expiry_deadline(self) -> Optional[int]:
+        """
+        Момент, когда устареет самое старое сообщение чата; сообщения не загруженного чата не загружаются.
+
+        :return: Микросекунды epoch или None, если в чате нет загруженных сообщений.
+        """
+        if self._message_store is None:
+            return None
+        first_timestamp = self._message_store.first_timestamp
+        if first_timestamp is None:
+            return None
+        return first_timestamp + self._actuality_period // timedelta(microseconds=1)
+
+    def actualize(self, limit: Optional[int] = None) -> int:
+        """
+        Актуализация списка сообщений; удаленные сообщения удаляются и из поискового индекса.
+
+        :param limit: Наибольшее количество удаляемых за вызов сообщений.
+        :return: Количество удаленных устаревших сообщений.
         """
-        self._messages.append(message)
-        return await self.get_messages(user_registration_datetime)
+        return self._store.expire(datetime.now() - self._actuality_period, limit)
 
-    async def actualize(self) -> None:
+    def expire_through(self, seq: int) -> int:
         """
-        Актуализация списка сообщений.
+        Удаление сообщений с порядковым номером не больше заданного (при восстановлении из журнала).
 
-        :return: None.
+        :param seq: Номер последнего удаляемого сообщения.
+        :return: Количество удаленных сообщений.
         """
-        messages_iterator = ListAsyncIterator(self._messages)
-        self._messages = [
-            msg async for msg in messages_iterator if msg.sending_time > datetime.now() - self._actuality_period
-        ]
+        return self._store.expire_through(seq)
 
     def to_dict(self) -> Dict[str, Any]:
         """
         Получение информации о чате в формате словаря.
 
+        Если сообщения чата еще не загружены, вместо них возвращается их источник.
+
         :return: Словарь с информацией о чате.
         """
+        if self._messages_source is not None:
+            return {
+                'name': self.name,
+                'members': self._members,
+                'messages_source': self._messages_source,
+                'actuality_period': self._actuality_period.total_seconds(),
+                'last_seq': self._last_seq
+            }
         return {
             'name': self.name,
-            'messages': [message.to_dict() for message in self._messages],
-            'actuality_period': self._actuality_period.total_seconds()
+            'members': self._members,
+            'messages': [message.to_dict() for message in self._store],
+            'actuality_period': self._actuality_period.total_seconds(),
+            'last_seq': self._store.last_seq
         }
@@ -0,0 +1,455 @@
+from array import array
+from asyncio import Future
+from asyncio import Lock
+from asyncio import Task
+from asyncio import get_running_loop
+from bisect import bisect_left
+from bisect import bisect_right
+from hashlib import sha1
+from json import dumps
+from json import loads
+from mmap import ACCESS_READ
+from mmap import mmap
+from os import fsync
+from os import listdir
+from os import makedirs
+from os.path import exists
+from os.path import getsize
+from os.path import join
+from struct import Struct
+from threading import Lock as ThreadLock
+from typing import List
+from typing import Optional
+from typing import Set
+from typing import Tuple
+from zlib import compress
+from zlib import decompress
+
+from settings import HISTORY_BLOCK_MESSAGES
+from settings import HISTORY_SEGMENT_SIZE
+from .message import Message
+
+# Запись разреженного индекса: номер и время отправки первого сообщения блока, смещение блока в сегменте,
+# длина сжатого блока и количество сообщений в нем.
+INDEX_RECORD = Struct('>qqqII')
+SEGMENT_SUFFIX = '.seg'
+INDEX_SUFFIX = '.idx'
+
+# Блок в индексе: номер и время отправки первого сообщения, сегмент, смещение, длина и количество сообщений.
+BlockRecord = Tuple[int, int, int, int, int, int]
+# Расположение блока на диске: сегмент, смещение и длина.
+BlockLocation = Tuple[int, int, int]
+
+
+class ChatHistory:
+    """
+    Холодная история чата: сообщения, вышедшие из горячего окна в памяти, в сегментных файлах на диске.
+
+    Сообщения дописываются блоками по block_size штук с номерами подряд. Блок - строки
+    `<время отправки, микросекунды epoch> <номер> <JSON [отправитель, текст, вложение]>`, сжатые zlib; блоки
+    пишутся в конец сегмента `<номер первого сообщения сегмента>.seg`, а по достижении сегментом segment_size байт
+    начинается новый сегмент. На каждый блок в файл `<номер первого сообщения сегмента>.idx` дописывается запись
+    разреженного индекса по номерам и времени отправки.
+
+    В памяти хранятся только массивы разреженного индекса (одна запись на блок) и еще не записанные сообщения,
+    поэтому память не растет вместе с историей. Чтение индекса, сжатие и запись блоков, чтение и распаковка
+    блоков выполняются в пуле потоков, поэтому цикл событий не блокируется на диске; заполненные блоки
+    записываются фоновой задачей. Уже записанные номера пропускаются, поэтому повторный перенос сообщений
+    при восстановлении из журнала не создает дубликатов.
+    """
+
+    def __init__(
+        self, path: str, block_size: int = HISTORY_BLOCK_MESSAGES, segment_size: int = HISTORY_SEGMENT_SIZE
+    ):
+        self._path = path
+        self._block_size = block_size
+        self._segment_size = segment_size
+        self._loaded = False
+        self._loading: Optional[Future] = None
+        self._seqs = array('q')
+        self._timestamps = array('q')
+        self._segments = array('q')
+        self._offsets = array('q')
+        self._lengths = array('q')
+        self._counts = array('q')
+        self._last_seq = 0
+        self._pending: List[Message] = list()
+        self._writing: List[Message] = list()
+        self._write_task: Optional[Task] = None
+        self._flush_lock: Optional[Lock] = None
+        # Состояние файлов меняется только под этой блокировкой: записью в пуле потоков или синхронной
+        # записью при остановке сервера.
+        self._file_lock = ThreadLock()
+        self._opened = False
+        self._segment = 0
+        self._segment_end = 0
+        self._written_seq = 0
+        self._dirty: Set[str] = set()
+
+    @staticmethod
+    def get_path(root: str, chat_name: str, members: Optional[List[str]] = None) -> str:
+        """
+        Каталог истории чата: названия и имена могут содержать любые символы, поэтому каталог называется хэшем.
+
+        Каталог приватного чата определяется парой участников, а не названием: названия чатов разных пар
+        могут совпадать. Без участников (общий чат, прежний формат) каталог определяется названием.
+
+        :param root: Каталог истории всех чатов.
+        :param chat_name: Название чата.
+        :param members: Участники приватного чата.
+        :return: Путь к каталогу истории чата.
+        """
+        key = '\0'.join(sorted(members)) if members else chat_name
+        return join(root, sha1(key.encode()).hexdigest())
+
+    @property
+    def blocks(self) -> int:
+        return len(self._seqs)
+
+    def _get_file_path(self, segment: int, suffix: str) -> str:
+        """
+        Путь к файлу сегмента или его индекса.
+
+        :param segment: Номер первого сообщения сегмента.
+        :param suffix: Расширение файла.
+        :return: Путь к файлу.
+        """
+        return join(self._path, f'{segment}{suffix}')
+
+    def _read_index(self) -> List[BlockRecord]:
+        """
+        Чтение разреженного индекса с диска (в пуле потоков).
+
+        Недописанная при сбое последняя запись индекса и записи блоков за концом сегмента отбрасываются.
+
+        :return: Записи блоков в порядке номеров.
+        """
+        with self._file_lock:
+            records: List[BlockRecord] = list()
+            if not exists(self._path):
+                self._opened = True
+                return records
+            last_seq = 0
+            segment_end = 0
+            segments = sorted(
+                int(name[:-len(INDEX_SUFFIX)]) for name in listdir(self._path) if name.endswith(INDEX_SUFFIX)
+            )
+            for segment in segments:
+                segment_path = self._get_file_path(segment, SEGMENT_SUFFIX)
+                segment_end = getsize(segment_path) if exists(segment_path) else 0
+                with open(self._get_file_path(segment, INDEX_SUFFIX), 'rb') as file:
+                    data = file.read()
+                for first_seq, timestamp, offset, length, count in INDEX_RECORD.iter_unpack(
+                    data[:len(data) - len(data) % INDEX_RECORD.size]
+                ):
+                    if offset + length > segment_end or first_seq <= last_seq:
+                        continue
+                    records.append((first_seq, timestamp, segment, offset, length, count))
+                    last_seq = first_seq + count - 1
+            if not self._opened:
+                self._opened = True
+                self._segment = records[-1][2] if records else 0
+                self._segment_end = segment_end
+                self._written_seq = last_seq
+            return records
+
+    def _add_records(self, records: List[BlockRecord]) -> None:
+        """
+        Добавление записей блоков в индекс в памяти.
+
+        :param records: Записи блоков в порядке номеров.
+        :return: None.
+        """
+        for first_seq, timestamp, segment, offset, length, count in records:
+            self._seqs.append(first_seq)
+            self._timestamps.append(timestamp)
+            self._segments.append(segment)
+            self._offsets.append(offset)
+            self._lengths.append(length)
+            self._counts.append(count)
+
+    async def load(self) -> None:
+        """
+        Чтение разреженного индекса в пуле потоков при первом обращении к истории.
+
+        :return: None.
+        """
+        if self._loaded:
+            return
+        if self._loading is None:
+            self._loading = get_running_loop().run_in_executor(None, self._read_index)
+        records = await self._loading
+        if not self._loaded:
+            self._loaded = True
+            self._add_records(records)
+
+    @property
+    def _disk_last_seq(self) -> int:
+        """
+        Номер последнего сообщения, записанного на диск и учтенного в индексе в памяти.
+        """
+        if not self._seqs:
+            return 0
+        return self._seqs[-1] + self._counts[-1] - 1
+
+    def append(self, message: Message) -> None:
+        """
+        Перенос сообщения, вышедшего из горячего окна, в историю без обращения к диску.
+
+        Когда набирается полный блок, запускается фоновая запись.
+
+        :param message: Объект сообщения.
+        :return: None.
+        """
+        if message.seq <= self._last_seq:
+            return
+        self._pending.append(message)
+        self._last_seq = message.seq
+        if len(self._pending) >= self._block_size:
+            self._start_write()
+
+    def _start_write(self) -> None:
+        """
+        Запуск фоновой записи заполненных блоков, если она еще не запущена.
+
+        Без цикла событий (восстановление до запуска сервера) блоки остаются в памяти до записи.
+
+        :return: None.
+        """
+        if self._write_task is not None and not self._write_task.done():
+            return
+        try:
+            loop = get_running_loop()
+        except RuntimeError:
+            return
+        self._write_task = loop.create_task(self.flush())
+
+    def _split_blocks(self, messages: List[Message]) -> List[List[Message]]:
+        """
+        Разбиение сообщений на блоки не больше block_size сообщений с номерами подряд.
+
+        :param messages: Сообщения в порядке номеров.
+        :return: Блоки.
+        """
+        blocks: List[List[Message]] = list()
+        for message in messages:
+            if not blocks or len(blocks[-1]) >= self._block_size or message.seq != blocks[-1][-1].seq + 1:
+                blocks.append(list())
+            blocks[-1].append(message)
+        return blocks
+
+    @staticmethod
+    def _encode(message: Message) -> bytes:
+        """
+        Кодирование сообщения в строку блока.
+
+        :param message: Объект сообщения.
+        :return: Строка сообщения.
+        """
+        fields = [message.sender, message.text]
+        if message.attachment is not None:
+            fields.append(message.attachment)
+        return f'{message.timestamp} {message.seq} '.encode() + dumps(fields).encode()
+
+    @staticmethod
+    def _decode(line: bytes) -> Message:
+        """
+        Разбор строки блока.
+
+        :param line: Строка сообщения.
+        :return: Объект сообщения.
+        """
+        time_end = line.index(b' ')
+        seq_end = line.index(b' ', time_end + 1)
+        sender_name, text, *attachment = loads(line[seq_end + 1:])
+        return Message.from_timestamp(
+            timestamp=int(line[:time_end]),
+            sender_name=sender_name,
+            text=text,
+            seq=int(line[time_end + 1:seq_end]),
+            attachment=attachment[0] if attachment else None
+        )
+
+    def _write_blocks(self, blocks: List[List[Message]]) -> List[BlockRecord]:
+        """
+        Сжатие и запись блоков в конец текущего сегмента и их записей в индекс (в пуле потоков).
+
+        Сообщения, уже записанные на диск, пропускаются.
+
+        :param blocks: Блоки сообщений с номерами подряд.
+        :return: Записи записанных блоков.
+        """
+        records: List[BlockRecord] = list()
+        with self._file_lock:
+            for messages in blocks:
+                messages = [message for message in messages if message.seq > self._written_seq]
+                if not messages:
+                    continue
+                block = compress(b'\n'.join(map(self._encode, messages)))
+                first = messages[0]
+                if not self._segment or (self._segment_end and self._segment_end + len(block) > self._segment_size):
+                    self._segment = first.seq
+                makedirs(self._path, exist_ok=True)
+                segment_path = self._get_file_path(self._segment, SEGMENT_SUFFIX)
+                index_path = self._get_file_path(self._segment, INDEX_SUFFIX)
+                with open(segment_path, 'ab') as file:
+                    offset = file.tell()
+                    file.write(block)
+                with open(index_path, 'ab') as file:
+                    file.write(INDEX_RECORD.pack(first.seq, first.timestamp, offset, len(block), len(messages)))
+                self._dirty.update((segment_path, index_path))
+                self._segment_end = offset + len(block)
+                self._written_seq = messages[-1].seq
+                records.append((first.seq, first.timestamp, self._segment, offset, len(block), len(messages)))
+        return records
+
+    def _sync_files(self) -> None:
+        """
+        fsync файлов, измененных после предыдущей синхронизации (в пуле потоков).
+
+        :return: None.
+        """
+        with self._file_lock:
+            for path in self._dirty:
+                with open(path, 'rb') as file:
+                    fsync(file.fileno())
+            self._dirty.clear()
+
+    def _take_blocks(self, complete_only: bool) -> List[List[Message]]:
+        """
+        Извлечение из памяти блоков для записи.
+
+        :param complete_only: Оставить в памяти последний неполный блок.
+        :return: Блоки сообщений.
+        """
+        blocks = self._split_blocks(self._pending)
+        if complete_only and blocks and len(blocks[-1]) < self._block_size:
+            self._pending = blocks.pop()
+        else:
+            self._pending = list()
+        return blocks
+
+    async def flush(self, durable: bool = False) -> None:
+        """
+        Запись заполненных блоков в пуле потоков; записи выполняются по очереди, чтобы блоки попадали
+        в сегмент в порядке номеров.
+
+        :param durable: Записать и недописанный блок, затем выполнить fsync измененных файлов (перед записью
+            снимка, из которого сообщения истории уже исключены).
+        :return: None.
+        """
+        if not self._pending and not self._writing and not (durable and self._dirty):
+            return
+        if self._flush_lock is None:
+            self._flush_lock = Lock()
+        async with self._flush_lock:
+            await self.load()
+            loop = get_running_loop()
+            blocks = self._take_blocks(complete_only=not durable)
+            while blocks:
+                self._writing = [message for messages in blocks for message in messages]
+                try:
+                    self._add_records(await loop.run_in_executor(None, self._write_blocks, blocks))
+                finally:
+                    self._writing = list()
+                blocks = self._take_blocks(complete_only=True) if not durable else list()
+            if durable:
+                await loop.run_in_executor(None, self._sync_files)
+
+    def sync(self) -> None:
+        """
+        Синхронная запись всех еще не записанных сообщений и fsync измененных файлов (при остановке сервера,
+        когда цикл событий уже не обслуживает запросы).
+
+        :return: None.
+        """
+        if not self._loaded:
+            self._loaded = True
+            self._add_records(self._read_index())
+        self._add_records(self._write_blocks(self._split_blocks(self._writing + self._pending)))
+        self._pending = list()
+        self._sync_files()
+
+    def _read_blocks(self, locations: List[BlockLocation]) -> List[bytes]:
+        """
+        Чтение и распаковка блоков через mmap сегментов (в пуле потоков).
+
+        :param locations: Расположение блоков.
+        :return: Распакованные блоки.
+        """
+        blocks = list()
+        for segment_number, offset, length in locations:
+            with open(self._get_file_path(segment_number, SEGMENT_SUFFIX), 'rb') as file:
+                with mmap(file.fileno(), 0, access=ACCESS_READ) as segment:
+                    blocks.append(decompress(segment[offset:offset + length]))
+        return blocks
+
+    async def _load_blocks(self, blocks: List[int]) -> List[Message]:
+        """
+        Сообщения блоков индекса: файлы читаются в пуле потоков, строки разбираются в цикле событий.
+
+        :param blocks: Номера блоков в индексе.
+        :return: Сообщения блоков.
+        """
+        locations = [(self._segments[block], self._offsets[block], self._lengths[block]) for block in blocks]
+        data = await get_running_loop().run_in_executor(None, self._read_blocks, locations)
+        return [self._decode(line) for block in data for line in block.split(b'\n')]
+
+    def _get_unwritten(self) -> List[Message]:
+        """
+        Сообщения в памяти, которых еще нет в индексе; копия не меняется, пока читаются блоки.
+
+        :return: Сообщения в порядке номеров.
+        """
+        disk_last_seq = self._disk_last_seq
+        return [message for message in self._writing + self._pending if message.seq > disk_last_seq]
+
+    async def read(self, first_seq: int, count: int) -> List[Message]:
+        """
+        Чтение сообщений истории, начиная с заданного номера.
+
+        Первый нужный блок находится бинарным поиском по разреженному индексу номеров.
+
+        :param first_seq: Номер первого сообщения.
+        :param count: Наибольшее количество сообщений.
+        :return: Сообщения в порядке номеров.
+        """
+        await self.load()
+        unwritten = self._get_unwritten()
+        blocks = list()
+        available = 0
+        block = max(bisect_right(self._seqs, first_seq) - 1, 0)
+        while block < len(self._seqs) and available < count:
+            block_end = self._seqs[block] + self._counts[block]
+            if block_end > first_seq:
+                blocks.append(block)
+                available += block_end - max(first_seq, self._seqs[block])
+            block += 1
+        messages = [message for message in await self._load_blocks(blocks) if message.seq >= first_seq]
+        if len(messages) < count:
+            messages.extend(message for message in unwritten if message.seq >= first_seq)
+        return messages[:count]
+
+    async def find_seq(self, timestamp: int) -> Optional[int]:
+        """
+        Номер первого сообщения истории, отправленного не раньше заданного момента.
+
+        Блок находится бинарным поиском по разреженному индексу времени: читается только блок перед ним,
+        иначе ответ - первое сообщение найденного блока.
+
+        :param timestamp: Момент времени, микросекунды epoch.
+        :return: Номер сообщения или None, если все сообщения истории отправлены раньше.
+        """
+        await self.load()
+        unwritten = self._get_unwritten()
+        block = bisect_left(self._timestamps, timestamp)
+        if block > 0:
+            for message in await self._load_blocks([block - 1]):
+                if message.timestamp >= timestamp:
+                    return message.seq
+        if block < len(self._seqs):
+            return self._seqs[block]
+        for message in unwritten:
+            if message.timestamp >= timestamp:
+                return message.seq
+        return None
@@ -0,0 +1,56 @@
+from json import loads
+from typing import Iterable
+from typing import List
+
+from .message import Message
+
+ENCODED_NEWLINE = b'\\n'
+
+
+class EncodedText:
+    """
+    Текстовый ответ в виде списка закодированных фрагментов содержимого JSON-строки.
+
+    Фрагменты - закэшированные представления сообщений, поэтому ответ собирается без форматирования строк
+    и отправляется в соединение списком буферов без склейки.
+    """
+
+    def __init__(self, fragments: List[bytes]):
+        self._fragments = fragments
+        self._size = sum(map(len, fragments))
+
+    @classmethod
+    def from_lines(cls, lines: Iterable[bytes]) -> 'EncodedText':
+        """
+        Ответ из закодированных строк, разделенных переводом строки.
+
+        :param lines: Закодированные строки.
+        :return: Закодированный ответ.
+        """
+        fragments = list()
+        for line in lines:
+            if fragments:
+                fragments.append(ENCODED_NEWLINE)
+            fragments.append(line)
+        return cls(fragments)
+
+    @classmethod
+    def from_messages(cls, messages: Iterable[Message]) -> 'EncodedText':
+        """
+        Ответ из сообщений, разделенных переводом строки.
+
+        :param messages: Сообщения.
+        :return: Закодированный ответ.
+        """
+        return cls.from_lines(map(Message.encode, messages))
+
+    def __str__(self) -> str:
+        return loads(b'"' + b''.join(self._fragments) + b'"')
+
+    @property
+    def fragments(self) -> List[bytes]:
+        return self._fragments
+
+    @property
+    def size(self) -> int:
+        return self._size
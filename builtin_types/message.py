@@ -1,35 +1,174 @@
 from datetime import datetime
+from json import dumps
 from typing import Any
 from typing import Dict
+from typing import Optional
+from typing import Union
 
-from settings import DATETIME_FORMAT
+from .names import Names
+
+MICROSECONDS = 1_000_000
+# Сохраненное время меньше этого значения - секунды epoch (снимки и конфигурации до перехода на микросекунды).
+STORED_MICROSECONDS_MIN = 10 ** 12
 
 
 class Message:
     """
     Класс сообщения.
+
+    Для экономии памяти сообщение хранит время отправки целым числом микросекунд epoch, а отправителя - номером
+    в таблице имен; атрибуты объявлены в __slots__, поэтому у объекта нет словаря атрибутов.
+    Вложение хранится только ссылкой - идентификатором файла в хранилище вложений.
+    Строковое представление кодируется для ответов один раз и хранится, пока сообщение не устареет.
     """
 
-    def __init__(self, sending_time: datetime, sender_name: str, text: str):
-        self._sending_time = sending_time
-        self._sender = sender_name
+    __slots__ = ('_timestamp', '_sender_id', '_text', '_seq', '_attachment', '_encoded')
+
+    def __init__(
+        self, sending_time: datetime, sender_name: str, text: str, seq: int = 0, attachment: Optional[str] = None
+    ):
+        self._timestamp = self.get_timestamp(sending_time)
+        self._sender_id = Names.get_id(sender_name)
         self._text = text
+        self._seq = seq
+        self._attachment = attachment
+        self._encoded: Optional[bytes] = None
+
+    @classmethod
+    def from_timestamp(
+        cls, timestamp: int, sender_name: str, text: str, seq: int = 0, attachment: Optional[str] = None
+    ) -> 'Message':
+        """
+        Создание сообщения по времени отправки в микросекундах epoch без промежуточного datetime.
+
+        :param timestamp: Время отправки, микросекунды epoch.
+        :param sender_name: Имя отправителя.
+        :param text: Текст сообщения.
+        :param seq: Порядковый номер сообщения.
+        :param attachment: Идентификатор вложения.
+        :return: Объект сообщения.
+        """
+        message = cls.__new__(cls)
+        message._timestamp = timestamp
+        message._sender_id = Names.get_id(sender_name)
+        message._text = text
+        message._seq = seq
+        message._attachment = attachment
+        message._encoded = None
+        return message
+
+    @staticmethod
+    def get_timestamp(moment: datetime) -> int:
+        """
+        Момент времени в микросекундах epoch.
+
+        :param moment: Момент времени.
+        :return: Микросекунды epoch.
+        """
+        return round(moment.timestamp() * MICROSECONDS)
+
+    @staticmethod
+    def get_datetime(timestamp: int) -> datetime:
+        """
+        Момент времени по микросекундам epoch без потери точности.
+
+        :param timestamp: Микросекунды epoch.
+        :return: Момент времени.
+        """
+        seconds, microseconds = divmod(timestamp, MICROSECONDS)
+        return datetime.fromtimestamp(seconds).replace(microsecond=microseconds)
+
+    @staticmethod
+    def get_stored_timestamp(value: Union[int, float]) -> int:
+        """
+        Сохраненное время в микросекундах epoch: старые снимки и конфигурации хранили секунды.
+
+        :param value: Микросекунды или секунды epoch.
+        :return: Микросекунды epoch.
+        """
+        if value < STORED_MICROSECONDS_MIN:
+            return round(value * MICROSECONDS)
+        return int(value)
 
     def __str__(self) -> str:
-        return f'[{self._sending_time}] {self._sender}: {self._text}'
+        if self._attachment is not None:
+            return f'#{self._seq} [{self.sending_time}] {self.sender}: {self._text} [attachment {self._attachment}]'
+        return f'#{self._seq} [{self.sending_time}] {self.sender}: {self._text}'
 
     @property
     def sending_time(self) -> datetime:
-        return self._sending_time
+        return self.get_datetime(self._timestamp)
+
+    @property
+    def timestamp(self) -> int:
+        return self._timestamp
+
+    @property
+    def sender_id(self) -> int:
+        return self._sender_id
+
+    @property
+    def sender(self) -> str:
+        return Names.get_name(self._sender_id)
+
+    @property
+    def text(self) -> str:
+        return self._text
+
+    @property
+    def attachment(self) -> Optional[str]:
+        return self._attachment
+
+    @property
+    def seq(self) -> int:
+        return self._seq
+
+    @seq.setter
+    def seq(self, value: int) -> None:
+        self._seq = value
+        self._encoded = None
+
+    @property
+    def size(self) -> int:
+        sender = self.sender
+        return (
+            (len(sender) if sender.isascii() else len(sender.encode()))
+            + (len(self._text) if self._text.isascii() else len(self._text.encode()))
+            + (len(self._attachment) if self._attachment is not None else 0)
+        )
+
+    def encode(self) -> bytes:
+        """
+        Строковое представление сообщения в виде содержимого JSON-строки (без кавычек), готовое к отправке.
+
+        Результат кэшируется, поэтому сообщение кодируется один раз, сколько бы ответов его ни содержало.
+
+        :return: Закодированное представление.
+        """
+        if self._encoded is None:
+            self._encoded = dumps(str(self))[1:-1].encode()
+        return self._encoded
+
+    def release_encoded(self) -> None:
+        """
+        Освобождение закодированного представления.
+
+        :return: None.
+        """
+        self._encoded = None
 
     def to_dict(self) -> Dict[str, Any]:
         """
         Получение информации о сообщении в формате словаря.
 
-        :return: Словарь с информацией о сообщении.
+        :return: Словарь с информацией о сообщении; время отправки - в микросекундах epoch.
         """
-        return {
-            'sending_time': self.sending_time.strftime(DATETIME_FORMAT),
-            'sender': self._sender,
-            'text': self._text
+        message_dict = {
+            'sending_time': self._timestamp,
+            'sender': self.sender,
+            'text': self._text,
+            'seq': self._seq
         }
+        if self._attachment is not None:
+            message_dict['attachment'] = self._attachment
+        return message_dict
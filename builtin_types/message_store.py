@@ -0,0 +1,324 @@
+from array import array
+from bisect import bisect_left
+from bisect import bisect_right
+from datetime import datetime
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from .chat_history import ChatHistory
+from .message import Message
+from .names import Names
+from .search_index import SearchIndex
+from .search_index import SearchQuery
+
+COMPACTION_THRESHOLD = 1024
+
+
+class MessageStore:
+    """
+    Хранилище сообщений чата.
+
+    Сообщения хранятся в массиве в порядке отправки, удаленные из начала сообщения отсекаются сдвигом
+    индекса головы, а память под них освобождается периодическим уплотнением массива. Поэтому добавление
+    выполняется за O(1), а удаление устаревших сообщений - за амортизированное O(количество удаленных).
+    Индексы в методах хранилища отсчитываются от самого старого хранимого сообщения.
+    Закодированное представление удаляемого сообщения освобождается сразу, не дожидаясь уплотнения.
+    Если включен поисковый индекс, он обновляется при каждом добавлении и удалении сообщения.
+    Если подключена холодная история, удаляемые сообщения переносятся в нее.
+    """
+
+    def __init__(
+        self,
+        messages: Optional[List[Message]] = None,
+        last_seq: int = 0,
+        max_count: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        search_index: bool = False,
+        history: Optional[ChatHistory] = None
+    ):
+        self._items: List[Message] = list()
+        # Времена отправки в микросекундах epoch: массив целых чисел без отдельного объекта на каждое значение.
+        self._timestamps = array('q')
+        self._head = 0
+        self._bytes = 0
+        self._last_seq = last_seq
+        self._max_count = max_count
+        self._max_bytes = max_bytes
+        self._index: Optional[SearchIndex] = SearchIndex() if search_index else None
+        self._history = history
+        for message in messages or list():
+            self._items.append(message)
+            self._timestamps.append(message.timestamp)
+            self._bytes += message.size
+            self._last_seq = max(self._last_seq, message.seq)
+            if self._index is not None:
+                self._index.add(message.seq, message.text)
+        self._enforce_limits()
+
+    def __len__(self) -> int:
+        return len(self._items) - self._head
+
+    def __iter__(self) -> Iterator[Message]:
+        return map(self._items.__getitem__, range(self._head, len(self._items)))
+
+    def __getitem__(self, index: int) -> Message:
+        return self._items[self._head + index]
+
+    @property
+    def last_seq(self) -> int:
+        return self._last_seq
+
+    @property
+    def first_seq(self) -> int:
+        if self._head == len(self._items):
+            return self._last_seq + 1
+        return self._items[self._head].seq
+
+    @property
+    def size(self) -> int:
+        return self._bytes
+
+    @property
+    def search_index(self) -> Optional[SearchIndex]:
+        return self._index
+
+    @property
+    def history(self) -> Optional[ChatHistory]:
+        return self._history
+
+    @history.setter
+    def history(self, value: Optional[ChatHistory]) -> None:
+        self._history = value
+
+    @property
+    def first_timestamp(self) -> Optional[int]:
+        if self._head == len(self._items):
+            return None
+        return self._timestamps[self._head]
+
+    def append(self, message: Message) -> None:
+        """
+        Добавление сообщения с назначением ему следующего порядкового номера.
+
+        :param message: Объект сообщения.
+        :return: None.
+        """
+        self._last_seq += 1
+        message.seq = self._last_seq
+        self._items.append(message)
+        self._timestamps.append(message.timestamp)
+        self._bytes += message.size
+        if self._index is not None:
+            self._index.add(message.seq, message.text)
+        # Новое сообщение попадет в ответы всем читателям чата, поэтому кодируется сразу.
+        message.encode()
+        self._enforce_limits()
+
+    def append_replica(self, message: Message) -> bool:
+        """
+        Добавление сообщения с уже назначенным порядковым номером (реплика чата другого процесса).
+
+        Уже добавленные сообщения пропускаются. При пропуске номеров хранимые сообщения удаляются,
+        чтобы номера оставались идущими подряд.
+
+        :param message: Объект сообщения.
+        :return: True, если сообщение добавлено.
+        """
+        if message.seq <= self._last_seq:
+            return False
+        if message.seq > self._last_seq + 1:
+            self.expire_through(self._last_seq)
+            self._last_seq = message.seq - 1
+        self.append(message)
+        return True
+
+    def index_after(self, seq: int) -> int:
+        """
+        Индекс первого сообщения с порядковым номером больше заданного.
+
+        Номера хранимых сообщений идут подряд, поэтому индекс вычисляется без поиска.
+
+        :param seq: Порядковый номер сообщения.
+        :return: Индекс сообщения.
+        """
+        if self._head == len(self._items):
+            return 0
+        return min(max(seq - self._items[self._head].seq + 1, 0), len(self))
+
+    def index_before(self, moment: datetime) -> int:
+        """
+        Количество сообщений, отправленных раньше заданного момента.
+
+        Поиск выполняется бинарным поиском по массиву времен отправки.
+
+        :param moment: Момент времени.
+        :return: Индекс первого сообщения, отправленного не раньше заданного момента.
+        """
+        return self.index_from(Message.get_timestamp(moment))
+
+    def index_from(self, timestamp: int) -> int:
+        """
+        Количество сообщений, отправленных раньше заданного момента в микросекундах epoch.
+
+        :param timestamp: Момент времени, микросекунды epoch.
+        :return: Индекс первого сообщения, отправленного не раньше заданного момента.
+        """
+        return bisect_left(self._timestamps, timestamp, self._head, len(self._items)) - self._head
+
+    def view(self, start: int) -> 'MessagesView':
+        """
+        Представление сообщений, начиная с заданного индекса, без копирования.
+
+        :param start: Индекс первого сообщения.
+        :return: Представление сообщений.
+        """
+        if start >= len(self):
+            return MessagesView(self, self._last_seq + 1, self._last_seq)
+        return MessagesView(self, self[start].seq, self._last_seq)
+
+    def iter_range(self, first_seq: int, last_seq: int) -> Iterator[Message]:
+        """
+        Итератор по хранимым сообщениям с номерами из заданного диапазона.
+
+        :param first_seq: Номер первого сообщения.
+        :param last_seq: Номер последнего сообщения.
+        :return: Итератор сообщений.
+        """
+        start = self._head + self.index_after(first_seq - 1)
+        stop = self._head + self.index_after(last_seq)
+        return map(self._items.__getitem__, range(start, stop))
+
+    def search(self, query: SearchQuery, count: int, first_seq: int = 0) -> List[Tuple[int, Message]]:
+        """
+        Поиск сообщений по индексу.
+
+        Интервал времени переводится в диапазон номеров бинарным поиском по массиву времен отправки, поэтому
+        индекс просматривается только в этом диапазоне; фильтр по отправителю применяется к отранжированным
+        сообщениям, пока не наберется нужное количество.
+
+        :param query: Поисковый запрос.
+        :param count: Наибольшее количество сообщений.
+        :param first_seq: Номер первого сообщения, доступного для поиска.
+        :return: Пары (количество совпавших слов запроса, сообщение) по убыванию релевантности.
+        """
+        start = self._head + self.index_after(first_seq - 1)
+        stop = len(self._items)
+        if query.start is not None:
+            start = bisect_left(self._timestamps, query.start, start, stop)
+        if query.end is not None:
+            stop = bisect_right(self._timestamps, query.end, start, stop)
+        if self._index is None or start >= stop or not query.size:
+            return list()
+        first_seq = self._items[self._head].seq
+        sender_id = Names.get_id(query.sender) if query.sender else None
+        matches = self._index.search(query, self._items[start].seq, self._items[stop - 1].seq)
+        result = list()
+        for score, seq in self._index.rank(matches):
+            message = self._items[self._head + seq - first_seq]
+            if sender_id is not None and message.sender_id != sender_id:
+                continue
+            result.append((score, message))
+            if len(result) >= count:
+                break
+        return result
+
+    def expire(self, deadline: datetime, limit: Optional[int] = None) -> int:
+        """
+        Удаление сообщений, отправленных не позже заданного момента.
+
+        Сообщения упорядочены по времени отправки, поэтому граница находится бинарным поиском,
+        а просматриваются только удаляемые сообщения.
+
+        :param deadline: Граница актуальности сообщений.
+        :param limit: Наибольшее количество удаляемых за вызов сообщений.
+        :return: Количество удаленных сообщений.
+        """
+        stop = bisect_right(self._timestamps, Message.get_timestamp(deadline), self._head, len(self._items))
+        if limit is not None:
+            stop = min(stop, self._head + limit)
+        expired = stop - self._head
+        while self._head < stop:
+            self._drop_head()
+        self._compact()
+        return expired
+
+    def expire_through(self, seq: int) -> int:
+        """
+        Удаление сообщений с порядковым номером не больше заданного.
+
+        :param seq: Номер последнего удаляемого сообщения.
+        :return: Количество удаленных сообщений.
+        """
+        stop = self._head + self.index_after(seq)
+        expired = stop - self._head
+        while self._head < stop:
+            self._drop_head()
+        self._compact()
+        return expired
+
+    def _enforce_limits(self) -> None:
+        """
+        Удаление самых старых сообщений сверх ограничений по количеству и объему.
+
+        :return: None.
+        """
+        while self._max_count is not None and len(self) > self._max_count:
+            self._drop_head()
+        while self._max_bytes is not None and self._bytes > self._max_bytes and len(self) > 1:
+            self._drop_head()
+        self._compact()
+
+    def _drop_head(self) -> None:
+        """
+        Удаление самого старого сообщения с переносом в холодную историю, если она подключена.
+
+        :return: None.
+        """
+        message = self._items[self._head]
+        if self._history is not None:
+            self._history.append(message)
+        self._bytes -= message.size
+        message.release_encoded()
+        if self._index is not None:
+            self._index.remove(message.text)
+        self._items[self._head] = None  # type: ignore
+        self._head += 1
+
+    def _compact(self) -> None:
+        """
+        Освобождение места, занятого удаленными сообщениями, если их накопилось больше половины массива.
+
+        :return: None.
+        """
+        if self._head == len(self._items) or (
+            self._head >= COMPACTION_THRESHOLD and self._head * 2 >= len(self._items)
+        ):
+            del self._items[:self._head]
+            del self._timestamps[:self._head]
+            self._head = 0
+
+
+class MessagesView:
+    """
+    Представление диапазона сообщений хранилища без копирования.
+
+    Диапазон задается порядковыми номерами, поэтому представление остается корректным после удаления
+    устаревших сообщений: удаленные сообщения просто не попадают в итерацию.
+    """
+
+    def __init__(self, store: MessageStore, first_seq: int, last_seq: int):
+        self._store = store
+        self._first_seq = first_seq
+        self._last_seq = last_seq
+
+    def __iter__(self) -> Iterator[Message]:
+        return self._store.iter_range(self._first_seq, self._last_seq)
+
+    def __len__(self) -> int:
+        return self._store.index_after(self._last_seq) - self._store.index_after(self._first_seq - 1)
+
+    @property
+    def last_seq(self) -> int:
+        return self._last_seq
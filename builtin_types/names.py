@@ -0,0 +1,37 @@
+from typing import Dict
+from typing import List
+
+
+class Names:
+    """
+    Таблица имен отправителей: каждое имя хранится один раз, сообщения ссылаются на него по номеру.
+
+    Имена пользователей не удаляются, поэтому таблица растет только с количеством пользователей.
+    """
+
+    _ids: Dict[str, int] = dict()
+    _names: List[str] = list()
+
+    @classmethod
+    def get_id(cls, name: str) -> int:
+        """
+        Номер имени, при отсутствии имя добавляется в таблицу.
+
+        :param name: Имя.
+        :return: Номер имени.
+        """
+        name_id = cls._ids.get(name)
+        if name_id is None:
+            name_id = cls._ids[name] = len(cls._names)
+            cls._names.append(name)
+        return name_id
+
+    @classmethod
+    def get_name(cls, name_id: int) -> str:
+        """
+        Имя по номеру.
+
+        :param name_id: Номер имени.
+        :return: Имя.
+        """
+        return cls._names[name_id]
@@ -0,0 +1,24 @@
+from dataclasses import asdict
+from dataclasses import dataclass
+from typing import Any
+from typing import Dict
+
+
+@dataclass
+class ScheduledMessage:
+    """
+    Отложенное сообщение: отправляется в общий чат (пустой получатель) или приватный чат в заданный момент.
+    """
+    schedule_id: int
+    sender: str
+    recipient: str
+    text: str
+    send_at: int
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Получение отложенного сообщения в формате словаря.
+
+        :return: Словарь с данными сообщения; время отправки - в микросекундах epoch.
+        """
+        return asdict(self)
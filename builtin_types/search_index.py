@@ -0,0 +1,208 @@
+from array import array
+from bisect import bisect_left
+from bisect import bisect_right
+from collections import Counter
+from dataclasses import dataclass
+from dataclasses import field
+from re import compile
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Set
+from typing import Tuple
+from typing import Union
+
+WORD = compile(r'\w+')
+
+# Совпадения одного слова запроса: срез списка номеров сообщений или множество номеров для префикса.
+Matches = Union[array, Set[int]]
+
+
+@dataclass
+class SearchQuery:
+    """
+    Поисковый запрос: слова, префиксы (слова запроса с `*` на конце) и фильтры по отправителю и времени.
+    """
+    terms: List[str] = field(default_factory=list)
+    prefixes: List[str] = field(default_factory=list)
+    sender: Optional[str] = None
+    start: Optional[int] = None
+    end: Optional[int] = None
+
+    @classmethod
+    def parse(
+        cls, text: str, sender: Optional[str] = None, start: Optional[int] = None, end: Optional[int] = None
+    ) -> 'SearchQuery':
+        """
+        Разбор текста запроса.
+
+        :param text: Текст запроса: слова через пробел, `слово*` - поиск по префиксу.
+        :param sender: Имя отправителя.
+        :param start: Начало интервала времени отправки, микросекунды epoch.
+        :param end: Конец интервала времени отправки, микросекунды epoch.
+        :return: Поисковый запрос.
+        """
+        query = cls(sender=sender, start=start, end=end)
+        for item in text.split():
+            words = SearchIndex.get_terms(item, unique=False)
+            if not words:
+                continue
+            if item.endswith('*'):
+                query.prefixes.append(words.pop())
+            query.terms.extend(words)
+        query.terms = list(dict.fromkeys(query.terms))
+        query.prefixes = list(dict.fromkeys(query.prefixes))
+        return query
+
+    @property
+    def size(self) -> int:
+        return len(self.terms) + len(self.prefixes)
+
+
+class SearchIndex:
+    """
+    Инвертированный индекс сообщений чата: для каждого слова - массив номеров содержащих его сообщений.
+
+    Номера добавляются по возрастанию, а устаревшие сообщения удаляются из начала чата, поэтому в каждом
+    массиве они лежат в начале: удаление сдвигает индекс головы массива, а память освобождается, когда удаленных
+    номеров становится не меньше половины массива. Для поиска по префиксу слова хранится отсортированный
+    словарь, новые слова вливаются в него при первом поиске по префиксу после их появления.
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, array] = dict()
+        self._heads: Dict[str, int] = dict()
+        self._sorted_terms: List[str] = list()
+        self._new_terms: List[str] = list()
+        self._removed_terms = 0
+
+    def __len__(self) -> int:
+        return len(self._postings)
+
+    @staticmethod
+    def get_terms(text: str, unique: bool = True) -> List[str]:
+        """
+        Слова текста в нижнем регистре.
+
+        :param text: Текст.
+        :param unique: Убрать повторы слов.
+        :return: Слова.
+        """
+        words = WORD.findall(text.lower())
+        return list(set(words)) if unique else words
+
+    def add(self, seq: int, text: str) -> None:
+        """
+        Добавление сообщения; номер должен быть больше номеров всех проиндексированных сообщений.
+
+        :param seq: Номер сообщения.
+        :param text: Текст сообщения.
+        :return: None.
+        """
+        for term in self.get_terms(text):
+            posting = self._postings.get(term)
+            if posting is None:
+                posting = self._postings[term] = array('q')
+                self._new_terms.append(term)
+            posting.append(seq)
+
+    def remove(self, text: str) -> None:
+        """
+        Удаление самого старого проиндексированного сообщения.
+
+        :param text: Текст сообщения.
+        :return: None.
+        """
+        for term in self.get_terms(text):
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            head = self._heads.get(term, 0) + 1
+            if head == len(posting):
+                del self._postings[term]
+                self._heads.pop(term, None)
+                self._removed_terms += 1
+            elif head * 2 >= len(posting):
+                del posting[:head]
+                self._heads.pop(term, None)
+            else:
+                self._heads[term] = head
+
+    def _expand(self, prefix: str) -> List[str]:
+        """
+        Слова словаря, начинающиеся с префикса.
+
+        :param prefix: Префикс.
+        :return: Слова.
+        """
+        if self._new_terms or self._removed_terms * 2 > len(self._sorted_terms):
+            # Удаленное и снова добавленное слово может остаться в словаре, поэтому повторы убираются после слияния.
+            self._new_terms.sort()
+            self._sorted_terms.extend(self._new_terms)
+            self._sorted_terms.sort()
+            self._sorted_terms = [term for term in dict.fromkeys(self._sorted_terms) if term in self._postings]
+            self._new_terms.clear()
+            self._removed_terms = 0
+        terms = list()
+        for index in range(bisect_left(self._sorted_terms, prefix), len(self._sorted_terms)):
+            term = self._sorted_terms[index]
+            if not term.startswith(prefix):
+                break
+            if term in self._postings:
+                terms.append(term)
+        return terms
+
+    def _get_matches(self, term: str, first_seq: int, last_seq: int) -> array:
+        """
+        Номера сообщений с заданным словом в диапазоне номеров.
+
+        :param term: Слово.
+        :param first_seq: Номер первого сообщения диапазона.
+        :param last_seq: Номер последнего сообщения диапазона.
+        :return: Номера сообщений по возрастанию.
+        """
+        posting = self._postings.get(term)
+        if posting is None:
+            return array('q')
+        start = bisect_left(posting, first_seq, self._heads.get(term, 0))
+        return posting[start:bisect_right(posting, last_seq, start)]
+
+    def search(self, query: SearchQuery, first_seq: int, last_seq: int) -> Iterable[Matches]:
+        """
+        Совпадения каждого слова и префикса запроса в диапазоне номеров.
+
+        :param query: Поисковый запрос.
+        :param first_seq: Номер первого сообщения диапазона.
+        :param last_seq: Номер последнего сообщения диапазона.
+        :return: Номера сообщений для каждого слова и префикса запроса.
+        """
+        for term in query.terms:
+            yield self._get_matches(term, first_seq, last_seq)
+        for prefix in query.prefixes:
+            matches: Set[int] = set()
+            for term in self._expand(prefix):
+                matches.update(self._get_matches(term, first_seq, last_seq))
+            yield matches
+
+    @staticmethod
+    def rank(matches: Iterable[Matches]) -> Iterator[Tuple[int, int]]:
+        """
+        Найденные сообщения по убыванию релевантности: сначала сообщения, содержащие больше слов запроса,
+        среди них - более новые.
+
+        Для запроса из одного слова номера перебираются с конца без сортировки, поэтому первая страница
+        выдается за O(размер страницы).
+
+        :param matches: Совпадения слов запроса.
+        :return: Пары (количество совпавших слов запроса, номер сообщения).
+        """
+        matches = list(matches)
+        if len(matches) == 1:
+            seqs = sorted(matches[0]) if isinstance(matches[0], set) else matches[0]
+            return ((1, seq) for seq in reversed(seqs))
+        counts: Counter = Counter()
+        for term_matches in matches:
+            counts.update(term_matches)
+        return iter(sorted(((score, seq) for seq, score in counts.items()), reverse=True))
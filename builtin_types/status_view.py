@@ -0,0 +1,112 @@
+from random import randrange
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from settings import STATUS_CHANGES_LIMIT
+from .user import User
+
+# Версия статуса: старшие биты - эпоха представления, младшие - номер изменения в ней.
+EPOCH_SHIFT = 32
+CHANGE_MASK = (1 << EPOCH_SHIFT) - 1
+
+
+class StatusView:
+    """
+    Представление статуса сервера, обновляемое по мере изменений: список пользователей в порядке регистрации
+    и журнал изменений (новые пользователи и новые чаты пользователей), пронумерованных версиями.
+
+    Страница списка пользователей выдается за O(размер страницы), изменения с заданной версии -
+    за O(количество изменений). Хранятся последние STATUS_CHANGES_LIMIT изменений; клиенту с более старой
+    версией нужно заново запросить полный статус.
+
+    Номера изменений ведутся в памяти, поэтому в версию входит случайная эпоха представления: версия,
+    выданная до перезапуска сервера, до пересборки представления из снимка или другим шардом, не совпадает
+    по эпохе, и клиент получает полный статус вместо неверных изменений.
+    """
+
+    def __init__(
+        self, users: Iterable[User] = (), changes_limit: int = STATUS_CHANGES_LIMIT, epoch: Optional[int] = None
+    ):
+        self._user_names: List[str] = [user.name for user in users]
+        # Изменение: (имя пользователя, название чата); для нового пользователя название чата - None.
+        self._changes: List[Tuple[str, Optional[str]]] = list()
+        self._first_version = 1
+        self._changes_limit = changes_limit
+        self._epoch = randrange(1, 1 << (EPOCH_SHIFT - 1)) if epoch is None else epoch
+
+    @property
+    def version(self) -> int:
+        return (self._epoch << EPOCH_SHIFT) | self._last_change
+
+    @property
+    def _last_change(self) -> int:
+        return self._first_version + len(self._changes) - 1
+
+    def _record(self, user_name: str, chat_name: Optional[str]) -> None:
+        """
+        Запись изменения; самая старая половина журнала удаляется при превышении ограничения.
+
+        :param user_name: Имя пользователя.
+        :param chat_name: Название нового чата пользователя или None для нового пользователя.
+        :return: None.
+        """
+        self._changes.append((user_name, chat_name))
+        if len(self._changes) > self._changes_limit:
+            dropped = len(self._changes) - self._changes_limit // 2
+            del self._changes[:dropped]
+            self._first_version += dropped
+
+    def add_user(self, user_name: str) -> None:
+        """
+        Добавление нового пользователя.
+
+        :param user_name: Имя пользователя.
+        :return: None.
+        """
+        self._user_names.append(user_name)
+        self._record(user_name, None)
+
+    def add_chat(self, user_name: str, chat_name: str) -> None:
+        """
+        Добавление чата пользователю.
+
+        :param user_name: Имя пользователя.
+        :param chat_name: Название чата.
+        :return: None.
+        """
+        self._record(user_name, chat_name)
+
+    def get_users(self, offset: int = 0, limit: Optional[int] = None) -> List[str]:
+        """
+        Страница списка пользователей.
+
+        :param offset: Количество пропускаемых пользователей.
+        :param limit: Размер страницы, None - до конца списка.
+        :return: Имена пользователей.
+        """
+        offset = max(offset, 0)
+        stop = None if limit is None else offset + max(limit, 0)
+        return self._user_names[offset:stop]
+
+    def get_changes(self, version: int, user_name: str) -> Optional[Tuple[List[str], List[str]]]:
+        """
+        Изменения после заданной версии, видимые пользователю: новые пользователи и его новые чаты.
+
+        :param version: Версия, полученная клиентом ранее.
+        :param user_name: Имя пользователя, запрашивающего изменения.
+        :return: Новые чаты и новые пользователи или None, если версия выдана другим представлением
+            или изменения с нее уже не хранятся.
+        """
+        change = version & CHANGE_MASK
+        if version >> EPOCH_SHIFT != self._epoch or change < self._first_version - 1 or change > self._last_change:
+            return None
+        chats = list()
+        users = list()
+        for changed_user_name, chat_name in self._changes[max(change - self._first_version + 1, 0):]:
+            if chat_name is None:
+                users.append(changed_user_name)
+            elif changed_user_name == user_name:
+                chats.append(chat_name)
+        return chats, users
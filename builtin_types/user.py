@@ -1,22 +1,39 @@
 from datetime import datetime
+from sys import intern
 from typing import Any
 from typing import Dict
 from typing import List
 from typing import Optional
 
-from settings import DATETIME_FORMAT
-from .chat import Chat
+from .message import Message
 
 
 class User:
     """
     Класс пользователя.
+
+    Чаты пользователя хранятся индексом "название чата - собеседник" (для общего чата собеседника нет),
+    поэтому проверка доступа к чату и поиск собеседника выполняются за O(1).
+    Названия чатов интернируются: у всех участников чата в индексе и курсорах одна и та же строка.
     """
 
-    def __init__(self, name: str, creation_datetime: Optional[datetime] = None, chats: Optional[List[str]] = None):
+    __slots__ = ('_name', '_creation_datetime', '_chats', '_read_cursors')
+
+    def __init__(
+        self,
+        name: str,
+        creation_datetime: Optional[datetime] = None,
+        chats: Optional[List[str]] = None,
+        read_cursors: Optional[Dict[str, int]] = None,
+        partners: Optional[Dict[str, str]] = None
+    ):
         self._name = name
         self._creation_datetime = creation_datetime or datetime.now()
-        self._chats = chats or list()
+        self._chats: Dict[str, Optional[str]] = dict()
+        partners = partners or dict()
+        for chat_name in chats or list():
+            self.add_chat(chat_name, partners.get(chat_name))
+        self._read_cursors = {intern(chat_name): seq for chat_name, seq in (read_cursors or dict()).items()}
 
     def __str__(self) -> str:
         return self._name
@@ -26,30 +43,72 @@ class User:
         return self._name
 
     @property
-    async def chats(self) -> List[str]:
-        return self._chats
+    def chats(self) -> List[str]:
+        return list(self._chats)
 
     @property
     def creation_datetime(self) -> datetime:
         return self._creation_datetime
 
-    async def add_chat(self, chat: Chat) -> None:
+    def add_chat(self, chat_name: str, partner_name: Optional[str] = None) -> None:
+        """
+        Добавляет чат в индекс.
+
+        :param chat_name: Название чата.
+        :param partner_name: Имя собеседника в приватном чате.
+        :return: None.
+        """
+        if chat_name not in self._chats:
+            self._chats[intern(chat_name)] = partner_name
+
+    def has_chat(self, chat_name: str) -> bool:
+        """
+        Проверяет, участвует ли пользователь в чате.
+
+        :param chat_name: Название чата.
+        :return: True, если чат есть в индексе пользователя.
+        """
+        return chat_name in self._chats
+
+    def get_partner(self, chat_name: str) -> Optional[str]:
+        """
+        Возвращает собеседника в приватном чате.
+
+        :param chat_name: Название чата.
+        :return: Имя собеседника или None, если это не приватный чат пользователя.
+        """
+        return self._chats.get(chat_name)
+
+    def get_read_cursor(self, chat_name: str) -> int:
+        """
+        Возвращает номер последнего прочитанного сообщения чата.
+
+        :param chat_name: Название чата.
+        :return: Порядковый номер сообщения, 0 - если чат не читался.
+        """
+        return self._read_cursors.get(chat_name, 0)
+
+    def move_read_cursor(self, chat_name: str, seq: int) -> None:
         """
-        Добавляет чат в список.
+        Сдвигает курсор прочитанных сообщений чата вперед.
 
-        :param chat: Объект чата.
+        :param chat_name: Название чата.
+        :param seq: Порядковый номер последнего прочитанного сообщения.
         :return: None.
         """
-        self._chats.append(chat.name)
+        if seq > self._read_cursors.get(chat_name, 0):
+            self._read_cursors[intern(chat_name)] = seq
 
     def to_dict(self) -> Dict[str, Any]:
         """
         Получение информации о пользователе в формате словаря.
 
-        :return: Словарь с информацией о пользователе.
+        :return: Словарь с информацией о пользователе; время регистрации - в микросекундах epoch.
         """
         return {
             'name': self.name,
-            'creation_datetime': self._creation_datetime.strftime(DATETIME_FORMAT),
-            'chats': self._chats
+            'creation_datetime': Message.get_timestamp(self._creation_datetime),
+            'chats': list(self._chats),
+            'partners': {chat_name: partner for chat_name, partner in self._chats.items() if partner is not None},
+            'read_cursors': dict(self._read_cursors)
         }
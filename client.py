@@ -1,8 +1,31 @@
 from argparse import ArgumentParser
 from argparse import Namespace
+from asyncio import Future
+from asyncio import Lock
+from asyncio import Queue
+from asyncio import StreamReader
+from asyncio import StreamWriter
+from asyncio import Task
+from asyncio import create_task
+from asyncio import gather
+from asyncio import get_running_loop
 from asyncio import open_connection
 from asyncio import run
+from itertools import count
 from json import dumps
+from os.path import getsize
+from typing import Any
+from typing import AsyncIterator
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from settings import ATTACHMENT_CHUNK_SIZE
+from settings import CLIENT_RECONNECT_ATTEMPTS
+from settings import FRAMED_PROTOCOL_MARKER
+from settings import TRANSFER_PROTOCOL_MARKER
+from utils import FramedConnection
 
 
 class Client:
@@ -10,44 +33,218 @@ class Client:
     Клиент для обмена сообщениями с сервером.
     """
 
-    def __init__(self, client_name: str, server_host: str, server_port: int):
+    def __init__(self, client_name: str, server_host: str, server_port: int, persistent: bool = True):
         if not isinstance(client_name, str):
             raise TypeError('client_name must be str')
 
         self._client_name = client_name
         self._server_host = server_host
         self._server_port = server_port
+        self._persistent = persistent
+
+        self._connection: Optional[FramedConnection] = None
+        self._reader_task: Optional[Task] = None
+        self._connection_lock: Optional[Lock] = None
+        self._pending: Dict[int, Future] = dict()
+        self._streams: Dict[int, Queue] = dict()
+        self._request_ids = count(1)
+        self._bytes_sent = 0
+        self._bytes_received = 0
+
+    @property
+    def bytes_sent(self) -> int:
+        if self._connection is None:
+            return self._bytes_sent
+        return self._bytes_sent + len(FRAMED_PROTOCOL_MARKER) + self._connection.bytes_written
+
+    @property
+    def bytes_received(self) -> int:
+        return self._bytes_received + (self._connection.bytes_read if self._connection is not None else 0)
 
-    async def _send(self, endpoint: str, message: str, recipient: str, chat_name: str) -> str:
+    def _build_request(
+        self,
+        endpoint: str,
+        message: str,
+        recipient: str,
+        chat_name: str,
+        since: Optional[int] = None,
+        messages: Optional[List[Dict[str, str]]] = None
+    ) -> Dict[str, Any]:
         """
-        Отправка запроса.
+        Формирование тела запроса.
 
         :param endpoint: Эндпоинт сервера.
         :param message: Сообщение.
         :param recipient: Получатель.
         :param chat_name: Название чата.
+        :param since: Номер сообщения, после которого нужно вернуть сообщения чата.
+        :param messages: Пакет сообщений.
+        :return: Тело запроса.
+        """
+        return {
+            'client_name': self._client_name,
+            'endpoint': endpoint,
+            'message': message,
+            'recipient': recipient,
+            'chat_name': chat_name,
+            'since': since,
+            'messages': messages,
+        }
+
+    async def _send_once(self, request: Dict[str, Any]) -> str:
+        """
+        Отправка запроса через отдельное соединение (режим "один запрос на соединение").
+
+        :param request: Тело запроса.
         :return: Строковый ответ сервера.
         """
         reader, writer = await open_connection(self._server_host, self._server_port)
 
-        request = dumps(
-            {
-                'client_name': self._client_name,
-                'endpoint': endpoint,
-                'message': message,
-                'recipient': recipient,
-                'chat_name': chat_name,
-            }
-        )
-        writer.write(request.encode())
+        encoded_request = dumps(request).encode()
+        writer.write(encoded_request)
         writer.write_eof()
         await writer.drain()
 
         response = await reader.read()
+        self._bytes_sent += len(encoded_request)
+        self._bytes_received += len(response)
         encoded_response = response.decode()
         writer.close()
         return encoded_response
 
+    async def _read_responses(
+        self, connection: FramedConnection, pending: Dict[int, Future], streams: Dict[int, Queue]
+    ) -> None:
+        """
+        Чтение ответов сервера и передача их ожидающим запросам и подпискам.
+
+        :param connection: Кадрированное соединение.
+        :param pending: Запросы этого соединения, ожидающие ответа.
+        :param streams: Очереди событий подписок этого соединения.
+        :return: None.
+        """
+        error: Exception = ConnectionError('Connection closed by server')
+        try:
+            while True:
+                frame = await connection.read_frame()
+                if frame is None:
+                    break
+                if 'event' in frame:
+                    stream = streams.get(frame.get('request_id'))
+                    if stream is not None:
+                        stream.put_nowait(frame)
+                    continue
+                future = pending.pop(frame.get('request_id'), None)
+                if future is not None and not future.done():
+                    future.set_result(frame['response'])
+        except ConnectionError as connection_error:
+            error = connection_error
+        finally:
+            if self._connection is connection:
+                self._connection = None
+            self._bytes_sent += connection.bytes_written + len(FRAMED_PROTOCOL_MARKER)
+            self._bytes_received += connection.bytes_read
+            await connection.close()
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(error)
+            pending.clear()
+            for stream in streams.values():
+                stream.put_nowait(error)
+            streams.clear()
+
+    async def _get_connection(self) -> FramedConnection:
+        """
+        Получение долгоживущего соединения, при необходимости - повторное подключение.
+
+        :return: Кадрированное соединение.
+        """
+        if self._connection_lock is None:
+            self._connection_lock = Lock()
+        async with self._connection_lock:
+            if self._connection is None or self._connection.closed:
+                reader, writer = await open_connection(self._server_host, self._server_port)
+                writer.write(FRAMED_PROTOCOL_MARKER)
+                self._connection = FramedConnection(reader, writer)
+                self._pending = dict()
+                self._streams = dict()
+                self._reader_task = create_task(
+                    self._read_responses(self._connection, self._pending, self._streams)
+                )
+            return self._connection
+
+    async def _send_framed(self, request: Dict[str, Any], stream: Optional[Queue] = None) -> str:
+        """
+        Отправка запроса через долгоживущее соединение и ожидание ответа.
+
+        :param request: Тело запроса.
+        :param stream: Очередь для событий, которые сервер отправляет в ответ на запрос подписки.
+        :return: Строковый ответ сервера.
+        """
+        future = await self._submit_framed(request, stream)
+        return await future
+
+    async def _submit_framed(self, request: Dict[str, Any], stream: Optional[Queue] = None) -> Future:
+        """
+        Отправка запроса через долгоживущее соединение без ожидания ответа.
+
+        Если соединение оказалось разорвано до отправки запроса, выполняется переподключение.
+
+        :param request: Тело запроса.
+        :param stream: Очередь для событий, которые сервер отправляет в ответ на запрос подписки.
+        :return: Future со строковым ответом сервера.
+        """
+        for attempt in range(1, CLIENT_RECONNECT_ATTEMPTS + 1):
+            connection = await self._get_connection()
+            pending, streams = self._pending, self._streams
+            request_id = next(self._request_ids)
+            future = get_running_loop().create_future()
+            pending[request_id] = future
+            if stream is not None:
+                streams[request_id] = stream
+            try:
+                await connection.write_frame({'request_id': request_id, **request})
+            except ConnectionError:
+                pending.pop(request_id, None)
+                streams.pop(request_id, None)
+                await connection.close()
+                if attempt == CLIENT_RECONNECT_ATTEMPTS:
+                    raise
+                continue
+            return future
+        raise ConnectionError('Unable to send request')
+
+    async def _send(
+        self, endpoint: str, message: str, recipient: str, chat_name: str, since: Optional[int] = None, **fields: Any
+    ) -> str:
+        """
+        Отправка запроса.
+
+        :param endpoint: Эндпоинт сервера.
+        :param message: Сообщение.
+        :param recipient: Получатель.
+        :param chat_name: Название чата.
+        :param since: Номер сообщения, после которого нужно вернуть сообщения чата.
+        :param fields: Дополнительные поля запроса.
+        :return: Строковый ответ сервера.
+        """
+        request = self._build_request(endpoint, message, recipient, chat_name, since)
+        request.update(fields)
+        if self._persistent:
+            return await self._send_framed(request)
+        return await self._send_once(request)
+
+    async def close(self) -> None:
+        """
+        Закрытие долгоживущего соединения.
+
+        :return: None.
+        """
+        if self._connection is not None:
+            await self._connection.close()
+        if self._reader_task is not None:
+            await gather(self._reader_task, return_exceptions=True)
+
     async def connect_user(self) -> str:
         """
         Подключение пользователя к серверу.
@@ -56,32 +253,271 @@ class Client:
         """
         return await self._send(endpoint='connect', message='', recipient='', chat_name='')
 
-    async def get_status(self) -> str:
+    async def get_status(
+        self, offset: Optional[int] = None, limit: Optional[int] = None, version: Optional[int] = None
+    ) -> str:
         """
         Запрос статуса пользователя.
 
+        :param offset: Количество пропускаемых пользователей в списке.
+        :param limit: Размер страницы списка пользователей, если не указан - до конца списка.
+        :param version: Версия статуса из предыдущего ответа: вернутся только изменения после нее.
         :return: Строковый ответ сервера.
         """
-        return await self._send(endpoint='status', message='', recipient='', chat_name='')
+        return await self._send(
+            endpoint='status', message='', recipient='', chat_name='', offset=offset, limit=limit, version=version
+        )
 
-    async def send_message(self, text: str, recipient: str = ''):
+    async def send_message(
+        self, text: str, recipient: str = '', since: Optional[int] = None, attachment: Optional[str] = None
+    ):
         """
         Отправка сообщения.
 
         :param text: Текст сообщения.
         :param recipient: Получатель, если не указан, то отправляется всем.
+        :param since: Номер сообщения, после которого нужно вернуть сообщения чата,
+            если не указан - возвращаются непрочитанные сообщения.
+        :param attachment: Идентификатор загруженного методом upload вложения.
+        :return: Строковый ответ сервера.
+        """
+        return await self._send(
+            endpoint='send', message=text, recipient=recipient, chat_name='', since=since, attachment=attachment
+        )
+
+    async def submit_batch(self, messages: List[Dict[str, str]]) -> Future:
+        """
+        Отправка пакета сообщений без ожидания ответа: следующие пакеты можно отправлять, не дожидаясь
+        подтверждения предыдущих.
+
+        :param messages: Сообщения пакета: `{"text": ..., "recipient": ...}`, без получателя - в общий чат.
+        :return: Future с ответом сервера - статусами сообщений через пробел (номер сообщения в чате,
+            `R` - получатель не найден, `I` - некорректный элемент пакета).
+        """
+        request = self._build_request(endpoint='send_batch', message='', recipient='', chat_name='', messages=messages)
+        if self._persistent:
+            return await self._submit_framed(request)
+        return create_task(self._send_once(request))
+
+    async def send_batch(self, messages: List[Dict[str, str]]) -> str:
+        """
+        Отправка пакета сообщений.
+
+        :param messages: Сообщения пакета: `{"text": ..., "recipient": ...}`, без получателя - в общий чат.
+        :return: Статусы сообщений пакета через пробел.
+        """
+        future = await self.submit_batch(messages)
+        return await future
+
+    async def schedule_message(
+        self, text: str, recipient: str = '', send_time: Optional[str] = None, delay: Optional[int] = None
+    ) -> str:
+        """
+        Отложенная отправка сообщения.
+
+        :param text: Текст сообщения.
+        :param recipient: Получатель, если не указан, то отправляется всем.
+        :param send_time: Момент отправки в формате DATETIME_FORMAT.
+        :param delay: Задержка отправки в секундах, используется вместо send_time.
+        :return: Номер отложенного сообщения или сообщение об ошибке.
+        """
+        return await self._send(
+            endpoint='schedule_send', message=text, recipient=recipient, chat_name='', send_time=send_time,
+            delay=delay
+        )
+
+    async def cancel_scheduled(self, schedule_id: int) -> str:
+        """
+        Отмена отложенного сообщения.
+
+        :param schedule_id: Номер отложенного сообщения.
         :return: Строковый ответ сервера.
         """
-        return await self._send(endpoint='send', message=text, recipient=recipient, chat_name='')
+        return await self._send(
+            endpoint='cancel_scheduled', message='', recipient='', chat_name='', schedule_id=schedule_id
+        )
 
-    async def read_chat(self, chat_name: str) -> str:
+    async def read_chat(self, chat_name: str, since: Optional[int] = None) -> str:
         """
         Чтение чата.
 
         :param chat_name: Название чата.
+        :param since: Номер сообщения, после которого нужно вернуть сообщения чата,
+            если не указан - возвращаются непрочитанные сообщения.
+        :return: Строковый ответ сервера.
+        """
+        return await self._send(endpoint='read_chat', message='', recipient='', chat_name=chat_name, since=since)
+
+    async def read_history(
+        self, chat_name: str, since: int = 0, start_time: Optional[str] = None, limit: Optional[int] = None
+    ) -> str:
+        """
+        Чтение страницы истории чата, включая сообщения, вышедшие из горячего окна сервера.
+
+        :param chat_name: Название чата.
+        :param since: Номер сообщения, после которого нужно вернуть сообщения.
+        :param start_time: Наиболее раннее время отправки в формате DATETIME_FORMAT.
+        :param limit: Размер страницы.
         :return: Строковый ответ сервера.
         """
-        return await self._send(endpoint='read_chat', message='', recipient='', chat_name=chat_name)
+        return await self._send(
+            endpoint='history', message='', recipient='', chat_name=chat_name, since=since, start_time=start_time,
+            limit=limit
+        )
+
+    async def search(
+        self,
+        query: str,
+        chat_name: str = '',
+        sender: Optional[str] = None,
+        start_time: Optional[str] = None,
+        end_time: Optional[str] = None,
+        offset: Optional[int] = None,
+        limit: Optional[int] = None
+    ) -> str:
+        """
+        Поиск сообщений в чатах пользователя.
+
+        :param query: Слова через пробел, `слово*` - поиск по префиксу.
+        :param chat_name: Название чата, если не указано - поиск во всех чатах пользователя.
+        :param sender: Имя отправителя.
+        :param start_time: Начало интервала времени отправки в формате DATETIME_FORMAT.
+        :param end_time: Конец интервала времени отправки в формате DATETIME_FORMAT.
+        :param offset: Количество пропускаемых результатов.
+        :param limit: Размер страницы.
+        :return: Строковый ответ сервера.
+        """
+        return await self._send(
+            endpoint='search', message=query, recipient='', chat_name=chat_name, sender=sender,
+            start_time=start_time, end_time=end_time, offset=offset, limit=limit
+        )
+
+    async def _open_transfer(
+        self, endpoint: str, **fields: Any
+    ) -> Tuple[StreamReader, StreamWriter, FramedConnection]:
+        """
+        Открытие отдельного соединения передачи вложения и отправка кадра-заголовка запроса.
+
+        :param endpoint: Эндпоинт сервера: upload или download.
+        :param fields: Дополнительные поля запроса.
+        :return: Потоки чтения и записи и кадрированное соединение для заголовков.
+        """
+        reader, writer = await open_connection(self._server_host, self._server_port)
+        writer.write(TRANSFER_PROTOCOL_MARKER)
+        connection = FramedConnection(reader, writer)
+        await connection.write_frame({**self._build_request(endpoint, '', '', ''), **fields})
+        return reader, writer, connection
+
+    async def upload(self, path: str) -> str:
+        """
+        Загрузка файла на сервер через отдельное соединение; файл отправляется через loop.sendfile.
+
+        :param path: Путь к файлу.
+        :return: Идентификатор вложения для send_message или сообщение об ошибке.
+        """
+        size = getsize(path)
+        _, writer, connection = await self._open_transfer('upload', size=size)
+        try:
+            with open(path, 'rb') as file:
+                await get_running_loop().sendfile(writer.transport, file, 0, size)
+        except ConnectionError:
+            # Сервер мог отказать до приема файла и закрыть соединение: причина - в кадре-ответе.
+            pass
+        frame = await connection.read_frame()
+        await connection.close()
+        if frame is None:
+            raise ConnectionError('Connection closed by server')
+        return frame.get('attachment') or frame['response']
+
+    async def download(self, attachment: str, path: str) -> str:
+        """
+        Скачивание вложения в файл через отдельное соединение частями по ATTACHMENT_CHUNK_SIZE байт.
+
+        :param attachment: Идентификатор вложения.
+        :param path: Путь к файлу.
+        :return: Строковый ответ сервера.
+        """
+        reader, _, connection = await self._open_transfer('download', attachment=attachment)
+        try:
+            frame = await connection.read_frame()
+            if frame is None:
+                raise ConnectionError('Connection closed by server')
+            if frame['response'] != 'OK':
+                return frame['response']
+            remaining = frame['size']
+            with open(path, 'wb') as file:
+                while remaining:
+                    chunk = await reader.read(min(ATTACHMENT_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        raise ConnectionError('Connection closed in the middle of attachment')
+                    file.write(chunk)
+                    remaining -= len(chunk)
+            return 'OK'
+        finally:
+            await connection.close()
+
+    async def get_metrics(self) -> str:
+        """
+        Запрос метрик сервера.
+
+        :return: Метрики в текстовом формате Prometheus.
+        """
+        return await self._send(endpoint='metrics', message='', recipient='', chat_name='')
+
+    async def control_profiler(self, command: str = '') -> str:
+        """
+        Управление выборочным профилировщиком сервера.
+
+        :param command: `start`, `stop` или пустая строка для отчета.
+        :return: Строковый ответ сервера.
+        """
+        return await self._send(endpoint='profiler', message=command, recipient='', chat_name='')
+
+    async def _unsubscribe(self, chat_name: str) -> None:
+        """
+        Отмена подписки на чат; ошибки соединения игнорируются, т.к. при разрыве подписка отменяется сервером.
+
+        :param chat_name: Название чата.
+        :return: None.
+        """
+        try:
+            await self._send(endpoint='unsubscribe', message='', recipient='', chat_name=chat_name)
+        except ConnectionError:
+            pass
+
+    async def subscribe(self, chat_name: str) -> AsyncIterator[str]:
+        """
+        Подписка на новые сообщения чата.
+
+        Доступна только при долгоживущем соединении. При разрыве соединения или отключении подписки сервером
+        итерация завершается исключением ConnectionError.
+
+        :param chat_name: Название чата.
+        :return: Асинхронный итератор новых сообщений чата.
+        """
+        if not self._persistent:
+            raise RuntimeError('Subscriptions require a persistent connection')
+
+        stream: Queue = Queue()
+        response = await self._send_framed(
+            self._build_request(endpoint='subscribe', message='', recipient='', chat_name=chat_name), stream=stream
+        )
+        if response != 'OK':
+            raise ValueError(response)
+        try:
+            while True:
+                event = await stream.get()
+                if isinstance(event, Exception):
+                    raise event
+                if event['event'] == 'dropped':
+                    raise ConnectionError(event['response'])
+                yield event['response']
+        finally:
+            for request_id, registered_stream in list(self._streams.items()):
+                if registered_stream is stream:
+                    del self._streams[request_id]
+            if self._connection is not None and not self._connection.closed:
+                create_task(self._unsubscribe(chat_name))
 
     async def start_session(self) -> None:
         """
@@ -92,7 +528,10 @@ class Client:
         print(await self.connect_user())
 
         while True:
-            print('Выберите действие:\n1. Показать статус\n2. Отправить сообщение\n3. Показать чат\n4. Выход')
+            print(
+                'Выберите действие:\n1. Показать статус\n2. Отправить сообщение\n3. Показать чат\n'
+                '4. Найти сообщения\n5. Выход'
+            )
             action = input()
             if not action.isdigit():
                 continue
@@ -111,6 +550,9 @@ class Client:
                 chat_name = input('Название чата: ')
                 print(await self.read_chat(chat_name))
             elif action == 4:
+                query = input('Запрос: ')
+                print(await self.search(query))
+            elif action == 5:
                 break
 
 
@@ -119,12 +561,20 @@ def parse_args() -> Namespace:
     parser.add_argument('-c', '--client_name', type=str, help='Name of client')
     parser.add_argument('-s', '--server_host', type=str, default='127.0.0.1', help='Host of server')
     parser.add_argument('-p', '--server_port', type=int, default=8000, help='Port of server')
+    parser.add_argument(
+        '--legacy', action='store_true', help='Open a new connection for every request instead of a persistent one'
+    )
     return parser.parse_args()
 
 
 async def main() -> None:
     args = parse_args()
-    client = Client(client_name=args.client_name, server_host=args.server_host, server_port=args.server_port)
+    client = Client(
+        client_name=args.client_name,
+        server_host=args.server_host,
+        server_port=args.server_port,
+        persistent=not args.legacy
+    )
 
     try:
         await client.start_session()
@@ -132,6 +582,8 @@ async def main() -> None:
         pass
     except Exception as e:
         print(e)
+    finally:
+        await client.close()
     exit(0)
 
 
@@ -1,6 +1,32 @@
 from dataclasses import dataclass
+from dataclasses import fields
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Type
+from typing import TypeVar
 
+T = TypeVar('T')
 
+
+def _add_slots(cls: Type[T]) -> Type[T]:
+    """
+    Пересоздание класса данных со __slots__, как делает dataclass(slots=True), доступный только с Python 3.10.
+
+    Значения полей по умолчанию уже сохранены в сгенерированном __init__, поэтому атрибуты класса
+    с ними удаляются: иначе они конфликтуют со слотами.
+
+    :param cls: Класс данных.
+    :return: Класс данных со __slots__.
+    """
+    names = tuple(field.name for field in fields(cls))
+    namespace = {key: value for key, value in cls.__dict__.items() if key not in (*names, '__dict__', '__weakref__')}
+    namespace['__slots__'] = names
+    return type(cls)(cls.__name__, cls.__bases__, namespace)
+
+
+@_add_slots
 @dataclass
 class RequestDto:
     """
@@ -11,3 +37,17 @@ class RequestDto:
     message: str
     recipient: str
     chat_name: str
+    since: Optional[int] = None
+    messages: Optional[List[Dict[str, str]]] = None
+    offset: Optional[int] = None
+    limit: Optional[int] = None
+    version: Optional[int] = None
+    sender: Optional[str] = None
+    start_time: Optional[str] = None
+    end_time: Optional[str] = None
+    send_time: Optional[str] = None
+    delay: Optional[int] = None
+    schedule_id: Optional[int] = None
+    attachment: Optional[str] = None
+    size: Optional[int] = None
+    request_id: Any = None
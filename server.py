@@ -1,30 +1,126 @@
 from argparse import ArgumentParser
 from argparse import Namespace
+from asyncio import FIRST_COMPLETED
 from asyncio import StreamReader
 from asyncio import StreamWriter
+from asyncio import Task
+from asyncio import TimeoutError
+from asyncio import create_task
+from asyncio import gather
+from asyncio import get_running_loop
 from asyncio import run
+from asyncio import sleep
 from asyncio import start_server
+from asyncio import wait
+from asyncio import wait_for
+from datetime import datetime
+from heapq import nlargest
+from http import HTTPStatus
 from json import dumps
 from json import loads
-from logging import INFO
-from logging import StreamHandler
 from logging import getLogger
+from math import inf
+from os import fstat
+from os import rename
+from os.path import exists
 from signal import SIGINT
 from signal import signal
-from sys import stdout
+from time import monotonic
+from time import perf_counter
 from types import FrameType
+from typing import Any
 from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Set
+from typing import Tuple
+from typing import Union
 
 from builtin_types import Chat
-from builtin_types import ListAsyncIterator
+from builtin_types import ChatHistory
+from builtin_types import EncodedText
+from builtin_types import Message
+from builtin_types import Names
+from builtin_types import ScheduledMessage
+from builtin_types import SearchQuery
+from builtin_types import StatusView
 from builtin_types import User
+from builtin_types.message import MICROSECONDS
 from data_transfer_objects import RequestDto
+from settings import ATTACHMENT_MAX_SIZE
+from settings import ATTACHMENTS_PATH
+from settings import CONNECTION_MAX_IN_FLIGHT
+from settings import DATETIME_FORMAT
+from settings import FRAMED_PROTOCOL_MARKER
+from settings import GLOBAL_SEND_RATE_LIMIT
+from settings import GLOBAL_SEND_RATE_PERIOD
+from settings import HISTORY_ENABLED
+from settings import HISTORY_MAX_PAGE_SIZE
+from settings import HISTORY_PAGE_SIZE
+from settings import HISTORY_PATH
+from settings import HTTP_KEEP_ALIVE_TIMEOUT
+from settings import JOURNAL_COMPACTION_INTERVAL
+from settings import JOURNAL_COMPACTION_RECORDS
+from settings import JOURNAL_PATH
+from settings import LEGACY_REQUEST_MAX_SIZE
+from settings import LOG_LEVEL
+from settings import SCHEDULED_SEND_MAX_DELAY
+from settings import SEARCH_MAX_RESULTS
+from settings import SEARCH_PAGE_SIZE
+from settings import SEND_BATCH_MAX_SIZE
+from settings import SERVER_CONFIG_PATH
+from settings import SERVER_SNAPSHOT_PATH
+from settings import SERVER_WORKERS
+from settings import TRANSFER_PROTOCOL_MARKER
+from settings import USER_SEND_RATE_LIMIT
+from settings import USER_SEND_RATE_PERIOD
+from utils import AttachmentStore
+from utils import ExpiryScheduler
 from utils import Factories
+from utils import FramedConnection
+from utils import HttpConnection
+from utils import HttpError
+from utils import HttpRequest
+from utils import Journal
+from utils import LogPipeline
+from utils import Metrics
+from utils import RateLimiter
 from utils import RequestDtoRowMapper
+from utils import RequestError
+from utils import SamplingProfiler
+from utils import SendScheduler
+from utils import Snapshot
+from utils import Subscriber
 
 server_logger = getLogger(__name__)
-server_logger.setLevel(INFO)
-server_logger.addHandler(StreamHandler(stream=stdout))
+
+ENDPOINTS = (
+    'connect', 'status', 'send', 'send_batch', 'schedule_send', 'cancel_scheduled', 'read_chat', 'history',
+    'search', 'subscribe', 'unsubscribe', 'upload', 'download', 'metrics', 'profiler'
+)
+
+# Маршруты HTTP-интерфейса: путь - метод и эндпоинт.
+HTTP_ROUTES = {
+    b'/connect': (b'POST', 'connect'),
+    b'/status': (b'GET', 'status'),
+    b'/send': (b'POST', 'send'),
+    b'/send_batch': (b'POST', 'send_batch'),
+    b'/read_chat': (b'GET', 'read_chat'),
+    b'/history': (b'GET', 'history'),
+    b'/search': (b'GET', 'search'),
+    b'/metrics': (b'GET', 'metrics'),
+}
+
+# Ответ обработчика: строка или текст из закэшированных закодированных сообщений.
+Response = Union[str, EncodedText]
+# Найденное сообщение: количество совпавших слов запроса, время отправки и закодированная строка ответа.
+SearchResult = Tuple[int, int, bytes]
+# Ответ на запрос, обработка которого завершилась непредвиденной ошибкой.
+INTERNAL_ERROR = 'Internal server error'
+# Ключ чата для подписок: название общего чата или ключ пары участников приватного чата. Названия приватных чатов
+# разных пар могут совпадать, поэтому приватные чаты по названию не различаются.
+ChatKey = Union[str, Tuple[int, int]]
 
 
 class Server:
@@ -32,8 +128,21 @@ class Server:
     Сервер для обмена сообщениями с другими клиентами.
     """
 
-    def __init__(self, host: str, port: int, common_chat: Chat, private_chats: Dict[str, Chat], users: Dict[str, User]):
-        server_logger.info(f'Create server on {host}:{port}')
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        common_chat: Chat,
+        private_chats: Dict[Tuple[int, int], Chat],
+        users: Dict[str, User],
+        journal: Optional[Journal] = None,
+        snapshot_path: str = SERVER_SNAPSHOT_PATH,
+        user_send_limit: Optional[int] = USER_SEND_RATE_LIMIT,
+        global_send_limit: Optional[int] = GLOBAL_SEND_RATE_LIMIT,
+        attachments_path: str = ATTACHMENTS_PATH,
+        history_path: Optional[str] = None
+    ):
+        server_logger.info('Create server on %s:%s', host, port)
 
         self._host = host
         self._port = port
@@ -41,48 +150,406 @@ class Server:
         self._common_chat = common_chat
         self._private_chats = private_chats
         self._users = users
+        self._status_view = StatusView(users.values())
+        self._subscribers: Dict[ChatKey, Set[Subscriber]] = dict()
+        self._journal = journal
+        # Сдвиги курсоров прочитанных сообщений, еще не записанные в журнал: (пользователь, чат) -> номер.
+        self._read_cursors: Dict[Tuple[str, str], int] = dict()
+        self._snapshot_path = snapshot_path
+        self._reuse_port = False
+        self._user_limiter = RateLimiter(user_send_limit, USER_SEND_RATE_PERIOD) if user_send_limit else None
+        self._global_limiter = RateLimiter(global_send_limit, GLOBAL_SEND_RATE_PERIOD) if global_send_limit else None
+        self._rate_limited_requests = 0
+        self._bad_requests = 0
+        self._failed_requests = 0
+        self._attachments = AttachmentStore(attachments_path)
+        self._history_path = history_path
+        self._attach_history([common_chat, *private_chats.values()])
+
+        self._metrics = Metrics()
+        self._expiry = ExpiryScheduler(expire=self._actualize, metrics=self._metrics)
+        self._scheduler = SendScheduler(deliver=self._deliver_scheduled, metrics=self._metrics)
+        self._profiler = SamplingProfiler()
+        self._connections: Set[Union[FramedConnection, HttpConnection]] = set()
+        self._connected_clients = 0
+        self._bytes_received = 0
+        self._bytes_sent = 0
 
     def update_from_config(self) -> None:
         """
-        Обновление сервера из конфигурационного файла.
+        Обновление сервера из снимка состояния и журнала событий.
+
+        Снимок читается потоково: пользователи загружаются сразу, а сообщения чата - при первом обращении к нему.
+        Если снимка нет, состояние загружается из конфигурационного файла прежнего формата.
+        Затем применяются события журнала, записанные после снимка.
 
         :return: None.
         """
         server_logger.info('Update server from config')
+        started = perf_counter()
+
+        snapshot_lsn = 0
+        snapshot = Snapshot.read(self._snapshot_path)
+        if snapshot is not None:
+            self._host = snapshot['host']
+            self._port = snapshot['port']
+            chats = [Factories.get_chat_from_snapshot(chat_header) for chat_header in snapshot['chats']]
+            self._common_chat = chats[0]
+            self._users = {user['name']: Factories.get_user_from_dict(user) for user in snapshot['users']}
+            self._private_chats = self._index_private_chats(chats[1:])
+            self._restore_scheduled(snapshot['scheduled'], snapshot.get('scheduled_id', 0))
+            snapshot_lsn = snapshot['lsn']
+        else:
+            snapshot_lsn = self._update_from_legacy_config()
+        self._status_view = StatusView(self._users.values())
+        self._migrate_history()
+        self._attach_history([self._common_chat, *self._private_chats.values()])
 
+        if self._journal is None:
+            return
+        self._journal.last_lsn = snapshot_lsn
+        replayed = 0
+        for event in self._journal.read(after_lsn=snapshot_lsn):
+            self._apply_event(event)
+            self._journal.last_lsn = event['lsn']
+            replayed += 1
+        server_logger.info(
+            'Recovered snapshot (lsn %s) and %s journal events in %.3f s',
+            snapshot_lsn, replayed, perf_counter() - started
+        )
+
+    def _update_from_legacy_config(self) -> int:
+        """
+        Обновление сервера из конфигурационного файла прежнего формата (JSON).
+
+        :return: Номер последнего события журнала, учтенного в файле.
+        """
         try:
-            with open('server_config.json', 'r') as file:
+            with open(SERVER_CONFIG_PATH, 'r') as file:
                 server_dict = loads(file.read())
             self._host = server_dict['host']
             self._port = server_dict['port']
             self._common_chat = Factories.get_chat_from_dict(server_dict['common_chat'])
-            self._private_chats = {
-                private_chat['name']: Factories.get_chat_from_dict(
-                    private_chat
-                ) for private_chat in server_dict['private_chats']
-            }
             self._users = {
                 user['name']: Factories.get_user_from_dict(user) for user in server_dict['users']
             }
+            self._private_chats = self._index_private_chats(
+                [Factories.get_chat_from_dict(private_chat) for private_chat in server_dict['private_chats']]
+            )
+            self._restore_scheduled(server_dict.get('scheduled', list()), server_dict.get('scheduled_id', 0))
+            return server_dict.get('lsn', 0)
         except FileNotFoundError:
             server_logger.error('Config file not found')
+            return 0
 
-    def save_to_config(self) -> None:
+    def _restore_scheduled(self, messages: List[Dict[str, Any]], last_id: int) -> None:
         """
-        Сохранение сервера в конфигурационный файл.
+        Восстановление очереди отложенных сообщений.
 
+        :param messages: Отложенные сообщения в формате словарей.
+        :param last_id: Последний выданный номер отложенного сообщения.
         :return: None.
         """
-        server_logger.info('Save server to config')
-        server_dict = {
+        for message in messages:
+            self._scheduler.add(ScheduledMessage(**message))
+        self._scheduler.last_id = last_id
+
+    def _attach_history(self, chats: Iterable[Chat]) -> None:
+        """
+        Подключение холодной истории к чатам, если она включена.
+
+        :param chats: Чаты.
+        :return: None.
+        """
+        if self._history_path is None:
+            return
+        for chat in chats:
+            if chat.history is None:
+                chat.history = ChatHistory(ChatHistory.get_path(self._history_path, chat.name, chat.members))
+
+    def _migrate_history(self) -> None:
+        """
+        Перенос каталогов холодной истории приватных чатов прежнего формата, названных хэшем названия чата,
+        в каталоги пары участников.
+
+        Каталог, название которого совпадает у нескольких чатов, не переносится: в нем могут быть смешаны
+        сообщения разных пар.
+
+        :return: None.
+        """
+        if self._history_path is None:
+            return
+        chats_by_name: Dict[str, List[Chat]] = dict()
+        for chat in self._private_chats.values():
+            chats_by_name.setdefault(chat.name, list()).append(chat)
+        for chat_name, chats in chats_by_name.items():
+            legacy_path = ChatHistory.get_path(self._history_path, chat_name)
+            if not exists(legacy_path):
+                continue
+            if len(chats) > 1:
+                server_logger.warning('History of chats named %s is shared by several pairs, not migrated', chat_name)
+                continue
+            path = ChatHistory.get_path(self._history_path, chat_name, chats[0].members)
+            if not exists(path):
+                rename(legacy_path, path)
+
+    def _sync_history(self) -> None:
+        """
+        Синхронная запись на диск холодной истории чатов перед записью снимка при остановке сервера: сообщения,
+        перенесенные в историю, в снимок не попадают.
+
+        :return: None.
+        """
+        for chat in [self._common_chat, *self._private_chats.values()]:
+            if chat.history is not None:
+                chat.history.sync()
+
+    async def _flush_history(self) -> bool:
+        """
+        Запись на диск холодной истории чатов в пуле потоков перед записью снимка во время работы сервера.
+
+        :return: False, если историю записать не удалось и снимок писать нельзя.
+        """
+        try:
+            for chat in [self._common_chat, *self._private_chats.values()]:
+                if chat.history is not None:
+                    await chat.history.flush(durable=True)
+        except OSError:
+            server_logger.exception('Unable to write chat history, snapshot skipped')
+            return False
+        return True
+
+    @staticmethod
+    def _get_pair_key(first_name: str, second_name: str) -> Tuple[int, int]:
+        """
+        Ключ приватного чата: упорядоченная пара номеров участников в таблице имен, не зависящая от порядка
+        участников и от того, какие символы встречаются в их именах.
+
+        :param first_name: Имя первого участника.
+        :param second_name: Имя второго участника.
+        :return: Ключ чата.
+        """
+        first_id = Names.get_id(first_name)
+        second_id = Names.get_id(second_name)
+        return (first_id, second_id) if first_id <= second_id else (second_id, first_id)
+
+    def _index_private_chats(self, chats: List[Chat]) -> Dict[Tuple[int, int], Chat]:
+        """
+        Построение индекса приватных чатов по паре участников.
+
+        В сохранениях прежнего формата участники чата не записаны: они определяются по индексам чатов пользователей.
+
+        :param chats: Приватные чаты.
+        :return: Словарь "ключ пары участников - чат".
+        """
+        legacy_members: Dict[str, List[str]] = dict()
+        if not all(chat.members for chat in chats):
+            for user in self._users.values():
+                for chat_name in user.chats:
+                    partner_name = user.get_partner(chat_name)
+                    if partner_name is not None:
+                        members = [user.name, partner_name]
+                        if Factories.get_private_chat_name(*members) != chat_name:
+                            members.reverse()
+                        legacy_members[chat_name] = members
+        private_chats = dict()
+        for chat in chats:
+            if not chat.members:
+                chat.members = legacy_members.get(chat.name)
+            if chat.members:
+                private_chats[self._get_pair_key(*chat.members)] = chat
+        return private_chats
+
+    def _get_snapshot(self) -> Dict[str, Any]:
+        """
+        Снимок состояния сервера.
+
+        :return: Словарь с состоянием сервера.
+        """
+        return {
             'host': self._host,
             'port': self._port,
             'common_chat': self._common_chat.to_dict(),
             'private_chats': [private_chat.to_dict() for private_chat in self._private_chats.values()],
             'users': [user.to_dict() for user in self._users.values()],
+            'scheduled': [message.to_dict() for message in self._scheduler.messages],
+            'scheduled_id': self._scheduler.last_id,
         }
-        with open('server_config.json', 'w') as file:
-            file.write(dumps(server_dict, indent=4))
+
+    def save_to_config(self) -> None:
+        """
+        Сохранение сервера в конфигурационный файл.
+
+        :return: None.
+        """
+        server_logger.info('Save server to config')
+        self._sync_history()
+        server_dict = self._get_snapshot()
+        server_dict['lsn'] = self._journal.last_lsn if self._journal is not None else 0
+        Snapshot.write(self._snapshot_path, server_dict)
+
+    def _record(self, event_type: str, **event: Any) -> None:
+        """
+        Запись события в журнал, если он включен.
+
+        :param event_type: Тип события.
+        :param event: Данные события.
+        :return: None.
+        """
+        if self._journal is not None:
+            self._journal.append({'type': event_type, **event})
+
+    def _get_chat_key(self, members: Optional[List[str]]) -> ChatKey:
+        """
+        Ключ чата по его участникам.
+
+        :param members: Участники приватного чата, None - для общего чата.
+        :return: Ключ чата.
+        """
+        return self._get_pair_key(*members) if members else self._common_chat.name
+
+    def _find_chat_key(self, user: User, chat_name: str) -> Optional[ChatKey]:
+        """
+        Поиск ключа чата по названию через индекс чатов пользователя.
+
+        :param user: Объект пользователя.
+        :param chat_name: Название чата.
+        :return: Ключ чата или None, если у пользователя нет такого чата.
+        """
+        if chat_name == self._common_chat.name:
+            return self._common_chat.name
+        partner_name = user.get_partner(chat_name)
+        if partner_name is None:
+            return None
+        return self._get_pair_key(user.name, partner_name)
+
+    def _get_chat(self, chat_name: str, user_name: Optional[str]) -> Optional[Chat]:
+        """
+        Поиск чата по названию через индекс чатов участника.
+
+        :param chat_name: Название чата.
+        :param user_name: Имя участника чата.
+        :return: Объект чата или None.
+        """
+        if chat_name == self._common_chat.name:
+            return self._common_chat
+        user = self._users.get(user_name) if user_name is not None else None
+        partner_name = user.get_partner(chat_name) if user is not None else None
+        if partner_name is None:
+            return None
+        return self._private_chats.get(self._get_pair_key(user_name, partner_name))  # type: ignore
+
+    def _apply_event(self, event: Dict[str, Any]) -> None:
+        """
+        Применение события журнала при восстановлении.
+
+        :param event: Событие журнала.
+        :return: None.
+        """
+        event_type = event['type']
+        if event_type == 'connect':
+            self._add_user(User(
+                name=event['user'],
+                creation_datetime=Factories.get_datetime(event['time']),
+                chats=[self._common_chat.name]
+            ))
+        elif event_type == 'chat':
+            self._add_private_chat(Factories.get_private_chat_name(*event['members']), event['members'])
+        elif event_type == 'send':
+            message = Message.from_timestamp(
+                timestamp=Message.get_stored_timestamp(event['time']),
+                sender_name=event['sender'],
+                text=event['text'],
+                seq=event.get('seq', 0),
+                attachment=event.get('attachment')
+            )
+            chat = self._get_chat(event['chat'], event['sender'])
+            if message.seq:
+                chat.add_replica_message(message)  # type: ignore
+            else:
+                chat.add_message(message)  # type: ignore
+        elif event_type in ('cursors', 'read'):
+            self._apply_cursor_event(event)
+        elif event_type == 'expire':
+            # В событиях прежнего формата нет участника приватного чата; такие чаты актуализируются при чтении.
+            chat = self._get_chat(event['chat'], event.get('user'))
+            if chat is not None:
+                chat.expire_through(event['seq'])
+        elif event_type in ('schedule', 'unschedule'):
+            self._apply_scheduler_event(event)
+
+    def _apply_cursor_event(self, event: Dict[str, Any]) -> None:
+        """
+        Применение события сдвига курсоров прочитанных сообщений.
+
+        :param event: Событие журнала.
+        :return: None.
+        """
+        if event['type'] == 'read':
+            # Событие прежнего формата: один сдвиг курсора на каждое чтение.
+            self._users[event['user']].move_read_cursor(event['chat'], event['seq'])
+            return
+        for user_name, chat_name, seq in event['cursors']:
+            self._users[user_name].move_read_cursor(chat_name, seq)
+
+    def _apply_scheduler_event(self, event: Dict[str, Any]) -> None:
+        """
+        Применение события очереди отложенных сообщений: постановки в очередь, отмены или отправки.
+
+        :param event: Событие журнала.
+        :return: None.
+        """
+        if event['type'] == 'schedule':
+            self._scheduler.add(ScheduledMessage(
+                schedule_id=event['schedule_id'],
+                sender=event['sender'],
+                recipient=event['recipient'],
+                text=event['text'],
+                send_at=event['send_at']
+            ))
+        else:
+            for schedule_id in event['ids']:
+                self._scheduler.cancel(schedule_id)
+
+    def _actualize(self, chat: Chat, limit: Optional[int] = None) -> int:
+        """
+        Удаление устаревших сообщений чата с записью события в журнал.
+
+        В событии указывается участник приватного чата: по его индексу чатов чат находится при восстановлении.
+
+        :param chat: Объект чата.
+        :param limit: Наибольшее количество удаляемых сообщений.
+        :return: Количество удаленных сообщений.
+        """
+        expired = chat.actualize(limit)
+        if expired:
+            user_name = chat.members[0] if chat.members else None
+            self._record('expire', chat=chat.name, user=user_name, seq=chat.first_seq - 1)
+        return expired
+
+    async def _compact_journal(self) -> None:
+        """
+        Периодическая запись снимка состояния и очистка журнала.
+
+        Снимок пишется при накоплении JOURNAL_COMPACTION_RECORDS событий или раз в JOURNAL_COMPACTION_INTERVAL
+        секунд, если были новые события, что ограничивает размер журнала и время восстановления. Журнал пишет
+        снимок после записи холодной истории в пуле потоков: сообщения, перенесенные в историю после снятия
+        снимка, в нем еще есть. Накопленные сдвиги курсоров прочитанных сообщений записываются в журнал раз
+        в секунду одним событием.
+
+        :return: None.
+        """
+        last_compaction = monotonic()
+        while True:
+            await sleep(1)
+            self._record_read_cursors()
+            records = self._journal.records_since_snapshot  # type: ignore
+            if records >= JOURNAL_COMPACTION_RECORDS or (
+                records and monotonic() - last_compaction >= JOURNAL_COMPACTION_INTERVAL
+            ):
+                self._journal.compact(self._get_snapshot(), create_task(self._flush_history()))  # type: ignore
+                last_compaction = monotonic()
+                server_logger.info('Journal compacted, stats: %s', self._journal.stats)  # type: ignore
 
     async def _connect(self, request_dto: RequestDto) -> str:
         """
@@ -91,131 +558,1236 @@ class Server:
         :param request_dto: Объект запроса.
         :return: Строковый ответ.
         """
-        server_logger.info(f'Client {request_dto.client_name} connected')
+        server_logger.info('Client %s connected', request_dto.client_name)
+        if not request_dto.client_name:
+            return 'Client name is required'
         if request_dto.client_name in self._users.keys():
             return 'User already exists'
-        self._users[request_dto.client_name] = User(name=request_dto.client_name, chats=[self._common_chat.name])
+        self._register_user(request_dto.client_name)
         return 'OK'
 
+    def _register_user(self, user_name: str, creation_datetime: Optional[datetime] = None) -> User:
+        """
+        Регистрация пользователя с записью события в журнал.
+
+        :param user_name: Имя пользователя.
+        :param creation_datetime: Время регистрации, по умолчанию - текущее.
+        :return: Объект пользователя.
+        """
+        user = User(name=user_name, creation_datetime=creation_datetime, chats=[self._common_chat.name])
+        self._add_user(user)
+        self._record('connect', user=user.name, time=Message.get_timestamp(user.creation_datetime))
+        return user
+
+    def _add_user(self, user: User) -> None:
+        """
+        Добавление пользователя в список пользователей и представление статуса.
+
+        :param user: Объект пользователя.
+        :return: None.
+        """
+        self._users[user.name] = user
+        self._status_view.add_user(user.name)
+
     async def _get_status(self, request_dto: RequestDto) -> str:
         """
-        Запрос статуса пользователя.
+        Запрос статуса пользователя: чаты пользователя, страница списка остальных пользователей и версия статуса.
+
+        Если указана версия, полученная ранее, возвращаются только изменения после нее: новые чаты пользователя
+        и новые пользователи. Если изменения с этой версии уже не хранятся, возвращается полный статус.
+
+        :param request_dto: Объект запроса, страница задается полями offset и limit, версия - полем version.
+        :return: Строковый ответ.
+        """
+        server_logger.info('Client %s requested status', request_dto.client_name)
+        if request_dto.client_name not in self._users.keys():
+            return 'User not found'
+        changes = None
+        if request_dto.version is not None:
+            changes = self._status_view.get_changes(request_dto.version, request_dto.client_name)
+        if changes is not None:
+            chats, users = changes
+        else:
+            chats = self._users[request_dto.client_name].chats
+            users = self._status_view.get_users(request_dto.offset or 0, request_dto.limit)
+        other_users = [user_name for user_name in users if user_name != request_dto.client_name]
+        return (
+            'Chats:\n' + '\n'.join(chats) + '\n\nUsers:\n' + '\n'.join(other_users)
+            + f'\n\nVersion: {self._status_view.version}'
+        )
+
+    def _get_since(self, request_dto: RequestDto, chat_name: str) -> int:
+        """
+        Номер сообщения, после которого клиенту нужно вернуть сообщения чата.
 
         :param request_dto: Объект запроса.
+        :param chat_name: Название чата.
+        :return: Номер, указанный в запросе, иначе - курсор прочитанных сообщений пользователя.
+        """
+        if request_dto.since is not None:
+            return request_dto.since
+        return self._users[request_dto.client_name].get_read_cursor(chat_name)
+
+    def _mark_read(self, user: User, chat_name: str, last_seq: int) -> None:
+        """
+        Отметка возвращенных сообщений прочитанными.
+
+        :param user: Объект пользователя.
+        :param chat_name: Название чата.
+        :param last_seq: Номер последнего возвращенного сообщения, 0 - если сообщений не было.
+        :return: None.
+        """
+        if last_seq:
+            user.move_read_cursor(chat_name, last_seq)
+            if self._journal is not None:
+                self._read_cursors[(user.name, chat_name)] = last_seq
+
+    def _record_read_cursors(self) -> None:
+        """
+        Запись накопленных сдвигов курсоров прочитанных сообщений в журнал одним событием.
+
+        :return: None.
+        """
+        if self._read_cursors:
+            cursors = [[user_name, chat_name, seq] for (user_name, chat_name), seq in self._read_cursors.items()]
+            self._read_cursors.clear()
+            self._record('cursors', cursors=cursors)
+
+    @staticmethod
+    def _render(messages: Iterable[Message]) -> EncodedText:
+        """
+        Формирование ответа из закэшированных закодированных сообщений без форматирования строк.
+
+        :param messages: Сообщения.
+        :return: Закодированный ответ.
+        """
+        return EncodedText.from_messages(messages)
+
+    def _record_message(self, chat_name: str, message: Message, replica: bool = False) -> None:
+        """
+        Запись нового сообщения в журнал; вложение записывается, только если оно есть.
+
+        :param chat_name: Название чата.
+        :param message: Объект сообщения.
+        :param replica: Номер сообщения назначен в другом процессе и записывается в событие.
+        :return: None.
+        """
+        event = {
+            'chat': chat_name, 'sender': message.sender, 'text': message.text, 'time': message.timestamp
+        }
+        if replica:
+            event['seq'] = message.seq
+        if message.attachment is not None:
+            event['attachment'] = message.attachment
+        self._record('send', **event)
+
+    def _append(self, chat: Chat, message: Message) -> None:
+        """
+        Добавление сообщения в чат с записью в журнал и рассылкой.
+
+        :param chat: Объект чата.
+        :param message: Объект сообщения.
+        :return: None.
+        """
+        chat.add_message(message)
+        self._expiry.watch(chat)
+        self._record_message(chat.name, message)
+        self._on_message_added(chat, message)
+
+    def _on_message_added(self, chat: Chat, message: Message) -> None:
+        """
+        Обработка добавления нового сообщения: рассылка подписчикам.
+
+        :param chat: Объект чата.
+        :param message: Объект сообщения.
+        :return: None.
+        """
+        self._publish(self._get_chat_key(chat.members), message)
+
+    def _owns_private_chat(self, members: List[str]) -> bool:
+        """
+        Хранятся ли сообщения приватного чата на этом сервере.
+
+        :param members: Участники чата.
+        :return: True - для единственного сервера.
+        """
+        return True
+
+    def _add_private_chat(self, chat_name: str, members: List[str]) -> None:
+        """
+        Добавление приватного чата участникам и, если чат хранится на этом сервере, в список чатов.
+
+        :param chat_name: Название чата.
+        :param members: Участники чата.
+        :return: None.
+        """
+        pair_key = self._get_pair_key(*members)
+        if self._owns_private_chat(members) and pair_key not in self._private_chats:
+            self._private_chats[pair_key] = Factories.get_empty_private_chat(*members)
+            self._attach_history([self._private_chats[pair_key]])
+        first_name, second_name = members
+        for member, partner_name in ((first_name, second_name), (second_name, first_name)):
+            if member in self._users and not self._users[member].has_chat(chat_name):
+                self._users[member].add_chat(chat_name, partner_name)
+                self._status_view.add_chat(member, chat_name)
+
+    def _get_or_create_private_chat(self, sender_name: str, recipient_name: str) -> Chat:
+        """
+        Поиск приватного чата двух пользователей, при отсутствии - создание.
+
+        :param sender_name: Имя отправителя.
+        :param recipient_name: Имя получателя.
+        :return: Объект чата.
+        """
+        pair_key = self._get_pair_key(sender_name, recipient_name)
+        chat = self._private_chats.get(pair_key)
+        if chat is not None:
+            return chat
+        members = [sender_name, recipient_name]
+        chat_name = Factories.get_private_chat_name(*members)
+        self._add_private_chat(chat_name, members)
+        self._record('chat', members=members)
+        self._on_private_chat_created(chat_name, members)
+        return self._private_chats[pair_key]
+
+    def _on_private_chat_created(self, chat_name: str, members: List[str]) -> None:
+        """
+        Обработка создания приватного чата.
+
+        :param chat_name: Название чата.
+        :param members: Участники чата.
+        :return: None.
+        """
+
+    async def _append_common(self, messages: List[Message]) -> None:
+        """
+        Добавление сообщений в общий чат.
+
+        :param messages: Объекты сообщений.
+        :return: None.
+        """
+        for message in messages:
+            self._append(self._common_chat, message)
+
+    async def _append_private(self, sender_name: str, recipient_name: str, messages: List[Message]) -> str:
+        """
+        Добавление сообщений в приватный чат отправителя и получателя.
+
+        :param sender_name: Имя отправителя.
+        :param recipient_name: Имя получателя.
+        :param messages: Объекты сообщений.
+        :return: Название чата.
+        """
+        chat = self._get_or_create_private_chat(sender_name, recipient_name)
+        for message in messages:
+            self._append(chat, message)
+        return chat.name
+
+    def _read_common(self, user: User, since: int) -> Response:
+        """
+        Чтение общего чата с отметкой прочитанных сообщений.
+
+        :param user: Объект пользователя.
+        :param since: Номер сообщения, после которого нужно вернуть сообщения.
         :return: Строковый ответ.
         """
-        server_logger.info(f'Client {request_dto.client_name} requested status')
-        if request_dto.client_name in self._users.keys():
-            chats = await self._users[request_dto.client_name].chats
-            users_iterator = ListAsyncIterator(list(self._users.values()))
-            other_users = [user.name async for user in users_iterator if user.name != request_dto.client_name]
-            return 'Chats:\n' + '\n'.join(chats) + '\n\nUsers:\n' + '\n'.join(other_users)
-        return 'User not found'
+        messages = self._common_chat.get_messages(user_registration_datetime=user.creation_datetime, since=since)
+        self._expiry.watch(self._common_chat)
+        self._mark_read(user, self._common_chat.name, messages.last_seq if messages else 0)
+        return self._render(messages)
 
-    async def _send(self, request_dto: RequestDto) -> str:
+    async def _read_private(self, user_name: str, partner_name: str, since: int) -> Tuple[Response, int]:
+        """
+        Чтение приватного чата.
+
+        :param user_name: Имя участника чата, от имени которого выполняется чтение.
+        :param partner_name: Имя второго участника чата.
+        :param since: Номер сообщения, после которого нужно вернуть сообщения.
+        :return: Строковый ответ и номер последнего возвращенного сообщения.
+        """
+        chat = self._private_chats[self._get_pair_key(user_name, partner_name)]
+        messages = chat.get_messages(since=since)
+        self._expiry.watch(chat)
+        return self._render(messages), messages.last_seq if messages else 0
+
+    async def _send(self, request_dto: RequestDto) -> Response:
         """
         Отправка сообщения.
 
         :param request_dto: Объект запроса.
         :return: Строковый ответ.
         """
-        server_logger.info(f'Client {request_dto.client_name} sent message to {request_dto.recipient}')
+        server_logger.info('Client %s sent message to %s', request_dto.client_name, request_dto.recipient)
 
+        if request_dto.attachment and not self._attachments.exists(request_dto.attachment):
+            return 'Attachment not found'
+        user = self._users[request_dto.client_name]
+        message = Factories.get_message_from_request(request_dto.client_name, request_dto)
         if not request_dto.recipient:
-            messages = await self._common_chat.add_message(
-                message=await Factories.get_message_from_request(request_dto.client_name, request_dto),
-                user_registration_datetime=self._users[request_dto.client_name].creation_datetime
+            await self._append_common([message])
+            return self._read_common(user, self._get_since(request_dto, self._common_chat.name))
+        elif request_dto.recipient in self._users.keys():
+            chat_name = await self._append_private(request_dto.client_name, request_dto.recipient, [message])
+            result, last_seq = await self._read_private(
+                request_dto.client_name, request_dto.recipient, self._get_since(request_dto, chat_name)
             )
-            messages_iterator = ListAsyncIterator(list(messages))
-            await self._common_chat.actualize()
-            return '\n'.join([str(msg) async for msg in messages_iterator])
+            self._mark_read(user, chat_name, last_seq)
+            return result
         else:
-            if request_dto.recipient in self._users.keys():
-                chat_name: str
-                if f'{request_dto.client_name} and {request_dto.recipient}' in self._private_chats.keys():
-                    chat_name = f'{request_dto.client_name} and {request_dto.recipient}'
-                elif f'{request_dto.recipient} and {request_dto.client_name}' in self._private_chats.keys():
-                    chat_name = f'{request_dto.recipient} and {request_dto.client_name}'
-                else:
-                    new_chat = await Factories.get_empty_private_chat(request_dto.client_name, request_dto.recipient)
-                    self._private_chats[new_chat.name] = new_chat
-                    chat_name = new_chat.name
-                    await self._users[request_dto.client_name].add_chat(chat=new_chat)
-                    await self._users[request_dto.recipient].add_chat(chat=new_chat)
-                messages = await self._private_chats[chat_name].add_message(
-                    message=await Factories.get_message_from_request(request_dto.client_name, request_dto)
-                )
-                messages_iterator = ListAsyncIterator(list(messages))
-                await self._private_chats[chat_name].actualize()
-                return '\n'.join([str(msg) async for msg in messages_iterator])
+            return 'Recipient not found'
+
+    async def _send_batch(self, request_dto: RequestDto) -> str:
+        """
+        Отправка пакета сообщений в общий чат и приватные чаты.
+
+        Сообщения группируются по получателю и добавляются в чат каждой группы за один проход; непрочитанные
+        сообщения не возвращаются. Ответ - статусы сообщений пакета через пробел: номер сообщения в чате,
+        `R` - получатель не найден, `I` - некорректный элемент пакета.
+
+        :param request_dto: Объект запроса, сообщения - в поле messages (`{"text": ..., "recipient": ...}`).
+        :return: Строковый ответ.
+        """
+        items = request_dto.messages
+        if not isinstance(items, list) or len(items) > SEND_BATCH_MAX_SIZE:
+            return f'Batch must be a list of at most {SEND_BATCH_MAX_SIZE} messages'
+        server_logger.info('Client %s sent batch of %s messages', request_dto.client_name, len(items))
+
+        statuses = ['I'] * len(items)
+        groups: Dict[str, List[Tuple[int, Message]]] = dict()
+        sending_time = datetime.now()
+        for index, item in enumerate(items):
+            if not isinstance(item, dict) or not isinstance(item.get('text'), str):
+                continue
+            recipient_name = item.get('recipient')
+            if recipient_name is None:
+                recipient_name = ''
+            elif not isinstance(recipient_name, str):
+                continue
+            if recipient_name and recipient_name not in self._users:
+                statuses[index] = 'R'
+                continue
+            message = Message(sending_time=sending_time, sender_name=request_dto.client_name, text=item['text'])
+            groups.setdefault(recipient_name, list()).append((index, message))
+
+        for recipient_name, group in groups.items():
+            messages = [message for _, message in group]
+            if recipient_name:
+                await self._append_private(request_dto.client_name, recipient_name, messages)
+            else:
+                await self._append_common(messages)
+            for index, message in group:
+                statuses[index] = str(message.seq)
+        return ' '.join(statuses)
+
+    async def _schedule_send(self, request_dto: RequestDto) -> str:
+        """
+        Отложенная отправка сообщения.
+
+        Момент отправки задается полем send_time в формате DATETIME_FORMAT или задержкой в секундах в поле delay,
+        но не позже чем через SCHEDULED_SEND_MAX_DELAY секунд. В этот момент сообщение добавляется в чат так же,
+        как запросом send.
+
+        :param request_dto: Объект запроса.
+        :return: Номер отложенного сообщения для отмены или сообщение об ошибке.
+        """
+        server_logger.info('Client %s scheduled message to %s', request_dto.client_name, request_dto.recipient)
+
+        if request_dto.recipient and request_dto.recipient not in self._users:
+            return 'Recipient not found'
+        now = Message.get_timestamp(datetime.now())
+        if request_dto.delay is not None:
+            send_at = now + request_dto.delay * MICROSECONDS
+        else:
+            try:
+                send_at = self._get_request_time(request_dto.send_time)  # type: ignore
+            except ValueError:
+                return f'Time must be in format {DATETIME_FORMAT}'
+            if send_at is None:
+                return 'Send time or delay is required'
+        if not 0 <= send_at - now <= SCHEDULED_SEND_MAX_DELAY * MICROSECONDS:
+            return f'Send time must be within {SCHEDULED_SEND_MAX_DELAY} s from now'
+        message = self._scheduler.schedule(
+            request_dto.client_name, request_dto.recipient, request_dto.message, send_at
+        )
+        self._record('schedule', **message.to_dict())
+        return str(message.schedule_id)
+
+    async def _cancel_scheduled(self, request_dto: RequestDto) -> str:
+        """
+        Отмена отложенного сообщения; отменить можно только свое сообщение, которое еще не отправлено.
+
+        :param request_dto: Объект запроса, номер сообщения - в поле schedule_id.
+        :return: Строковый ответ.
+        """
+        server_logger.info(
+            'Client %s cancelled scheduled message %s', request_dto.client_name, request_dto.schedule_id
+        )
+
+        message = self._scheduler.get(request_dto.schedule_id) if request_dto.schedule_id is not None else None
+        if message is None or message.sender != request_dto.client_name:
+            return 'Scheduled message not found'
+        self._scheduler.cancel(message.schedule_id)
+        self._record('unschedule', ids=[message.schedule_id])
+        return 'OK'
+
+    async def _deliver_scheduled(self, scheduled_messages: List[ScheduledMessage]) -> None:
+        """
+        Отправка наступивших отложенных сообщений.
+
+        Сообщения группируются по отправителю и получателю и добавляются в чат каждой группы за один проход, как
+        пакет send_batch. Отправка отмечается в журнале до добавления сообщений, поэтому после сбоя сообщение
+        не отправляется повторно.
+
+        :param scheduled_messages: Отложенные сообщения в порядке момента отправки.
+        :return: None.
+        """
+        self._record('unschedule', ids=[message.schedule_id for message in scheduled_messages])
+        groups: Dict[Tuple[str, str], List[Message]] = dict()
+        sending_time = datetime.now()
+        for scheduled_message in scheduled_messages:
+            message = Message(
+                sending_time=sending_time, sender_name=scheduled_message.sender, text=scheduled_message.text
+            )
+            groups.setdefault((scheduled_message.sender, scheduled_message.recipient), list()).append(message)
+        for (sender_name, recipient_name), messages in groups.items():
+            if recipient_name:
+                await self._append_private(sender_name, recipient_name, messages)
             else:
-                return 'Recipient not found'
+                await self._append_common(messages)
 
-    async def _read_chat(self, request_dto: RequestDto) -> str:
+    async def _read_chat(self, request_dto: RequestDto) -> Response:
         """
         Чтение чата.
 
+        Приватный чат доступен только его участникам: чат ищется в индексе чатов пользователя.
+
+        :param request_dto: Объект запроса.
+        :return: Строковый ответ.
+        """
+        server_logger.info('Client %s requested chat %s', request_dto.client_name, request_dto.chat_name)
+
+        user = self._users[request_dto.client_name]
+        since = self._get_since(request_dto, request_dto.chat_name)
+        if request_dto.chat_name == self._common_chat.name:
+            return self._read_common(user, since)
+        partner_name = user.get_partner(request_dto.chat_name)
+        if partner_name is None:
+            return 'Chat not found'
+        result, last_seq = await self._read_private(request_dto.client_name, partner_name, since)
+        self._mark_read(user, request_dto.chat_name, last_seq)
+        return result
+
+    async def _read_history_chat(
+        self,
+        chat: Chat,
+        since: int,
+        start: Optional[int],
+        count: int,
+        user_registration_datetime: Optional[datetime] = None
+    ) -> Response:
+        """
+        Чтение страницы истории чата.
+
+        :param chat: Объект чата.
+        :param since: Номер сообщения, после которого нужно вернуть сообщения.
+        :param start: Наиболее ранний момент отправки, микросекунды epoch.
+        :param count: Наибольшее количество сообщений.
+        :param user_registration_datetime: Время регистрации пользователя, ограничивающее доступные сообщения.
+        :return: Строковый ответ.
+        """
+        messages = await chat.get_history(since, start, count, user_registration_datetime)
+        self._expiry.watch(chat)
+        return self._render(messages)
+
+    async def _read_history_private(
+        self, user_name: str, partner_name: str, since: int, start: Optional[int], count: int
+    ) -> Response:
+        """
+        Чтение страницы истории приватного чата.
+
+        :param user_name: Имя участника чата, от имени которого выполняется чтение.
+        :param partner_name: Имя второго участника чата.
+        :param since: Номер сообщения, после которого нужно вернуть сообщения.
+        :param start: Наиболее ранний момент отправки, микросекунды epoch.
+        :param count: Наибольшее количество сообщений.
+        :return: Строковый ответ.
+        """
+        chat = self._private_chats[self._get_pair_key(user_name, partner_name)]
+        return await self._read_history_chat(chat, since, start, count)
+
+    async def _read_history(self, request_dto: RequestDto) -> Response:
+        """
+        Постраничное чтение истории чата, включая сообщения, вышедшие из горячего окна в холодную историю.
+
+        Страница - не больше limit сообщений с номером больше since, отправленных не раньше start_time;
+        следующая страница запрашивается с since, равным номеру последнего полученного сообщения.
+        Курсор прочитанных сообщений не сдвигается. История общего чата, как и read_chat, ограничена последними
+        SHARED_CHAT_MESSAGES_LIMIT сообщениями до регистрации пользователя.
+
+        :param request_dto: Объект запроса.
+        :return: Строковый ответ.
+        """
+        server_logger.info('Client %s requested history of chat %s', request_dto.client_name, request_dto.chat_name)
+
+        count = HISTORY_PAGE_SIZE if request_dto.limit is None else request_dto.limit
+        if not 0 < count <= HISTORY_MAX_PAGE_SIZE:
+            return f'History page size must be from 1 to {HISTORY_MAX_PAGE_SIZE}'
+        try:
+            start = self._get_request_time(request_dto.start_time)
+        except ValueError:
+            return f'Time must be in format {DATETIME_FORMAT}'
+        user = self._users[request_dto.client_name]
+        since = max(request_dto.since or 0, 0)
+        if request_dto.chat_name == self._common_chat.name:
+            return await self._read_history_chat(self._common_chat, since, start, count, user.creation_datetime)
+        partner_name = user.get_partner(request_dto.chat_name)
+        if partner_name is None:
+            return 'Chat not found'
+        return await self._read_history_private(user.name, partner_name, since, start, count)
+
+    def _search_chat(
+        self, chat: Chat, query: SearchQuery, count: int, user_registration_datetime: Optional[datetime] = None
+    ) -> List[SearchResult]:
+        """
+        Поиск в чате.
+
+        :param chat: Объект чата.
+        :param query: Поисковый запрос.
+        :param count: Наибольшее количество сообщений.
+        :param user_registration_datetime: Время регистрации пользователя, ограничивающее доступные сообщения.
+        :return: Найденные сообщения по убыванию релевантности.
+        """
+        prefix = dumps(f'[{chat.name}] ')[1:-1].encode()
+        results = chat.search(query, count, user_registration_datetime)
+        self._expiry.watch(chat)
+        return [(score, message.timestamp, prefix + message.encode()) for score, message in results]
+
+    async def _search_private(
+        self, user_name: str, partner_name: str, query: SearchQuery, count: int
+    ) -> List[SearchResult]:
+        """
+        Поиск в приватном чате.
+
+        :param user_name: Имя участника чата, от имени которого выполняется поиск.
+        :param partner_name: Имя второго участника чата.
+        :param query: Поисковый запрос.
+        :param count: Наибольшее количество сообщений.
+        :return: Найденные сообщения по убыванию релевантности.
+        """
+        return self._search_chat(self._private_chats[self._get_pair_key(user_name, partner_name)], query, count)
+
+    @staticmethod
+    def _get_request_time(value: Optional[str]) -> Optional[int]:
+        """
+        Время из поля запроса.
+
+        :param value: Время в формате DATETIME_FORMAT или None.
+        :return: Микросекунды epoch или None.
+        """
+        if not value:
+            return None
+        return Message.get_timestamp(datetime.strptime(value, DATETIME_FORMAT))
+
+    async def _search(self, request_dto: RequestDto) -> Response:
+        """
+        Поиск сообщений в чатах пользователя.
+
+        Текст запроса передается в поле message: слова через пробел, `слово*` - поиск по префиксу. Поиск
+        ограничивается чатом chat_name (если задан), отправителем sender и интервалом start_time - end_time.
+        Сообщения упорядочиваются по количеству совпавших слов запроса, затем по времени отправки (новые первыми);
+        страница задается полями offset и limit.
+
         :param request_dto: Объект запроса.
         :return: Строковый ответ.
         """
-        server_logger.info(f'Client {request_dto.client_name} requested chat {request_dto.client_name}')
-
-        if request_dto.chat_name in self._private_chats.keys():
-            await self._private_chats[request_dto.chat_name].actualize()
-            messages = await self._private_chats[request_dto.chat_name].get_messages()
-            messages_iterator = ListAsyncIterator(list(messages))
-            return '\n'.join([str(msg) async for msg in messages_iterator])
-        elif request_dto.chat_name == 'Common':
-            await self._common_chat.actualize()
-            messages = await self._common_chat.get_messages(
-                user_registration_datetime=self._users[request_dto.client_name].creation_datetime
+        server_logger.info('Client %s searched %s', request_dto.client_name, request_dto.message)
+
+        offset = max(request_dto.offset or 0, 0)
+        count = offset + (SEARCH_PAGE_SIZE if request_dto.limit is None else max(request_dto.limit, 0))
+        if count > SEARCH_MAX_RESULTS:
+            return f'Search is limited to the first {SEARCH_MAX_RESULTS} results'
+        if request_dto.sender and request_dto.sender not in self._users:
+            return 'Sender not found'
+        try:
+            query = SearchQuery.parse(
+                request_dto.message, request_dto.sender or None, self._get_request_time(request_dto.start_time),
+                self._get_request_time(request_dto.end_time)
             )
-            messages_iterator = ListAsyncIterator(list(messages))
-            return '\n'.join([str(msg) async for msg in messages_iterator])
-        else:
+        except ValueError:
+            return f'Time must be in format {DATETIME_FORMAT}'
+        if not query.size:
+            return 'Empty search query'
+
+        user = self._users[request_dto.client_name]
+        results: List[SearchResult] = list()
+        for chat_name in [request_dto.chat_name] if request_dto.chat_name else user.chats:
+            partner_name = user.get_partner(chat_name)
+            if chat_name == self._common_chat.name:
+                results.extend(self._search_chat(self._common_chat, query, count, user.creation_datetime))
+            elif partner_name is not None:
+                results.extend(await self._search_private(user.name, partner_name, query, count))
+            else:
+                return 'Chat not found'
+        page = nlargest(count, results)[offset:]
+        if not page:
+            return 'No messages found'
+        return EncodedText.from_lines([line for _, _, line in page])
+
+    def _publish(self, chat_key: ChatKey, message: Message) -> None:
+        """
+        Рассылка нового сообщения подписчикам чата.
+
+        Подписчики, которые не могут принять сообщение, отключаются от рассылки с событием "dropped".
+
+        :param chat_key: Ключ чата.
+        :param message: Объект сообщения.
+        :return: None.
+        """
+        subscribers = self._subscribers.get(chat_key)
+        if not subscribers:
+            return
+        for subscriber in list(subscribers):
+            if not subscriber.push(message):
+                server_logger.info('Subscriber of chat %s dropped: delivery queue overflow', subscriber.chat_name)
+                self._remove_subscriber(subscriber)
+                subscriber.drop()
+
+    def _remove_subscriber(self, subscriber: Subscriber) -> None:
+        """
+        Отключение подписчика от рассылки.
+
+        :param subscriber: Подписчик.
+        :return: None.
+        """
+        subscriber.stop()
+        subscribers = self._subscribers.get(subscriber.chat_key)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._subscribers[subscriber.chat_key]
+
+    async def _subscribe(
+        self, request_dto: RequestDto, connection: FramedConnection, request_id: Any, subscriptions: Set[Subscriber]
+    ) -> str:
+        """
+        Подписка на новые сообщения чата.
+
+        Новые сообщения отправляются в то же соединение кадрами с полем event и request_id запроса подписки.
+        Подписка хранится по ключу чата, найденному через индекс чатов пользователя, а не по названию чата.
+
+        :param request_dto: Объект запроса.
+        :param connection: Кадрированное соединение подписчика.
+        :param request_id: Идентификатор запроса подписки.
+        :param subscriptions: Подписки соединения.
+        :return: Строковый ответ.
+        """
+        server_logger.info('Client %s subscribed to chat %s', request_dto.client_name, request_dto.chat_name)
+
+        chat_key = self._find_chat_key(self._users[request_dto.client_name], request_dto.chat_name)
+        if chat_key is None:
             return 'Chat not found'
+        subscriber = Subscriber(
+            connection=connection, request_id=request_id, chat_name=request_dto.chat_name, chat_key=chat_key
+        )
+        subscriber.start()
+        self._subscribers.setdefault(chat_key, set()).add(subscriber)
+        subscriptions.add(subscriber)
+        return 'OK'
+
+    async def _unsubscribe(self, request_dto: RequestDto, subscriptions: Set[Subscriber]) -> str:
+        """
+        Отмена подписок соединения на чат.
+
+        :param request_dto: Объект запроса.
+        :param subscriptions: Подписки соединения.
+        :return: Строковый ответ.
+        """
+        server_logger.info('Client %s unsubscribed from chat %s', request_dto.client_name, request_dto.chat_name)
+
+        chat_key = self._find_chat_key(self._users[request_dto.client_name], request_dto.chat_name)
+        for subscriber in [item for item in subscriptions if item.chat_key == chat_key]:
+            self._remove_subscriber(subscriber)
+            subscriptions.discard(subscriber)
+        return 'OK'
+
+    @staticmethod
+    def _get_endpoint_label(request_dto: RequestDto) -> str:
+        """
+        Метка эндпоинта для метрик: неизвестные эндпоинты объединяются, чтобы клиент не мог раздуть число меток.
+
+        :param request_dto: Объект запроса.
+        :return: Метка эндпоинта.
+        """
+        return request_dto.endpoint if request_dto.endpoint in ENDPOINTS else 'unknown'
+
+    def _get_metrics(self) -> str:
+        """
+        Метрики сервера в текстовом формате Prometheus.
+
+        Хранимые сообщения приватных чатов суммируются: названия приватных чатов раскрывают пары собеседников.
+
+        :return: Текст метрик.
+        """
+        chats = [self._common_chat, *self._private_chats.values()]
+        private_chats = [chat for chat in self._private_chats.values() if chat.messages_count is not None]
+        gauges = {
+            'chat_connected_clients': [(dict(), self._connected_clients)],
+            'chat_users': [(dict(), len(self._users))],
+            'chat_chats': [(dict(), len(chats))],
+            'chat_expiry_scheduled_chats': [(dict(), self._expiry.scheduled)],
+            'chat_scheduled_messages': [(dict(), len(self._scheduler))],
+            'chat_rate_limited_users': [(dict(), len(self._user_limiter) if self._user_limiter is not None else 0)],
+            'chat_subscribers': [(dict(), sum(len(subscribers) for subscribers in self._subscribers.values()))],
+            'chat_retained_messages': [
+                ({'kind': 'common'}, self._common_chat.messages_count or 0),
+                ({'kind': 'private'}, sum(chat.messages_count for chat in private_chats)),  # type: ignore
+            ],
+            'chat_retained_message_bytes': [
+                ({'kind': 'common'}, self._common_chat.messages_size or 0),
+                ({'kind': 'private'}, sum(chat.messages_size for chat in private_chats)),  # type: ignore
+            ],
+        }
+        counters = {
+            'chat_bytes_received_total': self._bytes_received + sum(
+                connection.bytes_read for connection in self._connections
+            ),
+            'chat_bytes_sent_total': self._bytes_sent + sum(
+                connection.bytes_written for connection in self._connections
+            ),
+            'chat_rate_limited_requests_total': self._rate_limited_requests,
+            'chat_bad_requests_total': self._bad_requests,
+            'chat_failed_requests_total': self._failed_requests,
+            'chat_attachments_stored_total': self._attachments.stats['stored'],
+            'chat_attachments_deduplicated_total': self._attachments.stats['deduplicated'],
+        }
+        if self._journal is not None:
+            stats = self._journal.stats
+            counters.update({
+                'chat_journal_records_total': stats['records'],
+                'chat_journal_bytes_written_total': stats['bytes_written'],
+                'chat_journal_fsyncs_total': stats['fsyncs'],
+                'chat_journal_snapshots_total': stats['snapshots'],
+            })
+        return self._metrics.render(gauges, counters)
+
+    def _control_profiler(self, request_dto: RequestDto) -> str:
+        """
+        Управление выборочным профилировщиком: `start` - запуск, `stop` - остановка с отчетом,
+        иначе - отчет по собранным стекам.
+
+        :param request_dto: Объект запроса, команда передается в поле message.
+        :return: Строковый ответ.
+        """
+        if request_dto.message == 'start':
+            self._profiler.start()
+            return 'OK'
+        if request_dto.message == 'stop':
+            self._profiler.stop()
+        return self._profiler.report()
+
+    @staticmethod
+    def _get_send_cost(request_dto: RequestDto) -> Tuple[int, int]:
+        """
+        Количество отправляемых запросом сообщений для ограничителей частоты.
+
+        :param request_dto: Объект запроса.
+        :return: Количество сообщений в общий чат и всех сообщений.
+        """
+        if request_dto.endpoint in ('send', 'schedule_send'):
+            return (0 if request_dto.recipient else 1), 1
+        items = request_dto.messages
+        if request_dto.endpoint != 'send_batch' or not isinstance(items, list) or len(items) > SEND_BATCH_MAX_SIZE:
+            return 0, 0
+        return sum(1 for item in items if isinstance(item, dict) and not item.get('recipient')), len(items)
+
+    def _check_rate_limit(self, request_dto: RequestDto) -> Optional[str]:
+        """
+        Проверка ограничений частоты отправки до выполнения запроса.
+
+        Лимит пользователя распространяется на сообщения в общий чат, глобальный лимит - на все сообщения.
+        Жетоны списываются сразу; если запрос отклонил глобальный лимит, жетоны пользователя возвращаются.
+
+        :param request_dto: Объект запроса.
+        :return: Ответ с отказом и временем до повтора или None, если запрос можно выполнять.
+        """
+        common_count, total_count = self._get_send_cost(request_dto)
+        retry_after = 0.0
+        if common_count and self._user_limiter is not None:
+            retry_after = self._user_limiter.acquire(request_dto.client_name, common_count)
+        if not retry_after and total_count and self._global_limiter is not None:
+            retry_after = self._global_limiter.acquire('', total_count)
+            if retry_after and common_count and self._user_limiter is not None:
+                self._user_limiter.refund(request_dto.client_name, common_count)
+        if not retry_after:
+            return None
+        self._rate_limited_requests += 1
+        server_logger.info('Client %s exceeded send rate limit', request_dto.client_name)
+        if retry_after == inf:
+            return 'Rate limit exceeded, batch is larger than the limit'
+        return f'Rate limit exceeded, retry after {retry_after:.1f} s'
+
+    async def _route_user_request(self, request_dto: RequestDto) -> Response:
+        """
+        Маршрутизация запроса зарегистрированного пользователя.
 
-    async def _route_request(self, request_dto: RequestDto) -> str:
+        :param request_dto: Данные запроса.
+        :return: Ответ от сервера.
         """
-        Маршрутизация запроса.
+        if request_dto.endpoint == 'status':
+            return await self._get_status(request_dto)
+        elif request_dto.endpoint == 'send':
+            return await self._send(request_dto)
+        elif request_dto.endpoint == 'send_batch':
+            return await self._send_batch(request_dto)
+        elif request_dto.endpoint == 'schedule_send':
+            return await self._schedule_send(request_dto)
+        elif request_dto.endpoint == 'cancel_scheduled':
+            return await self._cancel_scheduled(request_dto)
+        elif request_dto.endpoint == 'read_chat':
+            return await self._read_chat(request_dto)
+        elif request_dto.endpoint == 'history':
+            return await self._read_history(request_dto)
+        elif request_dto.endpoint == 'search':
+            return await self._search(request_dto)
+        elif request_dto.endpoint in ('subscribe', 'unsubscribe'):
+            return 'Subscriptions require framed protocol'
+        return 'Unknown endpoint or unregister user'
+
+    async def _route_request(self, request_dto: RequestDto) -> Response:
+        """
+        Маршрутизация запроса: все запросы, кроме connect, доступны только зарегистрированным пользователям;
+        запросы пользователя выполняются после проверки ограничений частоты отправки.
 
         :param request_dto: Данные запроса.
         :return: Ответ от сервера.
         """
-        server_logger.info(f'Client {request_dto.client_name} requested {request_dto.endpoint}')
+        server_logger.debug('Client %s requested %s', request_dto.client_name, request_dto.endpoint)
         if request_dto.endpoint == 'connect':
             return await self._connect(request_dto)
-        elif request_dto.client_name in self._users.keys():
-            if request_dto.endpoint == 'status':
-                return await self._get_status(request_dto)
-            elif request_dto.endpoint == 'send':
-                return await self._send(request_dto)
-            elif request_dto.endpoint == 'read_chat':
-                return await self._read_chat(request_dto)
-        return 'Unknown endpoint or unregister user'
+        elif request_dto.client_name not in self._users.keys():
+            return 'Unknown endpoint or unregister user'
+        elif request_dto.endpoint == 'metrics':
+            return self._get_metrics()
+        elif request_dto.endpoint == 'profiler':
+            return self._control_profiler(request_dto)
+        return self._check_rate_limit(request_dto) or await self._route_user_request(request_dto)
 
-    async def _process_request(self, reader: StreamReader, writer: StreamWriter) -> None:
+    async def _serve_legacy(
+        self, request: bytes, reader: StreamReader, writer: StreamWriter, address: str
+    ) -> None:
         """
-        Обработчик входящих соединений.
+        Обслуживание соединения в режиме "один запрос на соединение".
 
+        Запрос читается до конца потока, но не больше LEGACY_REQUEST_MAX_SIZE байт: на больший запрос
+        сервер отвечает отказом, не дочитывая его.
+
+        :param request: Уже прочитанное начало запроса.
+        :param reader: Поток чтения.
+        :param writer: Поток записи.
+        :param address: Адрес клиента.
         :return: None.
         """
-        address = writer.get_extra_info('peername')
-        server_logger.info(f'Start serving {address}')
-
-        request = await reader.read()
-        decoded_request = loads(request.decode())
-        request_dto = await RequestDtoRowMapper.get_from_dict(decoded_request)
-        server_logger.info(f'Received {request_dto} from {address}')
+        started = perf_counter()
+        buffer = bytearray(request)
+        while len(buffer) <= LEGACY_REQUEST_MAX_SIZE:
+            chunk = await reader.read(LEGACY_REQUEST_MAX_SIZE + 1 - len(buffer))
+            if not chunk:
+                break
+            buffer += chunk
+        self._bytes_received += len(buffer)
+        if len(buffer) > LEGACY_REQUEST_MAX_SIZE:
+            server_logger.info('Request from %s exceeds %s bytes', address, LEGACY_REQUEST_MAX_SIZE)
+            writer.write(b'Request too large')
+            await writer.drain()
+            return
+        read_at = perf_counter()
+        try:
+            request_dto = RequestDtoRowMapper.get_from_bytes(buffer)
+        except RequestError as error:
+            self._reject_request(error, address)
+            writer.write(error.response.encode())
+            await writer.drain()
+            return
+        decoded_at = perf_counter()
+        server_logger.debug('Received %s from %s', request_dto, address)
 
-        result = await self._route_request(request_dto)
+        try:
+            result = await self._route_request(request_dto)
+        except Exception:
+            self._fail_request(address)
+            writer.write(INTERNAL_ERROR.encode())
+            await writer.drain()
+            return
+        handled_at = perf_counter()
 
-        writer.write(result.encode())
-        server_logger.info(f'Sent {result} to {address}')
+        encoded_result = str(result).encode()
+        encoded_at = perf_counter()
+        writer.write(encoded_result)
+        server_logger.debug('Sent %s to %s', result, address)
         await writer.drain()
 
-        server_logger.info(f'Stop serving {address}')
-        writer.close()
+        self._bytes_sent += len(encoded_result)
+        self._metrics.observe_request(self._get_endpoint_label(request_dto), {
+            'read': read_at - started,
+            'decode': decoded_at - read_at,
+            'handler': handled_at - decoded_at,
+            'encode': encoded_at - handled_at,
+            'drain': perf_counter() - encoded_at,
+        })
+
+    def _reject_request(self, error: RequestError, address: str) -> None:
+        """
+        Учет некорректного запроса.
+
+        :param error: Ошибка разбора запроса.
+        :param address: Адрес клиента.
+        :return: None.
+        """
+        self._bad_requests += 1
+        server_logger.info('Bad request from %s: %s', address, error)
+
+    def _fail_request(self, address: str) -> None:
+        """
+        Учет запроса, обработка которого завершилась непредвиденной ошибкой; вызывается в обработчике исключения.
+
+        :param address: Адрес клиента.
+        :return: None.
+        """
+        self._failed_requests += 1
+        server_logger.exception('Failed to process request from %s', address)
+
+    @staticmethod
+    async def _write_response(
+        connection: FramedConnection, address: str, response: Union[Dict[str, Any], List[bytes]]
+    ) -> bool:
+        """
+        Отправка кадра-ответа.
+
+        :param connection: Кадрированное соединение.
+        :param address: Адрес клиента.
+        :param response: Содержимое кадра или кадр, уже закодированный списком буферов.
+        :return: Отправлен ли ответ.
+        """
+        try:
+            if isinstance(response, dict):
+                await connection.write_frame(response)
+            else:
+                await connection.write_frame_parts(response)
+        except ConnectionError:
+            server_logger.info('Connection to %s lost before response was sent', address)
+            return False
+        return True
+
+    async def _process_frame(
+        self, connection: FramedConnection, body: bytes, address: str, subscriptions: Set[Subscriber]
+    ) -> None:
+        """
+        Обработка одного кадра-запроса.
+
+        :param connection: Кадрированное соединение.
+        :param body: Тело кадра.
+        :param address: Адрес клиента.
+        :param subscriptions: Подписки соединения.
+        :return: None.
+        """
+        started = perf_counter()
+        try:
+            request_dto = RequestDtoRowMapper.get_from_bytes(body)
+        except RequestError as error:
+            self._reject_request(error, address)
+            await self._write_response(connection, address, {
+                'request_id': error.request_id, 'error': 'bad_request', 'response': error.response
+            })
+            return
+        decoded_at = perf_counter()
+        server_logger.debug('Received %s from %s', request_dto, address)
+
+        result: Response
+        try:
+            if request_dto.endpoint == 'subscribe' and request_dto.client_name in self._users.keys():
+                result = await self._subscribe(request_dto, connection, request_dto.request_id, subscriptions)
+            elif request_dto.endpoint == 'unsubscribe' and request_dto.client_name in self._users.keys():
+                result = await self._unsubscribe(request_dto, subscriptions)
+            else:
+                result = await self._route_request(request_dto)
+        except Exception:
+            self._fail_request(address)
+            await self._write_response(connection, address, {
+                'request_id': request_dto.request_id, 'error': 'internal', 'response': INTERNAL_ERROR
+            })
+            return
+        handled_at = perf_counter()
+
+        payload = {'request_id': request_dto.request_id}
+        if isinstance(result, EncodedText):
+            encoded_response = connection.encode_text_frame(payload, 'response', result)
+        else:
+            encoded_response = [connection.encode_frame({**payload, 'response': result})]
+        encoded_at = perf_counter()
+        if not await self._write_response(connection, address, encoded_response):
+            return
+        server_logger.debug('Sent %s to %s', result, address)
+
+        self._metrics.observe_request(self._get_endpoint_label(request_dto), {
+            'decode': decoded_at - started,
+            'handler': handled_at - decoded_at,
+            'encode': encoded_at - handled_at,
+            'drain': perf_counter() - encoded_at,
+        })
+
+    async def _serve_framed(self, connection: FramedConnection, address: str) -> None:
+        """
+        Обслуживание долгоживущего соединения с кадрированным протоколом.
+
+        Запросы обрабатываются конкурентно, ответы сопоставляются с запросами по request_id. Пока
+        обрабатывается CONNECTION_MAX_IN_FLIGHT запросов, следующие кадры не читаются, и клиент, отправляющий
+        запросы быстрее, чем сервер их выполняет, упирается в окно TCP.
+
+        :param connection: Кадрированное соединение.
+        :param address: Адрес клиента.
+        :return: None.
+        """
+        in_flight: Set[Task] = set()
+        subscriptions: Set[Subscriber] = set()
+        self._connections.add(connection)
+        try:
+            while True:
+                if len(in_flight) >= CONNECTION_MAX_IN_FLIGHT:
+                    await wait(in_flight, return_when=FIRST_COMPLETED)
+                body = await connection.read_frame_body()
+                if body is None:
+                    break
+                task = create_task(self._process_frame(connection, body, address, subscriptions))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+        except ConnectionError as error:
+            server_logger.info('Connection to %s broken: %s', address, error)
+        if in_flight:
+            await gather(*in_flight, return_exceptions=True)
+        for subscriber in subscriptions:
+            self._remove_subscriber(subscriber)
+        self._connections.discard(connection)
+        self._bytes_received += connection.bytes_read
+        self._bytes_sent += connection.bytes_written
+
+    async def _process_http_request(self, connection: HttpConnection, request: HttpRequest, address: str) -> None:
+        """
+        Обработка одного HTTP-запроса: путь определяет эндпоинт, поля запроса передаются в строке запроса
+        и JSON-телом; ответ - JSON-объект `{"response": ...}`, как в кадрированном протоколе.
+
+        :param connection: HTTP-соединение.
+        :param request: Запрос.
+        :param address: Адрес клиента.
+        :return: None.
+        """
+        started = perf_counter()
+        method, endpoint = HTTP_ROUTES.get(request.path, (None, None))
+        if endpoint is None:
+            body = connection.encode_json({'error': 'not_found', 'response': 'Unknown endpoint'})
+            await connection.write_response(HTTPStatus.NOT_FOUND, body, request)
+            return
+        if request.method != method:
+            body = connection.encode_json({'error': 'method_not_allowed', 'response': f'Use {method.decode()}'})
+            await connection.write_response(
+                HTTPStatus.METHOD_NOT_ALLOWED, body, request, [f'Allow: {method.decode()}']
+            )
+            return
+        try:
+            request_dto = RequestDtoRowMapper.get_from_query(endpoint, request.query, request.body)
+        except RequestError as error:
+            self._reject_request(error, address)
+            body = connection.encode_json({'error': 'bad_request', 'response': error.response})
+            await connection.write_response(HTTPStatus.BAD_REQUEST, body, request)
+            return
+        decoded_at = perf_counter()
+        server_logger.debug('Received %s from %s', request_dto, address)
+
+        try:
+            result = await self._route_request(request_dto)
+        except Exception:
+            self._fail_request(address)
+            body = connection.encode_json({'error': 'internal', 'response': INTERNAL_ERROR})
+            await connection.write_response(HTTPStatus.INTERNAL_SERVER_ERROR, body, request)
+            return
+        handled_at = perf_counter()
+
+        if isinstance(result, EncodedText):
+            body = connection.encode_text('response', result)
+        else:
+            body = connection.encode_json({'response': result})
+        encoded_at = perf_counter()
+        await connection.write_response(HTTPStatus.OK, body, request)
+        server_logger.debug('Sent %s to %s', result, address)
+
+        self._metrics.observe_request(self._get_endpoint_label(request_dto), {
+            'decode': decoded_at - started,
+            'handler': handled_at - decoded_at,
+            'encode': encoded_at - handled_at,
+            'drain': perf_counter() - encoded_at,
+        })
+
+    @staticmethod
+    async def _write_http_error(connection: HttpConnection, error: HttpError, address: str) -> None:
+        """
+        Ответ ошибкой на некорректный HTTP-запрос; клиент мог уже закрыть соединение.
+
+        :param connection: HTTP-соединение.
+        :param error: Ошибка разбора запроса.
+        :param address: Адрес клиента.
+        :return: None.
+        """
+        try:
+            await connection.write_error(error)
+        except ConnectionError as write_error:
+            server_logger.info('HTTP connection to %s broken: %s', address, write_error)
+
+    async def _serve_http(self, connection: HttpConnection, address: str) -> None:
+        """
+        Обслуживание HTTP/1.1-соединения.
+
+        Соединение обслуживает запросы по очереди, пока клиент не попросит его закрыть или не пришлет
+        следующий запрос за HTTP_KEEP_ALIVE_TIMEOUT секунд; запросы, отправленные конвейером, уже лежат в буфере
+        потока и читаются без ожидания. На некорректный запрос сервер отвечает ошибкой и закрывает соединение.
+
+        :param connection: HTTP-соединение.
+        :param address: Адрес клиента.
+        :return: None.
+        """
+        self._connections.add(connection)
+        try:
+            while True:
+                try:
+                    request = await wait_for(connection.read_request(), HTTP_KEEP_ALIVE_TIMEOUT)
+                except TimeoutError:
+                    break
+                if request is None:
+                    break
+                await self._process_http_request(connection, request, address)
+                if not request.keep_alive:
+                    break
+        except HttpError as error:
+            self._reject_request(error, address)
+            await self._write_http_error(connection, error, address)
+        except ConnectionError as error:
+            server_logger.info('HTTP connection to %s broken: %s', address, error)
+        finally:
+            self._connections.discard(connection)
+            self._bytes_received += connection.bytes_read
+            self._bytes_sent += connection.bytes_written
+
+    async def _upload(self, request_dto: RequestDto, reader: StreamReader) -> Dict[str, Any]:
+        """
+        Прием вложения: за кадром-заголовком следуют size байт файла.
+
+        :param request_dto: Объект запроса, размер файла - в поле size.
+        :param reader: Поток чтения.
+        :return: Кадр-ответ с идентификатором вложения.
+        """
+        if request_dto.size is None or not 0 < request_dto.size <= ATTACHMENT_MAX_SIZE:
+            return {'response': f'Attachment size must be from 1 to {ATTACHMENT_MAX_SIZE} bytes'}
+        server_logger.info('Client %s uploads %s bytes', request_dto.client_name, request_dto.size)
+        attachment_id = await self._attachments.receive(reader, request_dto.size)
+        self._bytes_received += request_dto.size
+        return {'response': 'OK', 'attachment': attachment_id}
+
+    async def _download(
+        self, request_dto: RequestDto, connection: FramedConnection, writer: StreamWriter, address: str
+    ) -> None:
+        """
+        Отправка вложения: кадр-заголовок с размером файла, затем файл через loop.sendfile, без копирования
+        в память процесса.
+
+        :param request_dto: Объект запроса, идентификатор вложения - в поле attachment.
+        :param connection: Кадрированное соединение.
+        :param writer: Поток записи.
+        :param address: Адрес клиента.
+        :return: None.
+        """
+        file = self._attachments.open(request_dto.attachment or '')
+        if file is None:
+            await self._write_response(connection, address, {'response': 'Attachment not found'})
+            return
+        with file:
+            size = fstat(file.fileno()).st_size
+            server_logger.info('Client %s downloads %s bytes', request_dto.client_name, size)
+            if await self._write_response(connection, address, {'response': 'OK', 'size': size}):
+                await get_running_loop().sendfile(writer.transport, file, 0, size)
+                self._bytes_sent += size
+
+    async def _serve_transfer(
+        self, connection: FramedConnection, reader: StreamReader, writer: StreamWriter, address: str
+    ) -> None:
+        """
+        Обслуживание соединения передачи вложения: один кадр-заголовок запроса upload или download,
+        затем содержимое файла без кадрирования.
+
+        :param connection: Кадрированное соединение для заголовков запроса и ответа.
+        :param reader: Поток чтения.
+        :param writer: Поток записи.
+        :param address: Адрес клиента.
+        :return: None.
+        """
+        started = perf_counter()
+        try:
+            body = await connection.read_frame_body()
+            if body is None:
+                return
+            request_dto = RequestDtoRowMapper.get_from_bytes(body)
+            if request_dto.client_name not in self._users.keys():
+                await self._write_response(connection, address, {'response': 'Unknown endpoint or unregister user'})
+            elif request_dto.endpoint == 'upload':
+                await self._write_response(connection, address, await self._upload(request_dto, reader))
+            elif request_dto.endpoint == 'download':
+                await self._download(request_dto, connection, writer, address)
+            else:
+                await self._write_response(connection, address, {'response': 'Unknown transfer endpoint'})
+        except RequestError as error:
+            self._reject_request(error, address)
+            await self._write_response(connection, address, {'error': 'bad_request', 'response': error.response})
+            return
+        except ConnectionError as error:
+            server_logger.info('Transfer connection to %s broken: %s', address, error)
+            return
+        except Exception:
+            self._fail_request(address)
+            await self._write_response(connection, address, {'error': 'internal', 'response': INTERNAL_ERROR})
+            return
+        finally:
+            self._bytes_received += connection.bytes_read
+            self._bytes_sent += connection.bytes_written
+        self._metrics.observe_request(self._get_endpoint_label(request_dto), {'handler': perf_counter() - started})
+
+    async def _process_request(self, reader: StreamReader, writer: StreamWriter) -> None:
+        """
+        Обработчик входящих соединений.
+
+        Первый байт соединения определяет протокол: маркер кадрированного протокола, маркер передачи вложения,
+        буква - начало метода HTTP-запроса, иначе - начало JSON-запроса в режиме "один запрос на соединение".
+
+        :return: None.
+        """
+        address = writer.get_extra_info('peername')
+        server_logger.debug('Start serving %s', address)
+
+        self._connected_clients += 1
+        try:
+            marker = await reader.read(1)
+            if marker == FRAMED_PROTOCOL_MARKER:
+                await self._serve_framed(FramedConnection(reader, writer), address)
+            elif marker == TRANSFER_PROTOCOL_MARKER:
+                await self._serve_transfer(FramedConnection(reader, writer), reader, writer, address)
+            elif marker.isalpha():
+                await self._serve_http(HttpConnection(reader, writer, marker), address)
+            elif marker:
+                await self._serve_legacy(marker, reader, writer, address)
+        finally:
+            self._connected_clients -= 1
+            server_logger.debug('Stop serving %s', address)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
 
     async def listen(self):
         """
@@ -223,12 +1795,35 @@ class Server:
 
         :return: None.
         """
-        server_logger.info(f'Start server on {self._host}:{self._port}')
+        server_logger.info('Start server on %s:%s', self._host, self._port)
 
-        server = await start_server(client_connected_cb=self._process_request, host=self._host, port=self._port)
+        loop_lag_task = create_task(self._metrics.watch_loop_lag())
+        for chat in [self._common_chat, *self._private_chats.values()]:
+            self._expiry.watch(chat)
+        expiry_task = create_task(self._expiry.run())
+        scheduler_task = create_task(self._scheduler.run())
+        compaction_task: Optional[Task] = None
+        if self._journal is not None:
+            await self._journal.start()
+            compaction_task = create_task(self._compact_journal())
 
-        async with server:
-            await server.serve_forever()
+        server = await start_server(
+            client_connected_cb=self._process_request, host=self._host, port=self._port, reuse_port=self._reuse_port
+        )
+
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            loop_lag_task.cancel()
+            expiry_task.cancel()
+            scheduler_task.cancel()
+            self._profiler.stop()
+            if compaction_task is not None:
+                compaction_task.cancel()
+            if self._journal is not None:
+                self._record_read_cursors()
+                await self._journal.stop()
 
 
 def parse_args() -> Namespace:
@@ -241,22 +1836,43 @@ def parse_args() -> Namespace:
     parser = ArgumentParser()
     parser.add_argument('-s', '--server_host', type=str, default='127.0.0.1', help='Host of server')
     parser.add_argument('-p', '--server_port', type=int, default=8000, help='Port of server')
+    parser.add_argument('-w', '--workers', type=int, default=SERVER_WORKERS, help='Number of worker processes')
+    parser.add_argument(
+        '-l', '--log-level', type=str, default=LOG_LEVEL, choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+        help='Logging level'
+    )
+    parser.add_argument(
+        '--user-send-limit', type=int, default=USER_SEND_RATE_LIMIT,
+        help=f'Common chat messages per user per {USER_SEND_RATE_PERIOD} s, 0 - unlimited'
+    )
+    parser.add_argument(
+        '--global-send-limit', type=int, default=GLOBAL_SEND_RATE_LIMIT,
+        help=f'Messages per server per {GLOBAL_SEND_RATE_PERIOD} s, 0 - unlimited'
+    )
+    parser.add_argument(
+        '--history', action='store_true', default=HISTORY_ENABLED,
+        help=f'Move messages out of the hot window to compressed history segments in {HISTORY_PATH}'
+    )
     return parser.parse_args()
 
 
-async def main() -> None:
+async def main(args: Namespace) -> None:
     """
     Главная функция.
 
+    :param args: Аргументы командной строки.
     :return: None.
     """
-    args = parse_args()
     server = Server(
         host=args.server_host,
         port=args.server_port,
         common_chat=Factories.get_empty_common_chat(),
         private_chats=dict(),
-        users=dict()
+        users=dict(),
+        journal=Journal(path=JOURNAL_PATH, snapshot_path=SERVER_SNAPSHOT_PATH),
+        user_send_limit=args.user_send_limit,
+        global_send_limit=args.global_send_limit,
+        history_path=HISTORY_PATH if args.history else None
     )
 
     def keyboard_interrupt_handler(signal_number: int, stack_frame: FrameType) -> None:
@@ -279,4 +1895,14 @@ async def main() -> None:
 
 
 if __name__ == "__main__":
-    run(main())
+    arguments = parse_args()
+    LogPipeline.start(arguments.log_level)
+    if arguments.workers > 1:
+        # Импорт здесь: модуль шардов сам импортирует этот модуль.
+        from sharded_server import run_workers
+        run_workers(
+            arguments.server_host, arguments.server_port, arguments.workers, arguments.log_level,
+            arguments.user_send_limit, arguments.global_send_limit, arguments.history
+        )
+    else:
+        run(main(arguments))
@@ -1,3 +1,56 @@
 DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
 ACTUALITY_PERIOD = 1
 SHARED_CHAT_MESSAGES_LIMIT = 20
+FRAMED_PROTOCOL_MARKER = b'\x01'
+FRAME_MAX_SIZE = 16 * 1024 * 1024
+CLIENT_RECONNECT_ATTEMPTS = 2
+SUBSCRIBER_QUEUE_SIZE = 100
+SUBSCRIBER_OVERFLOW_POLICY = 'skip'
+CHAT_MESSAGES_MAX_COUNT = None
+CHAT_MESSAGES_MAX_BYTES = None
+SERVER_CONFIG_PATH = 'server_config.json'
+SERVER_SNAPSHOT_PATH = 'server_snapshot.jsonl'
+JOURNAL_PATH = 'server_journal.log'
+JOURNAL_FLUSH_INTERVAL = 0.05
+JOURNAL_COMPACTION_RECORDS = 10000
+JOURNAL_COMPACTION_INTERVAL = 300
+SERVER_WORKERS = 1
+SHARD_BUS_SOCKET_PATH = '/tmp/chat-server-{port}-{shard_id}.sock'
+SHARD_BUS_RECONNECT_DELAY = 0.1
+SHARD_BUS_REQUEST_TIMEOUT = 10
+LOG_LEVEL = 'INFO'
+LOG_PAYLOAD_LIMIT = 200
+METRICS_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+METRICS_LOOP_LAG_INTERVAL = 0.5
+PROFILER_INTERVAL = 0.005
+PROFILER_REPORT_LIMIT = 30
+SEND_BATCH_MAX_SIZE = 1000
+STATUS_CHANGES_LIMIT = 10000
+EXPIRY_SLICE_SIZE = 1000
+USER_SEND_RATE_LIMIT = 20
+USER_SEND_RATE_PERIOD = 3600
+GLOBAL_SEND_RATE_LIMIT = None
+GLOBAL_SEND_RATE_PERIOD = 1
+LEGACY_REQUEST_MAX_SIZE = 1024 * 1024
+CONNECTION_MAX_IN_FLIGHT = 128
+SEARCH_INDEX_ENABLED = True
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_RESULTS = 1000
+SCHEDULED_SEND_BATCH_SIZE = 1000
+SCHEDULED_SEND_MAX_DELAY = 365 * 24 * 3600
+TRANSFER_PROTOCOL_MARKER = b'\x02'
+ATTACHMENTS_PATH = 'attachments'
+ATTACHMENT_MAX_SIZE = 5 * 1024 * 1024
+ATTACHMENT_CHUNK_SIZE = 64 * 1024
+HISTORY_ENABLED = False
+HISTORY_PATH = 'history'
+HISTORY_BLOCK_MESSAGES = 256
+HISTORY_SEGMENT_SIZE = 64 * 1024 * 1024
+HISTORY_PAGE_SIZE = 100
+HISTORY_MAX_PAGE_SIZE = 1000
+HTTP_HEAD_MAX_SIZE = 16 * 1024
+HTTP_BODY_MAX_SIZE = 1024 * 1024
+HTTP_KEEP_ALIVE_TIMEOUT = 15
+HTTP_CHUNK_SIZE = 16 * 1024
+HTTP_COMPRESSION_MIN_SIZE = 1024
+HTTP_COMPRESSION_LEVEL = 6
@@ -0,0 +1,555 @@
+from asyncio import Condition
+from asyncio import run
+from asyncio import wait_for
+from dataclasses import asdict
+from datetime import datetime
+from multiprocessing import get_context
+from os import kill
+from os.path import splitext
+from signal import SIGINT
+from signal import SIGTERM
+from signal import signal
+from types import FrameType
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+from zlib import crc32
+
+from builtin_types import Chat
+from builtin_types import Message
+from builtin_types import SearchQuery
+from builtin_types import User
+from data_transfer_objects import RequestDto
+from server import Response
+from server import SearchResult
+from server import Server
+from server import server_logger
+from settings import GLOBAL_SEND_RATE_LIMIT
+from settings import HISTORY_ENABLED
+from settings import HISTORY_PATH
+from settings import JOURNAL_PATH
+from settings import LOG_LEVEL
+from settings import SERVER_SNAPSHOT_PATH
+from settings import SHARD_BUS_REQUEST_TIMEOUT
+from settings import SHARD_BUS_SOCKET_PATH
+from settings import USER_SEND_RATE_LIMIT
+from utils import Factories
+from utils import Journal
+from utils import LogPipeline
+from utils import RequestDtoRowMapper
+from utils import ShardBus
+
+
+class ShardedServer(Server):
+    """
+    Процесс-шард сервера, один из нескольких, принимающих соединения на общем порту (SO_REUSEPORT).
+
+    Состояние распределено между шардами:
+
+    - пользователь закреплен за домашним шардом (по хэшу имени), который выполняет его запросы connect,
+      send, send_batch, schedule_send, cancel_scheduled и read_chat, хранит курсоры прочитанных сообщений,
+      корзину ограничителя частоты и отложенные сообщения пользователя;
+      остальные шарды пересылают ему эти запросы;
+    - сообщения общего чата нумерует шард 0, остальные шарды держат его реплику;
+    - приватный чат хранится на шарде, выбранном по хэшу пары участников;
+    - список пользователей и списки их чатов реплицируются на все шарды событиями шины.
+
+    Соединение с клиентом, подписки и рассылка новых сообщений остаются на шарде, принявшем соединение.
+    """
+
+    COMMON_CHAT_SHARD = 0
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        shard_id: int,
+        shard_count: int,
+        journal: Optional[Journal] = None,
+        snapshot_path: str = SERVER_SNAPSHOT_PATH,
+        user_send_limit: Optional[int] = USER_SEND_RATE_LIMIT,
+        global_send_limit: Optional[int] = GLOBAL_SEND_RATE_LIMIT,
+        history_path: Optional[str] = None
+    ):
+        super().__init__(
+            host=host,
+            port=port,
+            common_chat=Factories.get_empty_common_chat(),
+            private_chats=dict(),
+            users=dict(),
+            journal=journal,
+            snapshot_path=snapshot_path,
+            user_send_limit=user_send_limit,
+            global_send_limit=global_send_limit,
+            history_path=history_path
+        )
+        self._shard_id = shard_id
+        self._shard_count = shard_count
+        self._reuse_port = True
+        self._bus = ShardBus(
+            shard_id=shard_id,
+            socket_paths=[
+                SHARD_BUS_SOCKET_PATH.format(port=port, shard_id=bus_shard_id)
+                for bus_shard_id in range(shard_count)
+            ],
+            request_handler=self._handle_bus_request,
+            event_handler=self._handle_bus_event
+        )
+        self._common_chat_updated: Optional[Condition] = None
+        self._users_updated: Optional[Condition] = None
+
+    def _get_shard(self, key: str) -> int:
+        """
+        Номер шарда для ключа.
+
+        :param key: Ключ.
+        :return: Номер шарда.
+        """
+        return crc32(key.encode()) % self._shard_count
+
+    def _get_private_chat_shard(self, members: List[str]) -> int:
+        """
+        Номер шарда, хранящего приватный чат: не зависит от порядка участников.
+
+        :param members: Участники чата.
+        :return: Номер шарда.
+        """
+        return self._get_shard('\0'.join(sorted(members)))
+
+    def _owns_private_chat(self, members: List[str]) -> bool:
+        """
+        Хранятся ли сообщения приватного чата на этом шарде.
+
+        :param members: Участники чата.
+        :return: True, если чат закреплен за этим шардом.
+        """
+        return self._get_private_chat_shard(members) == self._shard_id
+
+    def _register_user(self, user_name: str, creation_datetime: Optional[datetime] = None) -> User:
+        """
+        Регистрация пользователя на домашнем шарде и рассылка его остальным шардам.
+
+        :param user_name: Имя пользователя.
+        :param creation_datetime: Время регистрации, по умолчанию - текущее.
+        :return: Объект пользователя.
+        """
+        user = super()._register_user(user_name, creation_datetime)
+        self._bus.publish(
+            {'type': 'connect', 'user': user.name, 'time': Message.get_timestamp(user.creation_datetime)}
+        )
+        return user
+
+    def _on_message_added(self, chat: Chat, message: Message) -> None:
+        """
+        Рассылка нового сообщения локальным подписчикам и остальным шардам.
+
+        Чат в событии задается участниками, а не названием: названия приватных чатов разных пар могут совпадать,
+        а номера имен в ключе пары у каждого шарда свои.
+
+        :param chat: Объект чата.
+        :param message: Объект сообщения.
+        :return: None.
+        """
+        super()._on_message_added(chat, message)
+        self._bus.publish({
+            'type': 'send',
+            'members': chat.members,
+            'sender': message.sender,
+            'text': message.text,
+            'time': message.timestamp,
+            'seq': message.seq,
+            'attachment': message.attachment,
+        })
+
+    def _on_private_chat_created(self, chat_name: str, members: List[str]) -> None:
+        """
+        Рассылка нового приватного чата остальным шардам.
+
+        :param chat_name: Название чата.
+        :param members: Участники чата.
+        :return: None.
+        """
+        self._bus.publish({'type': 'chat', 'members': members})
+
+    def _add_known_private_chat(self, chat_name: str, members: List[str]) -> None:
+        """
+        Добавление участникам приватного чата, созданного другим шардом, с записью события в журнал.
+
+        :param chat_name: Название чата.
+        :param members: Участники чата в порядке, образующем название.
+        :return: None.
+        """
+        if all(self._users[member].has_chat(chat_name) for member in members if member in self._users):
+            return
+        self._add_private_chat(chat_name, members)
+        self._record('chat', members=members)
+
+    @staticmethod
+    def _encode_bus_messages(messages: List[Message]) -> List[List[Any]]:
+        """
+        Сообщения одного отправителя для запроса шины: текст, время отправки в микросекундах epoch и вложение.
+
+        :param messages: Объекты сообщений.
+        :return: Список троек.
+        """
+        return [[message.text, message.timestamp, message.attachment] for message in messages]
+
+    @staticmethod
+    def _decode_bus_messages(sender_name: str, items: List[List[Any]]) -> List[Message]:
+        """
+        Сообщения из запроса шины.
+
+        :param sender_name: Имя отправителя.
+        :param items: Тройки (текст, время отправки в микросекундах epoch, вложение).
+        :return: Объекты сообщений.
+        """
+        return [
+            Message.from_timestamp(timestamp, sender_name, text, attachment=attachment)
+            for text, timestamp, attachment in items
+        ]
+
+    @staticmethod
+    async def _wait_for_replica(condition: Optional[Condition], predicate: Callable[[], bool]) -> None:
+        """
+        Ожидание, пока реплика шарда догонит ответ другого шарда: ответ и события идут разными соединениями шины.
+
+        :param condition: Условие, о котором уведомляет применение событий.
+        :param predicate: Проверка реплики.
+        :return: None.
+        :raises TimeoutError: Событие не пришло за SHARD_BUS_REQUEST_TIMEOUT секунд.
+        """
+        async with condition:  # type: ignore
+            await wait_for(condition.wait_for(predicate), SHARD_BUS_REQUEST_TIMEOUT)  # type: ignore
+
+    async def _append_common(self, messages: List[Message]) -> None:
+        """
+        Добавление сообщений в общий чат через шард 0, назначающий номера сообщений, одним запросом шины.
+
+        :param messages: Объекты сообщений одного отправителя.
+        :return: None.
+        """
+        if self._shard_id == self.COMMON_CHAT_SHARD:
+            return await super()._append_common(messages)
+        seqs = await self._bus.request(
+            self.COMMON_CHAT_SHARD,
+            'common_append',
+            {'sender': messages[0].sender, 'messages': self._encode_bus_messages(messages)}
+        )
+        for message, seq in zip(messages, seqs):
+            message.seq = seq
+        await self._wait_for_replica(self._common_chat_updated, lambda: self._common_chat.last_seq >= seqs[-1])
+
+    async def _append_private(self, sender_name: str, recipient_name: str, messages: List[Message]) -> str:
+        """
+        Добавление сообщений в приватный чат на шарде, за которым закреплен чат, одним запросом шины.
+
+        :param sender_name: Имя отправителя.
+        :param recipient_name: Имя получателя.
+        :param messages: Объекты сообщений.
+        :return: Название чата.
+        """
+        members = [sender_name, recipient_name]
+        shard_id = self._get_private_chat_shard(members)
+        if shard_id == self._shard_id:
+            return await super()._append_private(sender_name, recipient_name, messages)
+        chat_name, seqs = await self._bus.request(
+            shard_id,
+            'private_append',
+            {'sender': sender_name, 'recipient': recipient_name, 'messages': self._encode_bus_messages(messages)}
+        )
+        for message, seq in zip(messages, seqs):
+            message.seq = seq
+        if not self._users[sender_name].has_chat(chat_name):
+            if chat_name != Factories.get_private_chat_name(*members):
+                members.reverse()
+            self._add_known_private_chat(chat_name, members)
+        return chat_name
+
+    async def _read_private(self, user_name: str, partner_name: str, since: int) -> Tuple[Response, int]:
+        """
+        Чтение приватного чата на шарде, за которым закреплен чат.
+
+        :param user_name: Имя участника чата, от имени которого выполняется чтение.
+        :param partner_name: Имя второго участника чата.
+        :param since: Номер сообщения, после которого нужно вернуть сообщения.
+        :return: Строковый ответ и номер последнего возвращенного сообщения.
+        """
+        shard_id = self._get_private_chat_shard([user_name, partner_name])
+        if shard_id == self._shard_id:
+            return await super()._read_private(user_name, partner_name, since)
+        result, last_seq = await self._bus.request(
+            shard_id, 'private_read', {'user': user_name, 'partner': partner_name, 'since': since}
+        )
+        return result, last_seq
+
+    async def _search_private(
+        self, user_name: str, partner_name: str, query: SearchQuery, count: int
+    ) -> List[SearchResult]:
+        """
+        Поиск в приватном чате на шарде, за которым закреплен чат.
+
+        :param user_name: Имя участника чата, от имени которого выполняется поиск.
+        :param partner_name: Имя второго участника чата.
+        :param query: Поисковый запрос.
+        :param count: Наибольшее количество сообщений.
+        :return: Найденные сообщения по убыванию релевантности.
+        """
+        shard_id = self._get_private_chat_shard([user_name, partner_name])
+        if shard_id == self._shard_id:
+            return await super()._search_private(user_name, partner_name, query, count)
+        payload = {'user': user_name, 'partner': partner_name, 'query': asdict(query), 'count': count}
+        results = await self._bus.request(shard_id, 'private_search', payload)
+        return [(score, timestamp, line.encode()) for score, timestamp, line in results]
+
+    async def _read_history_private(
+        self, user_name: str, partner_name: str, since: int, start: Optional[int], count: int
+    ) -> Response:
+        """
+        Чтение страницы истории приватного чата на шарде, за которым закреплен чат.
+
+        :param user_name: Имя участника чата, от имени которого выполняется чтение.
+        :param partner_name: Имя второго участника чата.
+        :param since: Номер сообщения, после которого нужно вернуть сообщения.
+        :param start: Наиболее ранний момент отправки, микросекунды epoch.
+        :param count: Наибольшее количество сообщений.
+        :return: Строковый ответ.
+        """
+        shard_id = self._get_private_chat_shard([user_name, partner_name])
+        if shard_id == self._shard_id:
+            return await super()._read_history_private(user_name, partner_name, since, start, count)
+        payload = {'user': user_name, 'partner': partner_name, 'since': since, 'start': start, 'count': count}
+        return await self._bus.request(shard_id, 'private_history', payload)
+
+    async def _route_request(self, request_dto: RequestDto) -> Response:
+        """
+        Маршрутизация запроса: запросы, меняющие состояние пользователя, выполняет его домашний шард.
+
+        Подключение подтверждается, когда пользователь появился и на этом шарде, поэтому следующие запросы
+        клиента по тому же соединению его уже видят.
+
+        :param request_dto: Данные запроса.
+        :return: Ответ от сервера.
+        """
+        if request_dto.endpoint in ('connect', 'send', 'send_batch', 'schedule_send', 'cancel_scheduled', 'read_chat'):
+            shard_id = self._get_shard(request_dto.client_name)
+            if shard_id != self._shard_id:
+                result = await self._bus.request(shard_id, 'route', asdict(request_dto))
+                if request_dto.endpoint == 'connect' and result == 'OK':
+                    await self._wait_for_replica(self._users_updated, lambda: request_dto.client_name in self._users)
+                return result
+        return await super()._route_request(request_dto)
+
+    async def _handle_bus_request(self, kind: str, payload: Dict[str, Any]) -> Any:
+        """
+        Обработка запроса другого шарда.
+
+        :param kind: Тип запроса.
+        :param payload: Данные запроса.
+        :return: Результат, передаваемый в ответе.
+        """
+        if kind == 'route':
+            return str(await self._route_request(RequestDtoRowMapper.get_from_dict(payload)))
+        elif kind == 'common_append':
+            messages = self._decode_bus_messages(payload['sender'], payload['messages'])
+            await self._append_common(messages)
+            return [message.seq for message in messages]
+        elif kind == 'private_append':
+            messages = self._decode_bus_messages(payload['sender'], payload['messages'])
+            chat_name = await self._append_private(payload['sender'], payload['recipient'], messages)
+            return chat_name, [message.seq for message in messages]
+        elif kind == 'private_read':
+            result, last_seq = await self._read_private(payload['user'], payload['partner'], payload['since'])
+            return str(result), last_seq
+        elif kind == 'private_search':
+            results = await self._search_private(
+                payload['user'], payload['partner'], SearchQuery(**payload['query']), payload['count']
+            )
+            return [(score, timestamp, line.decode()) for score, timestamp, line in results]
+        elif kind == 'private_history':
+            return str(await self._read_history_private(
+                payload['user'], payload['partner'], payload['since'], payload['start'], payload['count']
+            ))
+        raise ValueError(f'Unknown shard bus request {kind}')
+
+    async def _handle_bus_event(self, event: Dict[str, Any]) -> None:
+        """
+        Применение события другого шарда: пользователи и чаты реплицируются с записью в журнал,
+        новые сообщения рассылаются локальным подписчикам.
+
+        :param event: Событие.
+        :return: None.
+        """
+        if event['type'] == 'connect':
+            if event['user'] not in self._users:
+                self._apply_event(event)
+                self._record('connect', user=event['user'], time=event['time'])
+                async with self._users_updated:  # type: ignore
+                    self._users_updated.notify_all()  # type: ignore
+        elif event['type'] == 'chat':
+            self._add_known_private_chat(Factories.get_private_chat_name(*event['members']), event['members'])
+        elif event['type'] == 'send':
+            message = Message.from_timestamp(
+                timestamp=event['time'],
+                sender_name=event['sender'],
+                text=event['text'],
+                seq=event['seq'],
+                attachment=event['attachment']
+            )
+            if not event['members']:
+                if not self._common_chat.add_replica_message(message):
+                    return
+                self._expiry.watch(self._common_chat)
+                self._record_message(self._common_chat.name, message, replica=True)
+                async with self._common_chat_updated:  # type: ignore
+                    self._common_chat_updated.notify_all()  # type: ignore
+            self._publish(self._get_chat_key(event['members']), message)
+
+    async def listen(self):
+        """
+        Подключение к шине шардов и запуск сервера.
+
+        :return: None.
+        """
+        self._common_chat_updated = Condition()
+        self._users_updated = Condition()
+        await self._bus.start()
+        server_logger.info('Shard %s of %s joined shard bus', self._shard_id, self._shard_count)
+        try:
+            await super().listen()
+        finally:
+            await self._bus.stop()
+
+
+def get_shard_path(path: str, shard_id: int) -> str:
+    """
+    Путь к файлу шарда: номер шарда добавляется перед расширением.
+
+    :param path: Путь к файлу.
+    :param shard_id: Номер шарда.
+    :return: Путь к файлу шарда.
+    """
+    root, extension = splitext(path)
+    return f'{root}.{shard_id}{extension}'
+
+
+async def serve_shard(
+    host: str, port: int, shard_id: int, shard_count: int, user_send_limit: Optional[int],
+    global_send_limit: Optional[int], history: bool = HISTORY_ENABLED
+) -> None:
+    """
+    Запуск шарда сервера в текущем процессе.
+
+    :param host: Хост сервера.
+    :param port: Порт сервера.
+    :param shard_id: Номер шарда.
+    :param shard_count: Количество шардов.
+    :param user_send_limit: Лимит сообщений пользователя в общий чат за период, None - без ограничения.
+    :param global_send_limit: Лимит сообщений шарда за период, None - без ограничения.
+    :param history: Переносить ли сообщения, вышедшие из горячего окна, в холодную историю шарда.
+    :return: None.
+    """
+    snapshot_path = get_shard_path(SERVER_SNAPSHOT_PATH, shard_id)
+    server = ShardedServer(
+        host=host,
+        port=port,
+        shard_id=shard_id,
+        shard_count=shard_count,
+        journal=Journal(path=get_shard_path(JOURNAL_PATH, shard_id), snapshot_path=snapshot_path),
+        snapshot_path=snapshot_path,
+        user_send_limit=user_send_limit,
+        global_send_limit=global_send_limit,
+        history_path=get_shard_path(HISTORY_PATH, shard_id) if history else None
+    )
+
+    stopping = False
+
+    def keyboard_interrupt_handler(signal_number: int, stack_frame: FrameType) -> None:
+        """
+        Обработчик прерывания клавиатуры.
+
+        SIGINT может прийти дважды: от терминала всей группе процессов и от главного процесса.
+
+        :return: None.
+        """
+        nonlocal stopping
+        if stopping:
+            return
+        stopping = True
+        server.save_to_config()
+        exit(0)
+
+    signal(SIGINT, keyboard_interrupt_handler)
+
+    server.update_from_config()
+    await server.listen()
+
+
+def run_shard(
+    host: str, port: int, shard_id: int, shard_count: int, log_level: str, user_send_limit: Optional[int],
+    global_send_limit: Optional[int], history: bool = HISTORY_ENABLED
+) -> None:
+    """
+    Точка входа процесса шарда.
+
+    :param host: Хост сервера.
+    :param port: Порт сервера.
+    :param shard_id: Номер шарда.
+    :param shard_count: Количество шардов.
+    :param log_level: Уровень журналирования.
+    :param user_send_limit: Лимит сообщений пользователя в общий чат за период, None - без ограничения.
+    :param global_send_limit: Лимит сообщений шарда за период, None - без ограничения.
+    :param history: Переносить ли сообщения, вышедшие из горячего окна, в холодную историю шарда.
+    :return: None.
+    """
+    LogPipeline.start(log_level)
+    run(serve_shard(host, port, shard_id, shard_count, user_send_limit, global_send_limit, history))
+
+
+def run_workers(
+    host: str, port: int, workers: int, log_level: str = LOG_LEVEL,
+    user_send_limit: Optional[int] = USER_SEND_RATE_LIMIT, global_send_limit: Optional[int] = GLOBAL_SEND_RATE_LIMIT,
+    history: bool = HISTORY_ENABLED
+) -> None:
+    """
+    Запуск шардов сервера в отдельных процессах и ожидание их завершения.
+
+    :param host: Хост сервера.
+    :param port: Порт сервера.
+    :param workers: Количество процессов.
+    :param log_level: Уровень журналирования.
+    :param user_send_limit: Лимит сообщений пользователя в общий чат за период, None - без ограничения.
+    :param global_send_limit: Лимит сообщений шарда за период, None - без ограничения.
+    :param history: Переносить ли сообщения, вышедшие из горячего окна, в холодную историю шардов.
+    :return: None.
+    """
+    server_logger.info('Start %s server workers on %s:%s', workers, host, port)
+    context = get_context('spawn')
+    processes = [
+        context.Process(
+            target=run_shard, args=(
+                host, port, shard_id, workers, log_level, user_send_limit, global_send_limit, history
+            ),
+            name=f'shard-{shard_id}'
+        )
+        for shard_id in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    def stop_handler(signal_number: int, stack_frame: FrameType) -> None:
+        """
+        Обработчик остановки: шарды получают SIGINT, сохраняют снимки и завершаются.
+
+        :return: None.
+        """
+        for worker in processes:
+            if worker.is_alive():
+                kill(worker.pid, SIGINT)  # type: ignore
+
+    signal(SIGINT, stop_handler)
+    signal(SIGTERM, stop_handler)
+    for process in processes:
+        process.join()
@@ -0,0 +1,28 @@
+from typing import Callable
+
+import pytest
+
+from server import Server
+from utils import Factories
+
+
+@pytest.fixture
+def make_server(tmp_path) -> Callable[..., Server]:
+    """
+    Фабрика сервера без журнала и ограничений частоты, файлы которого хранятся во временном каталоге теста.
+    """
+    def factory(**kwargs) -> Server:
+        options = dict(
+            host='127.0.0.1',
+            port=0,
+            common_chat=Factories.get_empty_common_chat(),
+            private_chats=dict(),
+            users=dict(),
+            snapshot_path=str(tmp_path / 'snapshot.jsonl'),
+            user_send_limit=None,
+            global_send_limit=None,
+            attachments_path=str(tmp_path / 'attachments'),
+        )
+        options.update(kwargs)
+        return Server(**options)
+    return factory
@@ -0,0 +1,37 @@
+from asyncio import sleep
+from asyncio import start_server
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+from typing import Callable
+
+from server import Server
+
+
+@asynccontextmanager
+async def serve(server: Server) -> AsyncIterator[int]:
+    """
+    Запуск сервера на свободном порту.
+
+    :param server: Сервер.
+    :return: Порт сервера.
+    """
+    listener = await start_server(server._process_request, '127.0.0.1', 0)
+    try:
+        yield listener.sockets[0].getsockname()[1]
+    finally:
+        listener.close()
+
+
+async def wait_until(predicate: Callable[[], bool], timeout: float = 5) -> None:
+    """
+    Ожидание выполнения условия.
+
+    :param predicate: Условие.
+    :param timeout: Наибольшее время ожидания в секундах.
+    :return: None.
+    """
+    for _ in range(int(timeout / 0.01)):
+        if predicate():
+            return
+        await sleep(0.01)
+    raise AssertionError('Condition was not met in time')
@@ -0,0 +1,115 @@
+from asyncio import run
+from os.path import join
+from typing import List
+
+from builtin_types import ChatHistory
+from builtin_types import Message
+from client import Client
+from tests.helpers import serve
+
+# Названия приватных чатов пар (x, y and z) и (x and y, z) совпадают: "x and y and z".
+COLLIDING_NAME = 'x and y and z'
+
+
+def test_private_chats_with_colliding_names_have_separate_history(make_server, tmp_path):
+    async def scenario():
+        server = make_server(history_path=str(tmp_path / 'history'))
+        async with serve(server) as port:
+            clients = {name: Client(name, '127.0.0.1', port) for name in ('x', 'y and z', 'x and y', 'z')}
+            for client in clients.values():
+                assert await client.connect_user() == 'OK'
+            await clients['x'].send_message('for y and z', recipient='y and z')
+            await clients['x and y'].send_message('for z', recipient='z')
+            for chat in server._private_chats.values():
+                chat.expire_through(chat.last_seq)
+            server._sync_history()
+            # Как после перезапуска: индекс истории читается с диска заново.
+            for chat in server._private_chats.values():
+                chat.history = None
+            server._attach_history(server._private_chats.values())
+
+            x_history = await clients['x'].read_history(COLLIDING_NAME)
+            z_history = await clients['z'].read_history(COLLIDING_NAME)
+            assert 'for y and z' in x_history and 'for z' not in x_history
+            assert 'for z' in z_history and 'for y and z' not in z_history
+            for client in clients.values():
+                await client.close()
+
+    run(scenario())
+
+
+def make_messages(first_seq: int, count: int) -> List[Message]:
+    return [
+        Message.from_timestamp(timestamp=1_000_000 * seq, sender_name='alice', text=f'message {seq}', seq=seq)
+        for seq in range(first_seq, first_seq + count)
+    ]
+
+
+def test_history_reads_messages_from_blocks_and_memory(tmp_path):
+    async def scenario():
+        history = ChatHistory(str(tmp_path / 'chat'), block_size=4)
+        for message in make_messages(1, 10):
+            history.append(message)
+        await history.flush()
+        assert history.blocks == 2
+
+        assert [message.seq for message in await history.read(3, 5)] == [3, 4, 5, 6, 7]
+        assert [message.seq for message in await history.read(8, 10)] == [8, 9, 10]
+        assert await history.find_seq(5_500_000) == 6
+        assert await history.find_seq(9_000_000) == 9
+        assert await history.find_seq(11_000_000) is None
+
+    run(scenario())
+
+
+def test_history_is_reloaded_from_disk(tmp_path):
+    async def scenario():
+        path = str(tmp_path / 'chat')
+        history = ChatHistory(path, block_size=4)
+        for message in make_messages(1, 10):
+            history.append(message)
+        await history.flush(durable=True)
+
+        reopened = ChatHistory(path, block_size=4)
+        assert [message.text for message in await reopened.read(1, 20)] == [f'message {seq}' for seq in range(1, 11)]
+        # Повторный перенос при восстановлении из журнала не создает дубликатов.
+        for message in make_messages(5, 8):
+            reopened.append(message)
+        await reopened.flush(durable=True)
+        assert [message.seq for message in await reopened.read(1, 20)] == list(range(1, 13))
+
+    run(scenario())
+
+
+def test_history_ignores_torn_index_record(tmp_path):
+    async def scenario():
+        path = str(tmp_path / 'chat')
+        history = ChatHistory(path, block_size=4)
+        for message in make_messages(1, 8):
+            history.append(message)
+        await history.flush(durable=True)
+        with open(join(path, '1.idx'), 'ab') as file:
+            file.write(b'\x00' * 7)
+
+        reopened = ChatHistory(path, block_size=4)
+        assert [message.seq for message in await reopened.read(1, 20)] == list(range(1, 9))
+        for message in make_messages(9, 4):
+            reopened.append(message)
+        await reopened.flush(durable=True)
+        assert reopened.blocks == 3
+
+    run(scenario())
+
+
+def test_history_sync_writes_partial_block(tmp_path):
+    path = str(tmp_path / 'chat')
+    history = ChatHistory(path, block_size=4)
+    for message in make_messages(1, 6):
+        history.append(message)
+    history.sync()
+    assert history.blocks == 2
+
+    async def scenario():
+        assert [message.seq for message in await ChatHistory(path).read(1, 20)] == list(range(1, 7))
+
+    run(scenario())
@@ -0,0 +1,79 @@
+from asyncio import gather
+from asyncio import open_connection
+from asyncio import run
+from typing import Any
+from typing import Dict
+
+from client import Client
+from settings import FRAMED_PROTOCOL_MARKER
+from tests.helpers import serve
+from utils import FramedConnection
+from utils.framed_connection import FRAME_HEADER
+
+
+def make_request(request_id: int, client_name: str, endpoint: str, **fields: Any) -> Dict[str, Any]:
+    return {
+        'request_id': request_id, 'client_name': client_name, 'endpoint': endpoint,
+        'message': '', 'recipient': '', 'chat_name': '', **fields
+    }
+
+
+def test_pipelined_frames_get_responses_with_their_request_ids(make_server):
+    async def scenario():
+        async with serve(make_server()) as port:
+            reader, writer = await open_connection('127.0.0.1', port)
+            writer.write(FRAMED_PROTOCOL_MARKER)
+            connection = FramedConnection(reader, writer)
+            await connection.write_frame(make_request(1, 'alice', 'connect'))
+            await connection.write_frame(make_request(2, 'bob', 'connect'))
+            await connection.write_frame(make_request(3, 'alice', 'unknown'))
+            responses = {frame['request_id']: frame for frame in [await connection.read_frame() for _ in range(3)]}
+            await connection.close()
+
+        assert responses[1]['response'] == 'OK'
+        assert responses[2]['response'] == 'OK'
+        assert responses[3]['response'] == 'Unknown endpoint or unregister user'
+
+    run(scenario())
+
+
+def test_concurrent_requests_share_one_connection(make_server):
+    async def scenario():
+        server = make_server()
+        async with serve(server) as port:
+            alice = Client('alice', '127.0.0.1', port)
+            assert await alice.connect_user() == 'OK'
+            connection = alice._connection
+            responses = await gather(*(alice.send_message(f'message {number}') for number in range(20)))
+            assert alice._connection is connection
+            assert server._connected_clients == 1
+            chat = await alice.read_chat(server._common_chat.name, since=0)
+            await alice.close()
+
+        assert len(responses) == 20
+        assert all(f'message {number}' in chat for number in range(20))
+
+    run(scenario())
+
+
+def test_one_request_per_connection_mode_is_still_served(make_server):
+    async def scenario():
+        server = make_server()
+        async with serve(server) as port:
+            alice = Client('alice', '127.0.0.1', port, persistent=False)
+            assert await alice.connect_user() == 'OK'
+            await alice.send_message('hello')
+            assert 'alice: hello' in await alice.read_chat(server._common_chat.name, since=0)
+
+    run(scenario())
+
+
+def test_oversized_frame_closes_connection(make_server):
+    async def scenario():
+        async with serve(make_server()) as port:
+            reader, writer = await open_connection('127.0.0.1', port)
+            writer.write(FRAMED_PROTOCOL_MARKER + FRAME_HEADER.pack(2 ** 31))
+            assert await reader.read() == b''
+            writer.close()
+
+    run(scenario())
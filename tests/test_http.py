@@ -0,0 +1,36 @@
+from asyncio import open_connection
+from asyncio import run
+
+from tests.helpers import serve
+
+
+async def exchange(port: int, request: bytes) -> bytes:
+    reader, writer = await open_connection('127.0.0.1', port)
+    writer.write(request)
+    writer.write_eof()
+    response = await reader.read()
+    writer.close()
+    return response
+
+
+def test_malformed_legacy_request_starting_with_letter_gets_bad_request(make_server):
+    async def scenario():
+        async with serve(make_server()) as port:
+            response = await exchange(port, b'not json')
+        assert response.startswith(b'HTTP/1.1 400 ')
+        assert b'malformed request line' in response
+
+    run(scenario())
+
+
+def test_http_request_is_served(make_server):
+    async def scenario():
+        async with serve(make_server()) as port:
+            body = b'{"client_name": "alice"}'
+            response = await exchange(
+                port, b'POST /connect HTTP/1.1\r\nContent-Length: %d\r\n\r\n%s' % (len(body), body)
+            )
+        assert response.startswith(b'HTTP/1.1 200 OK')
+        assert response.endswith(b'{"response": "OK"}')
+
+    run(scenario())
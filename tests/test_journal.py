@@ -0,0 +1,105 @@
+from asyncio import run
+
+from builtin_types import Message
+from client import Client
+from tests.helpers import serve
+from utils import Journal
+
+
+def test_journal_replays_events_after_lsn(tmp_path):
+    async def scenario():
+        journal = Journal(str(tmp_path / 'journal.log'), str(tmp_path / 'snapshot.jsonl'), flush_interval=0)
+        await journal.start()
+        for seq in range(1, 6):
+            journal.append({'type': 'expire', 'chat': 'common', 'seq': seq})
+        await journal.stop()
+
+        assert [event['seq'] for event in journal.read(after_lsn=2)] == [3, 4, 5]
+        assert [event['lsn'] for event in journal.read()] == [1, 2, 3, 4, 5]
+
+    run(scenario())
+
+
+def test_journal_truncates_torn_tail_before_appending(tmp_path):
+    async def scenario():
+        path = tmp_path / 'journal.log'
+        journal = Journal(str(path), str(tmp_path / 'snapshot.jsonl'), flush_interval=0)
+        await journal.start()
+        journal.append({'type': 'expire', 'chat': 'common', 'seq': 1})
+        journal.append({'type': 'expire', 'chat': 'common', 'seq': 2})
+        await journal.stop()
+        with open(path, 'ab') as file:
+            file.write(b'{"lsn":3,"type":"exp')
+
+        recovered = Journal(str(path), str(tmp_path / 'snapshot.jsonl'), flush_interval=0)
+        for event in recovered.read():
+            recovered.last_lsn = event['lsn']
+        assert recovered.last_lsn == 2
+        await recovered.start()
+        recovered.append({'type': 'expire', 'chat': 'common', 'seq': 3})
+        await recovered.stop()
+
+        assert [event['seq'] for event in recovered.read()] == [1, 2, 3]
+
+    run(scenario())
+
+
+def test_read_cursors_are_journaled_in_one_event_and_replayed(make_server, tmp_path):
+    async def scenario():
+        journal_path = str(tmp_path / 'journal.log')
+        snapshot_path = str(tmp_path / 'snapshot.jsonl')
+        server = make_server(journal=Journal(journal_path, snapshot_path, flush_interval=0))
+        await server._journal.start()
+        async with serve(server) as port:
+            alice = Client('alice', '127.0.0.1', port)
+            bob = Client('bob', '127.0.0.1', port)
+            assert await alice.connect_user() == 'OK'
+            assert await bob.connect_user() == 'OK'
+            for number in range(3):
+                await alice.send_message(f'message {number}', recipient='bob')
+                await bob.read_chat('alice and bob')
+            await alice.close()
+            await bob.close()
+        server._record_read_cursors()
+        await server._journal.stop()
+
+        events = list(Journal(journal_path, snapshot_path).read())
+        assert [event['type'] for event in events].count('cursors') == 1
+        assert ['bob', 'alice and bob', 3] in events[-1]['cursors']
+
+        recovered = make_server(journal=Journal(journal_path, snapshot_path))
+        recovered.update_from_config()
+        assert recovered._users['bob'].get_read_cursor('alice and bob') == 3
+
+    run(scenario())
+
+
+def test_journal_keeps_send_time_in_microseconds(make_server, tmp_path):
+    async def scenario():
+        journal_path = str(tmp_path / 'journal.log')
+        snapshot_path = str(tmp_path / 'snapshot.jsonl')
+        server = make_server(journal=Journal(journal_path, snapshot_path, flush_interval=0))
+        await server._journal.start()
+        async with serve(server) as port:
+            alice = Client('alice', '127.0.0.1', port)
+            assert await alice.connect_user() == 'OK'
+            await alice.send_message('hello')
+            await alice.close()
+        await server._journal.stop()
+        message = list(server._common_chat.get_messages())[-1]
+        events = {event['type']: event for event in Journal(journal_path, snapshot_path).read()}
+        assert events['send']['time'] == message.timestamp
+        assert events['connect']['time'] == Message.get_timestamp(server._users['alice'].creation_datetime)
+        with open(journal_path, 'a') as file:
+            # Событие прежнего формата со временем в секундах.
+            file.write('{"lsn":100,"type":"send","chat":"%s","sender":"alice","text":"old","time":1700000000.25}\n'
+                       % server._common_chat.name)
+
+        recovered = make_server(journal=Journal(journal_path, snapshot_path))
+        recovered.update_from_config()
+        replayed = {item.text: item.timestamp for item in recovered._common_chat.get_messages(since=0)}
+        assert replayed['hello'] == message.timestamp
+        assert replayed['old'] == 1_700_000_000_250_000
+        assert recovered._users['alice'].creation_datetime == server._users['alice'].creation_datetime
+
+    run(scenario())
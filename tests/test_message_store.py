@@ -0,0 +1,72 @@
+from datetime import datetime
+from typing import List
+
+from builtin_types import Message
+from builtin_types.message_store import COMPACTION_THRESHOLD
+from builtin_types.message_store import MessageStore
+
+SECOND = 1_000_000
+
+
+def make_store(count: int, **kwargs) -> MessageStore:
+    store = MessageStore(**kwargs)
+    for number in range(1, count + 1):
+        store.append(Message.from_timestamp(timestamp=number * SECOND, sender_name='alice', text=f'message {number}'))
+    return store
+
+
+def seqs(messages) -> List[int]:
+    return [message.seq for message in messages]
+
+
+def test_append_assigns_consecutive_seqs():
+    store = make_store(5)
+    assert len(store) == 5
+    assert store.first_seq == 1 and store.last_seq == 5
+    assert seqs(store.view(store.index_after(2))) == [3, 4, 5]
+    assert seqs(store.view(store.index_after(5))) == []
+
+
+def test_expire_by_deadline_uses_send_time_and_limit():
+    store = make_store(10)
+    assert store.expire(Message.get_datetime(3 * SECOND)) == 3
+    assert store.first_seq == 4
+    assert store.expire(Message.get_datetime(8 * SECOND), limit=2) == 2
+    assert store.first_seq == 6
+    assert store.first_timestamp == 6 * SECOND
+    assert store.index_before(Message.get_datetime(7 * SECOND)) == 1
+
+
+def test_view_skips_messages_expired_after_it_was_taken():
+    store = make_store(6)
+    view = store.view(0)
+    store.expire_through(4)
+    assert seqs(view) == [5, 6]
+    assert view.last_seq == 6
+
+
+def test_limits_drop_oldest_messages():
+    assert seqs(make_store(10, max_count=3).view(0)) == [8, 9, 10]
+    last_size = sum(message.size for message in make_store(10).iter_range(7, 10))
+    assert seqs(make_store(10, max_bytes=last_size).view(0)) == [7, 8, 9, 10]
+
+
+def test_compaction_keeps_indexes_consistent():
+    count = COMPACTION_THRESHOLD * 3
+    store = make_store(count)
+    store.expire_through(COMPACTION_THRESHOLD * 2)
+    assert store.first_seq == COMPACTION_THRESHOLD * 2 + 1
+    assert seqs(store.iter_range(count - 1, count + 5)) == [count - 1, count]
+    assert store.index_from((count - 9) * SECOND) == len(store) - 10
+    store.expire(datetime.fromtimestamp(count))
+    assert len(store) == 0 and store.first_timestamp is None
+
+
+def test_replica_messages_skip_duplicates_and_close_gaps():
+    store = make_store(3)
+    duplicate = Message.from_timestamp(timestamp=4 * SECOND, sender_name='bob', text='duplicate', seq=2)
+    assert not store.append_replica(duplicate)
+    later = Message.from_timestamp(timestamp=5 * SECOND, sender_name='bob', text='later', seq=6)
+    assert store.append_replica(later)
+    assert seqs(store.view(0)) == [6]
+    assert store.last_seq == 6
@@ -0,0 +1,52 @@
+from asyncio import create_task
+from asyncio import run
+from asyncio import wait_for
+
+from client import Client
+from tests.helpers import serve
+from tests.helpers import wait_until
+
+# Названия приватных чатов пар (x, y and z) и (x and y, z) совпадают: "x and y and z".
+COLLIDING_NAME = 'x and y and z'
+
+
+def test_private_chats_with_colliding_names_are_separate(make_server):
+    async def scenario():
+        async with serve(make_server()) as port:
+            clients = {name: Client(name, '127.0.0.1', port) for name in ('x', 'y and z', 'x and y', 'z')}
+            for client in clients.values():
+                assert await client.connect_user() == 'OK'
+            await clients['x'].send_message('for y and z', recipient='y and z')
+            await clients['x and y'].send_message('for z', recipient='z')
+
+            x_chat = await clients['x'].read_chat(COLLIDING_NAME, since=0)
+            z_chat = await clients['z'].read_chat(COLLIDING_NAME, since=0)
+            assert 'for y and z' in x_chat and 'for z' not in x_chat
+            assert 'for z' in z_chat and 'for y and z' not in z_chat
+            for client in clients.values():
+                await client.close()
+
+    run(scenario())
+
+
+def test_subscription_ignores_chat_with_colliding_name(make_server):
+    async def scenario():
+        server = make_server()
+        async with serve(server) as port:
+            clients = {name: Client(name, '127.0.0.1', port) for name in ('x', 'y and z', 'x and y', 'z')}
+            for client in clients.values():
+                assert await client.connect_user() == 'OK'
+            await clients['x'].send_message('hello', recipient='y and z')
+
+            subscription = clients['x'].subscribe(COLLIDING_NAME)
+            first_event = create_task(subscription.__anext__())
+            await wait_until(lambda: bool(server._subscribers))
+            await clients['x and y'].send_message('secret', recipient='z')
+            await clients['y and z'].send_message('reply', recipient='x')
+
+            assert 'reply' in await wait_for(first_event, 5)
+            await subscription.aclose()
+            for client in clients.values():
+                await client.close()
+
+    run(scenario())
@@ -0,0 +1,55 @@
+from asyncio import run
+
+from client import Client
+from tests.helpers import serve
+
+
+def test_read_chat_returns_only_unread_messages(make_server):
+    async def scenario():
+        server = make_server()
+        async with serve(server) as port:
+            alice = Client('alice', '127.0.0.1', port)
+            bob = Client('bob', '127.0.0.1', port)
+            assert await alice.connect_user() == 'OK'
+            assert await bob.connect_user() == 'OK'
+            await alice.send_message('one', recipient='bob')
+            await alice.send_message('two', recipient='bob')
+
+            first = await bob.read_chat('alice and bob')
+            assert 'alice: one' in first and 'alice: two' in first
+            assert await bob.read_chat('alice and bob') == ''
+
+            await alice.send_message('three', recipient='bob')
+            unread = await bob.read_chat('alice and bob')
+            assert 'alice: three' in unread and 'alice: two' not in unread
+            assert server._users['bob'].get_read_cursor('alice and bob') == 3
+
+            # Явный since возвращает сообщения после него, не сдвигая курсор назад.
+            again = await bob.read_chat('alice and bob', since=1)
+            assert 'alice: one' not in again and 'alice: two' in again
+            assert server._users['bob'].get_read_cursor('alice and bob') == 3
+            await alice.close()
+            await bob.close()
+
+    run(scenario())
+
+
+def test_cursors_are_kept_per_user_and_chat(make_server):
+    async def scenario():
+        server = make_server()
+        async with serve(server) as port:
+            alice = Client('alice', '127.0.0.1', port)
+            bob = Client('bob', '127.0.0.1', port)
+            assert await alice.connect_user() == 'OK'
+            assert await bob.connect_user() == 'OK'
+            await alice.send_message('public')
+            await alice.send_message('private', recipient='bob')
+
+            assert 'alice: private' in await bob.read_chat('alice and bob')
+            assert 'alice: public' in await bob.read_chat(server._common_chat.name)
+            assert await bob.read_chat(server._common_chat.name) == ''
+            assert server._users['alice'].get_read_cursor('alice and bob') == 1
+            await alice.close()
+            await bob.close()
+
+    run(scenario())
@@ -0,0 +1,65 @@
+from asyncio import create_task
+from asyncio import run
+from time import time
+from typing import List
+
+from builtin_types import ScheduledMessage
+from builtin_types.message import MICROSECONDS
+from client import Client
+from tests.helpers import serve
+from tests.helpers import wait_until
+from utils import Metrics
+from utils import SendScheduler
+
+
+def test_scheduler_sends_due_messages_in_order_and_in_batches():
+    async def scenario():
+        batches: List[List[str]] = list()
+
+        async def deliver(batch: List[ScheduledMessage]) -> None:
+            batches.append([message.text for message in batch])
+
+        scheduler = SendScheduler(deliver=deliver, metrics=Metrics(), batch_size=2)
+        now = round(time() * MICROSECONDS)
+        for number in (3, 1, 4, 2, 5):
+            scheduler.schedule('alice', '', f'message {number}', now - 1000 + number)
+        cancelled = scheduler.schedule('alice', '', 'cancelled', now - 500)
+        later = scheduler.schedule('alice', '', 'later', now + MICROSECONDS // 10)
+        assert scheduler.cancel(cancelled.schedule_id) is cancelled
+        assert scheduler.cancel(cancelled.schedule_id) is None
+
+        task = create_task(scheduler.run())
+        await wait_until(lambda: len(scheduler) == 0)
+        task.cancel()
+
+        assert batches == [['message 1', 'message 2'], ['message 3', 'message 4'], ['message 5'], ['later']]
+        assert scheduler.get(later.schedule_id) is None and scheduler.last_id == later.schedule_id
+
+    run(scenario())
+
+
+def test_scheduled_message_is_delivered_and_cancelled_only_by_sender(make_server):
+    async def scenario():
+        server = make_server()
+        scheduler_task = create_task(server._scheduler.run())
+        async with serve(server) as port:
+            alice = Client('alice', '127.0.0.1', port)
+            bob = Client('bob', '127.0.0.1', port)
+            assert await alice.connect_user() == 'OK'
+            assert await bob.connect_user() == 'OK'
+
+            assert (await alice.schedule_message('soon', recipient='bob', delay=0)).isdigit()
+            await wait_until(lambda: any(chat.last_seq for chat in server._private_chats.values()))
+            assert 'alice: soon' in await bob.read_chat('alice and bob')
+
+            schedule_id = int(await alice.schedule_message('never', delay=3600))
+            assert await bob.cancel_scheduled(schedule_id) == 'Scheduled message not found'
+            assert await alice.cancel_scheduled(schedule_id) == 'OK'
+            assert len(server._scheduler) == 0
+            assert (await alice.schedule_message('late', delay=10 ** 9)).startswith('Send time must be within')
+            assert await alice.schedule_message('nobody', recipient='carol', delay=0) == 'Recipient not found'
+            await alice.close()
+            await bob.close()
+        scheduler_task.cancel()
+
+    run(scenario())
@@ -0,0 +1,65 @@
+from asyncio import run
+from typing import List
+
+from builtin_types import SearchIndex
+from builtin_types import SearchQuery
+from client import Client
+from tests.helpers import serve
+
+
+def search(index: SearchIndex, text: str, first_seq: int = 1, last_seq: int = 100) -> List[int]:
+    return [seq for _, seq in SearchIndex.rank(index.search(SearchQuery.parse(text), first_seq, last_seq))]
+
+
+def test_query_parsing_separates_words_and_prefixes():
+    query = SearchQuery.parse('Red  apple* red, pie', sender='alice')
+    assert query.terms == ['red', 'pie']
+    assert query.prefixes == ['apple']
+    assert query.sender == 'alice' and query.size == 3
+
+
+def test_index_ranks_by_matched_words_then_newest():
+    index = SearchIndex()
+    for seq, text in enumerate(['red apple', 'green apple pie', 'apple', 'pie'], start=1):
+        index.add(seq, text)
+    assert search(index, 'apple') == [3, 2, 1]
+    assert search(index, 'apple pie') == [2, 4, 3, 1]
+    assert search(index, 'apple', first_seq=2, last_seq=2) == [2]
+    assert search(index, 'gr*') == [2]
+
+
+def test_index_forgets_removed_messages():
+    index = SearchIndex()
+    index.add(1, 'grape')
+    index.add(2, 'grapefruit grape')
+    index.remove('grape')
+    assert search(index, 'grape') == [2]
+    assert search(index, 'grape*') == [2]
+    index.remove('grapefruit grape')
+    assert search(index, 'grape*') == []
+    assert len(index) == 0
+    index.add(3, 'grape')
+    assert search(index, 'grape*') == [3]
+
+
+def test_search_covers_only_chats_of_user(make_server):
+    async def scenario():
+        async with serve(make_server()) as port:
+            clients = {name: Client(name, '127.0.0.1', port) for name in ('alice', 'bob', 'carol')}
+            for client in clients.values():
+                assert await client.connect_user() == 'OK'
+            await clients['alice'].send_message('red apple')
+            await clients['bob'].send_message('green apple pie')
+            await clients['alice'].send_message('apple secret', recipient='bob')
+
+            assert 'apple secret' in await clients['bob'].search('apple')
+            assert 'apple secret' not in await clients['carol'].search('apple')
+            by_alice = (await clients['bob'].search('app*', sender='alice')).splitlines()
+            assert len(by_alice) == 2 and all('alice: ' in line for line in by_alice)
+            page = (await clients['bob'].search('apple', offset=1, limit=1)).splitlines()
+            assert len(page) == 1 and page[0].startswith('[Common]') and 'green apple pie' in page[0]
+            assert await clients['bob'].search('nothing') == 'No messages found'
+            for client in clients.values():
+                await client.close()
+
+    run(scenario())
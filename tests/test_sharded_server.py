@@ -0,0 +1,105 @@
+from asyncio import Condition
+from asyncio import create_task
+from asyncio import run
+from asyncio import wait_for
+from contextlib import AsyncExitStack
+from contextlib import asynccontextmanager
+from os import getpid
+from typing import AsyncIterator
+from typing import List
+from typing import Tuple
+
+from client import Client
+from sharded_server import ShardedServer
+from tests.helpers import serve
+from tests.helpers import wait_until
+
+SHARD_COUNT = 2
+# Порт задает только пути сокетов шины шардов: шарды слушают клиентов на свободных портах.
+BUS_PORT = 40000 + getpid() % 20000
+
+
+@asynccontextmanager
+async def run_shards(tmp_path) -> AsyncIterator[List[Tuple[ShardedServer, int]]]:
+    """
+    Запуск шардов в текущем процессе: шина шардов работает через Unix-сокеты, как между процессами.
+
+    :param tmp_path: Временный каталог теста.
+    :return: Пары (шард, порт).
+    """
+    shards = [
+        ShardedServer(
+            host='127.0.0.1', port=BUS_PORT, shard_id=shard_id, shard_count=SHARD_COUNT,
+            snapshot_path=str(tmp_path / f'snapshot.{shard_id}.jsonl'), user_send_limit=None, global_send_limit=None
+        )
+        for shard_id in range(SHARD_COUNT)
+    ]
+    async with AsyncExitStack() as stack:
+        ports = list()
+        for shard in shards:
+            shard._common_chat_updated = Condition()
+            shard._users_updated = Condition()
+            await shard._bus.start()
+            stack.push_async_callback(shard._bus.stop)
+            ports.append(await stack.enter_async_context(serve(shard)))
+        yield list(zip(shards, ports))
+
+
+def get_users(shards: List[Tuple[ShardedServer, int]]) -> Tuple[str, str]:
+    """
+    Имена двух пользователей с разными домашними шардами.
+    """
+    names = [f'user{number}' for number in range(20)]
+    first = names[0]
+    second = next(name for name in names if shards[0][0]._get_shard(name) != shards[0][0]._get_shard(first))
+    return first, second
+
+
+def test_requests_are_routed_to_home_shards(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    async def scenario():
+        async with run_shards(tmp_path) as shards:
+            first_name, second_name = get_users(shards)
+            first = Client(first_name, '127.0.0.1', shards[0][1])
+            second = Client(second_name, '127.0.0.1', shards[1][1])
+            assert await first.connect_user() == 'OK'
+            assert await second.connect_user() == 'OK'
+            await wait_until(lambda: all(second_name in shard._users for shard, _ in shards))
+
+            await first.send_message('hello', recipient=second_name)
+            await second.send_message('public')
+            private_chat = f'{first_name} and {second_name}'
+            assert f'{first_name}: hello' in await second.read_chat(private_chat)
+            await wait_until(lambda: all(shard._common_chat.last_seq == 1 for shard, _ in shards))
+            assert f'{second_name}: public' in await first.read_chat(shards[0][0]._common_chat.name, since=0)
+            assert await second.read_chat(private_chat) == ''
+            await first.close()
+            await second.close()
+
+    run(scenario())
+
+
+def test_subscriber_receives_messages_sent_through_other_shard(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    async def scenario():
+        async with run_shards(tmp_path) as shards:
+            first_name, second_name = get_users(shards)
+            first = Client(first_name, '127.0.0.1', shards[0][1])
+            second = Client(second_name, '127.0.0.1', shards[1][1])
+            assert await first.connect_user() == 'OK'
+            assert await second.connect_user() == 'OK'
+            await wait_until(lambda: all(second_name in shard._users for shard, _ in shards))
+            await first.send_message('start', recipient=second_name)
+
+            subscription = first.subscribe(f'{first_name} and {second_name}')
+            event = create_task(subscription.__anext__())
+            await wait_until(lambda: bool(shards[0][0]._subscribers))
+            await second.send_message('reply', recipient=first_name)
+            assert f'{second_name}: reply' in await wait_for(event, 5)
+            await subscription.aclose()
+            await first.close()
+            await second.close()
+
+    run(scenario())
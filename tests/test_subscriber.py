@@ -0,0 +1,98 @@
+from asyncio import Event
+from asyncio import run
+from asyncio import sleep
+from json import loads
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Sequence
+
+from builtin_types import Message
+from tests.helpers import wait_until
+from utils import FramedConnection
+from utils import Subscriber
+
+
+class StalledConnection:
+    """
+    Соединение, запись в которое ждет освобождения, как у медленного клиента.
+    """
+    encode_text_frame = staticmethod(FramedConnection.encode_text_frame)
+
+    def __init__(self):
+        self.frames: List[Dict[str, Any]] = list()
+        self.released = Event()
+
+    async def write_frame(self, payload: Dict[str, Any]) -> None:
+        await self.released.wait()
+        self.frames.append(payload)
+
+    async def write_frame_parts(self, parts: Sequence[bytes]) -> None:
+        await self.released.wait()
+        self.frames.append(loads(b''.join(parts[1:])))
+
+
+def make_message(text: str) -> Message:
+    return Message.from_timestamp(timestamp=1_000_000, sender_name='alice', text=text)
+
+
+async def start_stalled(connection: StalledConnection, overflow_policy: str) -> Subscriber:
+    subscriber = Subscriber(connection, 7, 'Common', 'Common', queue_size=2, overflow_policy=overflow_policy)
+    subscriber.start()
+    subscriber.push(make_message('first'))
+    # Задача доставки забирает первое сообщение и ждет записи, дальше очередь только наполняется.
+    await sleep(0)
+    return subscriber
+
+
+def test_skip_policy_drops_oldest_messages_and_reports_them():
+    async def scenario():
+        connection = StalledConnection()
+        subscriber = await start_stalled(connection, 'skip')
+        assert all(subscriber.push(make_message(text)) for text in ('second', 'third', 'fourth', 'fifth'))
+
+        connection.released.set()
+        await wait_until(lambda: len(connection.frames) == 4)
+        subscriber.stop()
+        events = [(frame['event'], frame['response']) for frame in connection.frames]
+        assert events[0][0] == 'message' and events[0][1].endswith('first')
+        assert events[1] == ('skipped', 'Skipped 2 messages')
+        assert events[2][1].endswith('fourth') and events[3][1].endswith('fifth')
+        assert all(frame['request_id'] == 7 for frame in connection.frames)
+
+    run(scenario())
+
+
+def test_disconnect_policy_rejects_message_on_overflow_and_notifies_client():
+    async def scenario():
+        connection = StalledConnection()
+        subscriber = await start_stalled(connection, 'disconnect')
+        assert subscriber.push(make_message('second'))
+        assert subscriber.push(make_message('third'))
+        assert not subscriber.push(make_message('fourth'))
+
+        subscriber.drop()
+        connection.released.set()
+        await wait_until(lambda: bool(connection.frames))
+        assert connection.frames[-1]['event'] == 'dropped'
+        assert not subscriber.push(make_message('fifth'))
+
+    run(scenario())
+
+
+def test_server_removes_overflowing_subscriber(make_server):
+    async def scenario():
+        server = make_server()
+        connection = StalledConnection()
+        chat_key = server._common_chat.name
+        subscriber = await start_stalled(connection, 'disconnect')
+        server._subscribers[chat_key] = {subscriber}
+
+        for text in ('second', 'third', 'fourth'):
+            server._publish(chat_key, make_message(text))
+        assert chat_key not in server._subscribers
+
+        connection.released.set()
+        await wait_until(lambda: bool(connection.frames) and connection.frames[-1]['event'] == 'dropped')
+
+    run(scenario())
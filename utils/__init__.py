@@ -1,2 +1,19 @@
+from .attachment_store import AttachmentStore
+from .expiry_scheduler import ExpiryScheduler
 from .factories import Factories
+from .framed_connection import FramedConnection
+from .http_connection import HttpConnection
+from .http_connection import HttpError
+from .http_connection import HttpRequest
+from .journal import Journal
+from .log_pipeline import LogPipeline
+from .metrics import Metrics
+from .rate_limiter import RateLimiter
 from .request_dto_row_mapper import RequestDtoRowMapper
+from .request_dto_row_mapper import RequestError
+from .sampling_profiler import SamplingProfiler
+from .send_scheduler import SendScheduler
+from .shard_bus import ShardBus
+from .snapshot import Snapshot
+from .snapshot import SnapshotChatSource
+from .subscriber import Subscriber
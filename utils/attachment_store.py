@@ -0,0 +1,136 @@
+from asyncio import StreamReader
+from asyncio import get_running_loop
+from hashlib import sha256
+from os import fsync
+from os import makedirs
+from os import remove
+from os import replace
+from os.path import exists
+from os.path import join
+from re import compile
+from typing import Any
+from typing import BinaryIO
+from typing import Dict
+from typing import Optional
+from uuid import uuid4
+
+from settings import ATTACHMENT_CHUNK_SIZE
+from settings import ATTACHMENTS_PATH
+
+ATTACHMENT_ID = compile(r'[0-9a-f]{64}')
+
+
+class AttachmentStore:
+    """
+    Хранилище вложений с адресацией по содержимому.
+
+    Идентификатор вложения - SHA-256 его содержимого, файл хранится по пути `<каталог>/<2 символа>/<идентификатор>`,
+    поэтому одинаковые файлы хранятся один раз. Файл принимается из потока частями по chunk_size байт во временный
+    файл, хэш считается по мере приема; запись и хэширование частей выполняются в пуле потоков. Память на прием
+    не зависит от размера файла.
+    """
+
+    def __init__(self, path: str = ATTACHMENTS_PATH, chunk_size: int = ATTACHMENT_CHUNK_SIZE):
+        self._path = path
+        self._chunk_size = chunk_size
+        self._stored = 0
+        self._deduplicated = 0
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        return {'stored': self._stored, 'deduplicated': self._deduplicated}
+
+    @staticmethod
+    def is_valid_id(attachment_id: str) -> bool:
+        """
+        Проверка формата идентификатора: только он попадает в путь к файлу.
+
+        :param attachment_id: Идентификатор вложения.
+        :return: True, если идентификатор - SHA-256 в шестнадцатеричном виде.
+        """
+        return ATTACHMENT_ID.fullmatch(attachment_id) is not None
+
+    def _get_path(self, attachment_id: str) -> str:
+        """
+        Путь к файлу вложения.
+
+        :param attachment_id: Идентификатор вложения.
+        :return: Путь к файлу.
+        """
+        return join(self._path, attachment_id[:2], attachment_id)
+
+    def exists(self, attachment_id: str) -> bool:
+        """
+        Проверка наличия вложения.
+
+        :param attachment_id: Идентификатор вложения.
+        :return: True, если вложение есть в хранилище.
+        """
+        return self.is_valid_id(attachment_id) and exists(self._get_path(attachment_id))
+
+    def open(self, attachment_id: str) -> Optional[BinaryIO]:
+        """
+        Открытие файла вложения для чтения.
+
+        :param attachment_id: Идентификатор вложения.
+        :return: Файл или None, если вложения нет.
+        """
+        if not self.is_valid_id(attachment_id):
+            return None
+        try:
+            return open(self._get_path(attachment_id), 'rb')
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def _write_chunk(file: BinaryIO, digest: Any, chunk: bytes) -> None:
+        """
+        Запись части файла и обновление хэша (выполняется в пуле потоков).
+
+        :param file: Временный файл.
+        :param digest: Хэш принятой части файла.
+        :param chunk: Часть файла.
+        :return: None.
+        """
+        digest.update(chunk)
+        file.write(chunk)
+
+    async def receive(self, reader: StreamReader, size: int) -> str:
+        """
+        Прием файла из потока.
+
+        Файл пишется во временный файл, после fsync переносится на место по своему хэшу; если такой файл уже есть,
+        временный файл удаляется.
+
+        :param reader: Поток чтения.
+        :param size: Размер файла.
+        :return: Идентификатор вложения.
+        :raises ConnectionError: Соединение закрыто до приема всего файла.
+        """
+        loop = get_running_loop()
+        digest = sha256()
+        makedirs(join(self._path, 'tmp'), exist_ok=True)
+        temporary_path = join(self._path, 'tmp', f'{uuid4().hex}.part')
+        try:
+            with open(temporary_path, 'wb') as file:
+                received = 0
+                while received < size:
+                    chunk = await reader.read(min(self._chunk_size, size - received))
+                    if not chunk:
+                        raise ConnectionError('Connection closed in the middle of attachment')
+                    await loop.run_in_executor(None, self._write_chunk, file, digest, chunk)
+                    received += len(chunk)
+                await loop.run_in_executor(None, file.flush)
+                await loop.run_in_executor(None, fsync, file.fileno())
+            attachment_id = digest.hexdigest()
+            path = self._get_path(attachment_id)
+            if exists(path):
+                self._deduplicated += 1
+            else:
+                makedirs(join(self._path, attachment_id[:2]), exist_ok=True)
+                replace(temporary_path, path)
+                self._stored += 1
+            return attachment_id
+        finally:
+            if exists(temporary_path):
+                remove(temporary_path)
@@ -0,0 +1,99 @@
+from asyncio import Event
+from asyncio import TimeoutError
+from asyncio import sleep
+from asyncio import wait_for
+from heapq import heappop
+from heapq import heappush
+from itertools import count
+from time import time
+from typing import Callable
+from typing import List
+from typing import Optional
+from typing import Set
+from typing import Tuple
+
+from builtin_types import Chat
+from builtin_types.message import MICROSECONDS
+from settings import EXPIRY_SLICE_SIZE
+from .metrics import Metrics
+
+
+class ExpiryScheduler:
+    """
+    Фоновое удаление устаревших сообщений.
+
+    Чаты лежат в куче по сроку устаревания самого старого сообщения (с учетом периода актуальности чата),
+    поэтому задача просыпается только к ближайшему сроку и обрабатывает только чаты, в которых есть что удалять.
+    За один шаг удаляется не больше slice_size сообщений, между шагами задача уступает цикл событий.
+    """
+
+    def __init__(
+        self, expire: Callable[[Chat, int], int], metrics: Metrics, slice_size: int = EXPIRY_SLICE_SIZE
+    ):
+        self._expire = expire
+        self._metrics = metrics
+        self._slice_size = slice_size
+        self._heap: List[Tuple[int, int, Chat]] = list()
+        self._scheduled: Set[Chat] = set()
+        self._order = count()
+        self._wakeup: Optional[Event] = None
+
+    @property
+    def scheduled(self) -> int:
+        return len(self._heap)
+
+    def watch(self, chat: Chat) -> None:
+        """
+        Постановка чата в очередь по сроку устаревания его самого старого сообщения.
+
+        Вызывается после добавления сообщений и загрузки чата; повторный вызов для запланированного чата
+        ничего не делает, поэтому стоит O(1).
+
+        :param chat: Объект чата.
+        :return: None.
+        """
+        if chat in self._scheduled:
+            return
+        deadline = chat.get_expiry_deadline()
+        if deadline is None:
+            return
+        self._scheduled.add(chat)
+        heappush(self._heap, (deadline, next(self._order), chat))
+        if self._wakeup is not None and self._heap[0][2] is chat:
+            self._wakeup.set()
+
+    async def _wait(self, timeout: Optional[float]) -> None:
+        """
+        Ожидание ближайшего срока или появления более раннего.
+
+        :param timeout: Время до ближайшего срока, с; None - ждать появления чата в очереди.
+        :return: None.
+        """
+        self._wakeup.clear()  # type: ignore
+        try:
+            await wait_for(self._wakeup.wait(), timeout)  # type: ignore
+        except TimeoutError:
+            pass
+
+    async def run(self) -> None:
+        """
+        Цикл удаления устаревших сообщений.
+
+        :return: None.
+        """
+        self._wakeup = Event()
+        while True:
+            if not self._heap:
+                await self._wait(None)
+                continue
+            deadline = self._heap[0][0]
+            now = round(time() * MICROSECONDS)
+            if deadline > now:
+                await self._wait((deadline - now) / MICROSECONDS)
+                continue
+            _, _, chat = heappop(self._heap)
+            self._scheduled.discard(chat)
+            expired = self._expire(chat, self._slice_size)
+            self._metrics.observe_expiry((now - deadline) / MICROSECONDS, expired)
+            self.watch(chat)
+            await sleep(0)
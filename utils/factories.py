@@ -1,6 +1,8 @@
 from datetime import datetime
 from typing import Any
 from typing import Dict
+from typing import List
+from typing import Union
 
 from builtin_types import Chat
 from builtin_types import Message
@@ -16,14 +18,42 @@ class Factories:
     """
 
     @classmethod
-    async def get_empty_private_chat(cls, *users) -> Chat:
+    def get_datetime(cls, value: Union[int, float, str]) -> datetime:
+        """
+        Получение времени из сохраненного значения.
+
+        :param value: Время в микросекундах epoch, в секундах epoch или строка в формате DATETIME_FORMAT
+            (старые снимки и конфигурации).
+        :return: Время.
+        """
+        if isinstance(value, str):
+            return datetime.strptime(value, DATETIME_FORMAT)
+        return Message.get_datetime(Message.get_stored_timestamp(value))
+
+    @classmethod
+    def get_private_chat_name(cls, *users) -> str:
+        """
+        Название приватного чата.
+
+        :param users: Список имен пользователей.
+        :return: Название чата.
+        """
+        return ' and '.join(users)
+
+    @classmethod
+    def get_empty_private_chat(cls, *users) -> Chat:
         """
         Создание пустого чата.
 
         :param users: Список имен пользователей.
         :return: Пустой приватный чат.
         """
-        return Chat(name=' and '.join(users), messages=[], actuality_period=ACTUALITY_PERIOD)
+        return Chat(
+            name=cls.get_private_chat_name(*users),
+            messages=[],
+            actuality_period=ACTUALITY_PERIOD,
+            members=list(users)
+        )
 
     @classmethod
     def get_empty_common_chat(cls) -> Chat:
@@ -35,7 +65,7 @@ class Factories:
         return Chat(name='Common', messages=[], actuality_period=ACTUALITY_PERIOD)
 
     @classmethod
-    async def get_message_from_request(cls, user_name: str, request_dto: RequestDto) -> Message:
+    def get_message_from_request(cls, user_name: str, request_dto: RequestDto) -> Message:
         """
         Создание сообщения из запроса.
 
@@ -43,7 +73,10 @@ class Factories:
         :param request_dto: Данные запроса от клиента.
         :return: Объект сообщения.
         """
-        return Message(sending_time=datetime.now(), sender_name=user_name, text=request_dto.message)
+        return Message(
+            sending_time=datetime.now(), sender_name=user_name, text=request_dto.message,
+            attachment=request_dto.attachment or None
+        )
 
     @classmethod
     def get_message_from_dict(cls, message_dict: Dict[str, Any]) -> Message:
@@ -54,9 +87,11 @@ class Factories:
         :return: Объект сообщения.
         """
         return Message(
-            sending_time=datetime.strptime(message_dict['sending_time'], DATETIME_FORMAT),
+            sending_time=cls.get_datetime(message_dict['sending_time']),
             sender_name=message_dict['sender'],
-            text=message_dict['text']
+            text=message_dict['text'],
+            seq=message_dict.get('seq', 0),
+            attachment=message_dict.get('attachment')
         )
 
     @classmethod
@@ -68,7 +103,34 @@ class Factories:
         :return: Объект чата.
         """
         messages = [cls.get_message_from_dict(message) for message in chat_dict['messages']]
-        return Chat(name=chat_dict['name'], messages=messages, actuality_period=chat_dict['actuality_period'] // 3600)
+        if messages and not messages[0].seq:
+            # Конфигурация сохранена до появления порядковых номеров сообщений.
+            for seq, message in enumerate(messages, start=1):
+                message.seq = seq
+        return Chat(
+            name=chat_dict['name'],
+            messages=messages,
+            actuality_period=chat_dict['actuality_period'] // 3600,
+            last_seq=chat_dict.get('last_seq', 0),
+            members=chat_dict.get('members')
+        )
+
+    @classmethod
+    def get_chat_from_snapshot(cls, chat_header: Dict[str, Any]) -> Chat:
+        """
+        Создание чата из заголовка снимка с отложенной загрузкой сообщений.
+
+        :param chat_header: Заголовок чата с источником сообщений.
+        :return: Объект чата.
+        """
+        return Chat(
+            name=chat_header['name'],
+            messages=list(),
+            actuality_period=chat_header['actuality_period'] // 3600,
+            last_seq=chat_header['last_seq'],
+            messages_source=chat_header['messages_source'],
+            members=chat_header.get('members')
+        )
 
     @classmethod
     def get_user_from_dict(cls, user_dict: Dict[str, Any]) -> User:
@@ -78,8 +140,32 @@ class Factories:
         :param user_dict: Словарь с информацией о пользователе.
         :return: Объект пользователя.
         """
+        partners = user_dict.get('partners')
+        if partners is None:
+            partners = cls.get_partners_from_chat_names(user_dict['name'], user_dict['chats'])
         return User(
             name=user_dict['name'],
-            creation_datetime=datetime.strptime(user_dict['creation_datetime'], DATETIME_FORMAT),
-            chats=user_dict['chats']
+            creation_datetime=cls.get_datetime(user_dict['creation_datetime']),
+            chats=user_dict['chats'],
+            read_cursors=user_dict.get('read_cursors'),
+            partners=partners
         )
+
+    @classmethod
+    def get_partners_from_chat_names(cls, user_name: str, chat_names: List[str]) -> Dict[str, str]:
+        """
+        Определение собеседников по названиям приватных чатов (сохранения прежнего формата без индекса собеседников).
+
+        :param user_name: Имя пользователя.
+        :param chat_names: Названия чатов пользователя.
+        :return: Словарь "название чата - собеседник".
+        """
+        prefix = cls.get_private_chat_name(user_name, '')
+        suffix = cls.get_private_chat_name('', user_name)
+        partners = dict()
+        for chat_name in chat_names:
+            if chat_name.startswith(prefix):
+                partners[chat_name] = chat_name[len(prefix):]
+            elif chat_name.endswith(suffix):
+                partners[chat_name] = chat_name[:-len(suffix)]
+        return partners
@@ -0,0 +1,149 @@
+from asyncio import IncompleteReadError
+from asyncio import Lock
+from asyncio import StreamReader
+from asyncio import StreamWriter
+from json import dumps
+from json import loads
+from struct import Struct
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Sequence
+
+from builtin_types import EncodedText
+from settings import FRAME_MAX_SIZE
+
+FRAME_HEADER = Struct('>I')
+
+
+class FramedConnection:
+    """
+    Соединение с кадрированным протоколом обмена.
+
+    Каждый кадр состоит из 4-байтной длины (big-endian) и JSON-объекта этой длины.
+    По одному соединению можно передавать любое количество запросов и ответов.
+    """
+
+    def __init__(self, reader: StreamReader, writer: StreamWriter):
+        self._reader = reader
+        self._writer = writer
+        self._write_lock: Optional[Lock] = None
+        self._bytes_read = 0
+        self._bytes_written = 0
+
+    @property
+    def closed(self) -> bool:
+        return self._writer.is_closing()
+
+    @property
+    def bytes_read(self) -> int:
+        return self._bytes_read
+
+    @property
+    def bytes_written(self) -> int:
+        return self._bytes_written
+
+    @staticmethod
+    def encode_frame(payload: Dict[str, Any]) -> bytes:
+        """
+        Кодирование кадра.
+
+        :param payload: Содержимое кадра.
+        :return: Кадр в байтовом виде.
+        """
+        body = dumps(payload).encode()
+        return FRAME_HEADER.pack(len(body)) + body
+
+    @staticmethod
+    def encode_text_frame(payload: Dict[str, Any], field: str, text: EncodedText) -> List[bytes]:
+        """
+        Кодирование кадра, одно из полей которого - закодированный текст; фрагменты текста не копируются.
+
+        :param payload: Остальное содержимое кадра.
+        :param field: Имя поля с текстом.
+        :param text: Закодированный текст.
+        :return: Кадр в виде списка буферов.
+        """
+        head = dumps(payload)
+        prefix = f'{head[:-1]}{", " if payload else ""}{dumps(field)}: "'.encode()
+        size = len(prefix) + text.size + 2
+        return [FRAME_HEADER.pack(size), prefix, *text.fragments, b'"}']
+
+    async def read_frame(self) -> Optional[Dict[str, Any]]:
+        """
+        Чтение очередного кадра.
+
+        :return: Содержимое кадра или None, если соединение закрыто.
+        """
+        body = await self.read_frame_body()
+        if body is None:
+            return None
+        return loads(body)
+
+    async def read_frame_body(self) -> Optional[bytes]:
+        """
+        Чтение тела очередного кадра без разбора JSON.
+
+        :return: Тело кадра или None, если соединение закрыто.
+        """
+        try:
+            header = await self._reader.readexactly(FRAME_HEADER.size)
+        except IncompleteReadError as error:
+            if error.partial:
+                raise ConnectionError('Connection closed in the middle of frame header')
+            return None
+        (size,) = FRAME_HEADER.unpack(header)
+        if size > FRAME_MAX_SIZE:
+            raise ConnectionError(f'Frame size {size} exceeds limit {FRAME_MAX_SIZE}')
+        try:
+            body = await self._reader.readexactly(size)
+        except IncompleteReadError:
+            raise ConnectionError('Connection closed in the middle of frame body')
+        self._bytes_read += FRAME_HEADER.size + size
+        return body
+
+    async def write_frame(self, payload: Dict[str, Any]) -> None:
+        """
+        Отправка кадра.
+
+        :param payload: Содержимое кадра.
+        :return: None.
+        """
+        await self.write_encoded_frame(self.encode_frame(payload))
+
+    async def write_encoded_frame(self, frame: bytes) -> None:
+        """
+        Отправка уже закодированного кадра.
+
+        :param frame: Кадр в байтовом виде.
+        :return: None.
+        """
+        await self.write_frame_parts((frame,))
+
+    async def write_frame_parts(self, parts: Sequence[bytes]) -> None:
+        """
+        Отправка кадра, закодированного списком буферов, одним вызовом writelines.
+
+        :param parts: Буферы кадра.
+        :return: None.
+        """
+        if self._write_lock is None:
+            self._write_lock = Lock()
+        async with self._write_lock:
+            self._writer.writelines(parts)
+            self._bytes_written += sum(map(len, parts))
+            await self._writer.drain()
+
+    async def close(self) -> None:
+        """
+        Закрытие соединения.
+
+        :return: None.
+        """
+        if not self._writer.is_closing():
+            self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except ConnectionError:
+            pass
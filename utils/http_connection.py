@@ -0,0 +1,392 @@
+from asyncio import IncompleteReadError
+from asyncio import LimitOverrunError
+from asyncio import StreamReader
+from asyncio import StreamWriter
+from dataclasses import dataclass
+from functools import lru_cache
+from http import HTTPStatus
+from json import dumps
+from re import compile
+from typing import Any
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Sequence
+from zlib import DEFLATED
+from zlib import MAX_WBITS
+from zlib import compressobj
+
+from builtin_types import EncodedText
+from settings import HTTP_BODY_MAX_SIZE
+from settings import HTTP_CHUNK_SIZE
+from settings import HTTP_COMPRESSION_LEVEL
+from settings import HTTP_COMPRESSION_MIN_SIZE
+from settings import HTTP_HEAD_MAX_SIZE
+from .request_dto_row_mapper import RequestError
+
+HEAD_END = b'\r\n\r\n'
+LINE_END = b'\r\n'
+# Заголовки, нужные серверу: ищутся одним проходом по копии заголовка запроса в нижнем регистре.
+HEADER = compile(rb'\r\n(content-length|transfer-encoding|connection|accept-encoding|expect):[ \t]*([^\r\n]*)')
+HTTP_11 = b'HTTP/1.1'
+HTTP_10 = b'HTTP/1.0'
+# Параметр wbits zlib для формата gzip; deflate в HTTP - формат zlib.
+ENCODING_WBITS = {'gzip': 16 + MAX_WBITS, 'deflate': MAX_WBITS}
+
+
+class HttpError(RequestError):
+    """
+    Некорректный HTTP-запрос: на него отвечают кодом status и закрывают соединение.
+    """
+
+    def __init__(self, message: str, status: int = HTTPStatus.BAD_REQUEST):
+        super().__init__(message)
+        self.status = status
+
+
+@dataclass
+class HttpRequest:
+    """
+    Разобранный HTTP-запрос: метод, путь и строка запроса хранятся байтами, как пришли.
+    """
+    method: bytes
+    path: bytes
+    query: bytes
+    version: bytes
+    keep_alive: bool
+    encoding: Optional[str]
+    content_length: Optional[int]
+    chunked: bool
+    expect_continue: bool
+    body: bytes = b''
+
+
+class HttpConnection:
+    """
+    Соединение по протоколу HTTP/1.1.
+
+    Соединение постоянное (keep-alive), пока клиент не попросит его закрыть; запросы, отправленные подряд
+    без ожидания ответов (pipelining), читаются из буфера потока и обрабатываются по очереди, ответы идут в порядке
+    запросов. Заголовок запроса читается целиком и разбирается без словаря заголовков: в копии заголовка в нижнем
+    регистре ищутся только нужные серверу поля. Тело запроса принимается по Content-Length или в chunked-кодировке.
+
+    Ответ больше chunk_size байт отправляется в chunked-кодировке частями по мере сжатия, без склейки тела
+    целиком; если клиент принимает gzip или deflate, ответ от compression_min_size байт сжимается.
+    """
+
+    def __init__(
+        self,
+        reader: StreamReader,
+        writer: StreamWriter,
+        prefix: bytes = b'',
+        chunk_size: int = HTTP_CHUNK_SIZE,
+        compression_min_size: int = HTTP_COMPRESSION_MIN_SIZE
+    ):
+        self._reader = reader
+        self._writer = writer
+        self._prefix = prefix
+        self._chunk_size = chunk_size
+        self._compression_min_size = compression_min_size
+        self._bytes_read = 0
+        self._bytes_written = 0
+
+    @property
+    def bytes_read(self) -> int:
+        return self._bytes_read
+
+    @property
+    def bytes_written(self) -> int:
+        return self._bytes_written
+
+    @staticmethod
+    def _get_headers(head: bytes) -> Dict[bytes, bytes]:
+        """
+        Значения нужных серверу заголовков в нижнем регистре, без словаря остальных заголовков.
+
+        :param head: Заголовок запроса.
+        :return: Словарь "название заголовка - значение".
+        :raises HttpError: Заголовок Content-Length повторяется.
+        """
+        headers: Dict[bytes, bytes] = dict()
+        for name, value in HEADER.findall(head.lower()):
+            if name in headers and name == b'content-length':
+                raise HttpError('duplicate Content-Length')
+            headers[name] = value.rstrip()
+        return headers
+
+    @staticmethod
+    @lru_cache(maxsize=64)
+    def choose_encoding(accept_encoding: Optional[bytes]) -> Optional[str]:
+        """
+        Выбор сжатия ответа по заголовку Accept-Encoding: gzip или deflate с наибольшим весом q.
+
+        Клиенты присылают немногие различные значения заголовка, поэтому результат кэшируется.
+
+        :param accept_encoding: Значение заголовка в нижнем регистре.
+        :return: Название сжатия или None - без сжатия.
+        """
+        if not accept_encoding:
+            return None
+        weights: Dict[bytes, float] = dict()
+        for item in accept_encoding.split(b','):
+            name, _, parameters = item.partition(b';')
+            weight = 1.0
+            parameters = parameters.strip()
+            if parameters.startswith(b'q='):
+                try:
+                    weight = float(parameters[2:])
+                except ValueError:
+                    weight = 0.0
+            weights[name.strip()] = weight
+        wildcard = weights.get(b'*', 0.0)
+        gzip = weights.get(b'gzip', wildcard)
+        deflate = weights.get(b'deflate', wildcard)
+        if max(gzip, deflate) <= 0:
+            return None
+        return 'gzip' if gzip >= deflate else 'deflate'
+
+    @classmethod
+    def parse_head(cls, head: bytes) -> HttpRequest:
+        """
+        Разбор строки запроса и заголовков.
+
+        :param head: Заголовок запроса вместе с завершающей пустой строкой.
+        :return: Запрос без тела.
+        :raises HttpError: Заголовок некорректен или запрос не поддерживается.
+        """
+        line_end = head.find(LINE_END)
+        method_end = head.find(b' ', 0, line_end)
+        target_end = head.rfind(b' ', 0, line_end)
+        if method_end <= 0 or target_end <= method_end + 1:
+            raise HttpError('malformed request line')
+        version = head[target_end + 1:line_end]
+        if version != HTTP_11 and version != HTTP_10:
+            raise HttpError('unsupported HTTP version', HTTPStatus.HTTP_VERSION_NOT_SUPPORTED)
+        path, _, query = head[method_end + 1:target_end].partition(b'?')
+
+        headers = cls._get_headers(head)
+        content_length = headers.get(b'content-length')
+        transfer_encoding = headers.get(b'transfer-encoding')
+        if transfer_encoding is not None and transfer_encoding != b'chunked':
+            raise HttpError('unsupported Transfer-Encoding', HTTPStatus.NOT_IMPLEMENTED)
+        if transfer_encoding is not None and content_length is not None:
+            raise HttpError('both Content-Length and Transfer-Encoding')
+        if content_length is not None and not content_length.isdigit():
+            raise HttpError('malformed Content-Length')
+        connection = headers.get(b'connection', b'')
+        return HttpRequest(
+            method=head[:method_end],
+            path=path,
+            query=query,
+            version=version,
+            keep_alive=b'close' not in connection if version == HTTP_11 else b'keep-alive' in connection,
+            encoding=cls.choose_encoding(headers.get(b'accept-encoding')),
+            content_length=int(content_length) if content_length is not None else None,
+            chunked=transfer_encoding is not None,
+            expect_continue=headers.get(b'expect') == b'100-continue'
+        )
+
+    @staticmethod
+    def _starts_with_request_line(data: bytes) -> bool:
+        """
+        Проверка, что данные начинаются со строки HTTP-запроса, оканчивающейся версией протокола.
+
+        :param data: Начало запроса.
+        :return: True, если первая строка - строка HTTP-запроса.
+        """
+        line = data.partition(LINE_END)[0]
+        return line.endswith(b' ' + HTTP_11) or line.endswith(b' ' + HTTP_10)
+
+    async def _read_head(self) -> Optional[bytes]:
+        """
+        Чтение заголовка запроса до пустой строки.
+
+        :return: Заголовок или None, если соединение закрыто между запросами.
+        :raises HttpError: Заголовок больше HTTP_HEAD_MAX_SIZE байт или соединение закрыто до строки запроса.
+        """
+        try:
+            head = await self._reader.readuntil(HEAD_END)
+        except IncompleteReadError as error:
+            partial = self._prefix + error.partial
+            if not partial:
+                return None
+            if not self._starts_with_request_line(partial):
+                # Клиент закрыл свою сторону, не отправив строку HTTP-запроса: например, некорректный запрос
+                # в режиме "один запрос на соединение", начинающийся с буквы. Ответ он еще может прочитать.
+                raise HttpError('malformed request line')
+            raise ConnectionError('Connection closed in the middle of request head')
+        except LimitOverrunError:
+            raise HttpError('request head too large', HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE)
+        if self._prefix:
+            head = self._prefix + head
+            self._prefix = b''
+        if len(head) > HTTP_HEAD_MAX_SIZE:
+            raise HttpError('request head too large', HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE)
+        self._bytes_read += len(head)
+        return head
+
+    async def _read_chunked_body(self) -> bytes:
+        """
+        Чтение тела запроса в chunked-кодировке.
+
+        :return: Тело запроса.
+        :raises HttpError: Некорректная часть или тело больше HTTP_BODY_MAX_SIZE байт.
+        """
+        body = bytearray()
+        while True:
+            line = await self._reader.readuntil(LINE_END)
+            self._bytes_read += len(line)
+            try:
+                size = int(line.partition(b';')[0], 16)
+            except ValueError:
+                raise HttpError('malformed chunk size')
+            if len(body) + size > HTTP_BODY_MAX_SIZE:
+                raise HttpError('request body too large', HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+            if not size:
+                break
+            chunk = await self._reader.readexactly(size + len(LINE_END))
+            self._bytes_read += len(chunk)
+            if not chunk.endswith(LINE_END):
+                raise HttpError('malformed chunk')
+            body += chunk[:size]
+        while True:
+            line = await self._reader.readuntil(LINE_END)
+            self._bytes_read += len(line)
+            if line == LINE_END:
+                return bytes(body)
+
+    async def read_request(self) -> Optional[HttpRequest]:
+        """
+        Чтение очередного запроса с телом.
+
+        :return: Запрос или None, если соединение закрыто.
+        :raises HttpError: Запрос некорректен.
+        """
+        try:
+            head = await self._read_head()
+            if head is None:
+                return None
+            request = self.parse_head(head)
+            if request.content_length and request.content_length > HTTP_BODY_MAX_SIZE:
+                raise HttpError('request body too large', HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+            if request.expect_continue and (request.content_length or request.chunked):
+                self._write([b'HTTP/1.1 100 Continue\r\n\r\n'])
+            if request.chunked:
+                request.body = await self._read_chunked_body()
+            elif request.content_length:
+                request.body = await self._reader.readexactly(request.content_length)
+                self._bytes_read += request.content_length
+        except IncompleteReadError:
+            raise ConnectionError('Connection closed in the middle of request')
+        except LimitOverrunError:
+            raise HttpError('malformed chunk size')
+        return request
+
+    @staticmethod
+    def encode_json(payload: Dict[str, Any]) -> List[bytes]:
+        """
+        Кодирование тела ответа.
+
+        :param payload: Содержимое ответа.
+        :return: Тело в виде списка буферов.
+        """
+        return [dumps(payload).encode()]
+
+    @staticmethod
+    def encode_text(field: str, text: EncodedText) -> List[bytes]:
+        """
+        Кодирование тела ответа из одного поля с закодированным текстом; фрагменты текста не копируются.
+
+        :param field: Имя поля с текстом.
+        :param text: Закодированный текст.
+        :return: Тело в виде списка буферов.
+        """
+        return [f'{{{dumps(field)}: "'.encode(), *text.fragments, b'"}']
+
+    def _iter_chunks(self, parts: Sequence[bytes], compressor: Any) -> Iterator[bytes]:
+        """
+        Части тела ответа для chunked-кодировки: буферы собираются в части около chunk_size байт
+        и сжимаются по мере сборки.
+
+        :param parts: Буферы тела.
+        :param compressor: Объект сжатия zlib или None.
+        :return: Итератор непустых частей.
+        """
+        group: List[bytes] = list()
+        size = 0
+        for part in parts:
+            group.append(part)
+            size += len(part)
+            if size >= self._chunk_size:
+                chunk = b''.join(group)
+                group = list()
+                size = 0
+                if compressor is not None:
+                    chunk = compressor.compress(chunk)
+                if chunk:
+                    yield chunk
+        chunk = b''.join(group)
+        if compressor is not None:
+            chunk = compressor.compress(chunk) + compressor.flush()
+        if chunk:
+            yield chunk
+
+    def _write(self, parts: Sequence[bytes]) -> None:
+        """
+        Запись буферов в поток одним вызовом writelines.
+
+        :param parts: Буферы.
+        :return: None.
+        """
+        self._writer.writelines(parts)
+        self._bytes_written += sum(map(len, parts))
+
+    async def write_response(
+        self, status: int, parts: List[bytes], request: Optional[HttpRequest], headers: Sequence[str] = ()
+    ) -> None:
+        """
+        Отправка ответа: тело до chunk_size байт - с Content-Length, больше - в chunked-кодировке
+        (для HTTP/1.0 - всегда с Content-Length).
+
+        :param status: Код ответа.
+        :param parts: Тело ответа (JSON) в виде списка буферов.
+        :param request: Запрос, на который отправляется ответ; None - ответ на некорректный запрос,
+            после которого соединение закрывается.
+        :param headers: Дополнительные заголовки.
+        :return: None.
+        """
+        size = sum(map(len, parts))
+        head = [f'HTTP/1.1 {int(status)} {HTTPStatus(status).phrase}', 'Content-Type: application/json', *headers]
+        compressor = None
+        if request is not None and request.encoding is not None and size >= self._compression_min_size:
+            compressor = compressobj(HTTP_COMPRESSION_LEVEL, DEFLATED, ENCODING_WBITS[request.encoding])
+            head.extend((f'Content-Encoding: {request.encoding}', 'Vary: Accept-Encoding'))
+        if request is None or not request.keep_alive:
+            head.append('Connection: close')
+        elif request.version == HTTP_10:
+            head.append('Connection: keep-alive')
+        if request is not None and request.version == HTTP_11 and size > self._chunk_size:
+            head.append('Transfer-Encoding: chunked')
+            self._write([LINE_END.join(map(str.encode, head)) + HEAD_END])
+            for chunk in self._iter_chunks(parts, compressor):
+                self._write([f'{len(chunk):x}\r\n'.encode(), chunk, LINE_END])
+                await self._writer.drain()
+            self._write([b'0\r\n\r\n'])
+        else:
+            if compressor is not None:
+                parts = [compressor.compress(b''.join(parts)) + compressor.flush()]
+            head.append(f'Content-Length: {sum(map(len, parts))}')
+            self._write([LINE_END.join(map(str.encode, head)) + HEAD_END, *parts])
+        await self._writer.drain()
+
+    async def write_error(self, error: HttpError) -> None:
+        """
+        Ответ на некорректный запрос с закрытием соединения.
+
+        :param error: Ошибка разбора запроса.
+        :return: None.
+        """
+        await self.write_response(
+            error.status, self.encode_json({'error': 'bad_request', 'response': error.response}), None
+        )
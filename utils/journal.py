@@ -0,0 +1,263 @@
+from asyncio import Event
+from asyncio import Task
+from asyncio import create_task
+from asyncio import get_running_loop
+from asyncio import sleep
+from json import JSONDecodeError
+from json import dumps
+from json import loads
+from os import fsync
+from typing import Any
+from typing import Awaitable
+from typing import BinaryIO
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+from settings import JOURNAL_FLUSH_INTERVAL
+from .snapshot import Snapshot
+
+# Элемент очереди записи: закодированное событие или снимок с номером последнего учтенного события и условием,
+# после выполнения которого снимок можно записать.
+QueueItem = Union[bytes, Tuple[int, Dict[str, Any], Optional[Awaitable[bool]]]]
+
+
+class Journal:
+    """
+    Журнал событий сервера, дописываемый только в конец.
+
+    События получают возрастающий номер (LSN) и пишутся фоновой задачей пачками: одна запись и один fsync
+    на пачку выполняются в пуле потоков, поэтому цикл событий не блокируется на диске. Снимок состояния
+    пишется той же задачей в порядке очереди, после чего журнал очищается: все события до снимка в нем учтены.
+    """
+
+    def __init__(self, path: str, snapshot_path: str, flush_interval: float = JOURNAL_FLUSH_INTERVAL):
+        self._path = path
+        self._snapshot_path = snapshot_path
+        self._flush_interval = flush_interval
+
+        self._file: Optional[BinaryIO] = None
+        self._queue: List[QueueItem] = list()
+        self._wakeup: Optional[Event] = None
+        self._writer_task: Optional[Task] = None
+        self._stopping = False
+        self._last_lsn = 0
+        self._valid_size: Optional[int] = None
+
+        self._records_written = 0
+        self._records_since_snapshot = 0
+        self._record_bytes = 0
+        self._bytes_written = 0
+        self._fsyncs = 0
+        self._snapshots = 0
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def last_lsn(self) -> int:
+        return self._last_lsn
+
+    @last_lsn.setter
+    def last_lsn(self, value: int) -> None:
+        self._last_lsn = value
+
+    @property
+    def records_since_snapshot(self) -> int:
+        return self._records_since_snapshot
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        """
+        Статистика записи: количество записей, байт, fsync и коэффициент усиления записи
+        (все записанные байты, включая снимки, к объему самих событий).
+        """
+        return {
+            'records': self._records_written,
+            'record_bytes': self._record_bytes,
+            'bytes_written': self._bytes_written,
+            'fsyncs': self._fsyncs,
+            'snapshots': self._snapshots,
+            'write_amplification': round(self._bytes_written / self._record_bytes, 2) if self._record_bytes else 0,
+        }
+
+    async def start(self) -> None:
+        """
+        Открытие файла журнала и запуск фоновой задачи записи.
+
+        Если журнал был прочитан, файл обрезается до конца последней целой записи.
+
+        :return: None.
+        """
+        self._file = open(self._path, 'ab')
+        if self._valid_size is not None:
+            # Недописанная при сбое запись отрезается, иначе новые события окажутся за ней и не будут прочитаны.
+            self._file.truncate(self._valid_size)
+        self._wakeup = Event()
+        self._writer_task = create_task(self._write_loop())
+
+    async def stop(self) -> None:
+        """
+        Запись оставшихся событий и закрытие журнала.
+
+        :return: None.
+        """
+        self._stopping = True
+        if self._writer_task is not None:
+            self._wakeup.set()  # type: ignore
+            await self._writer_task
+            self._writer_task = None
+        await self._flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def append(self, event: Dict[str, Any]) -> None:
+        """
+        Постановка события в очередь на запись без ожидания.
+
+        :param event: Событие.
+        :return: None.
+        """
+        self._last_lsn += 1
+        self._queue.append(dumps({'lsn': self._last_lsn, **event}, separators=(',', ':')).encode() + b'\n')
+        self._records_since_snapshot += 1
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def compact(self, snapshot: Dict[str, Any], ready: Optional[Awaitable[bool]] = None) -> None:
+        """
+        Постановка снимка состояния в очередь на запись.
+
+        Снимок должен соответствовать состоянию после события с номером last_lsn. Если задано условие ready,
+        очередь с этим снимком пишется после его выполнения, а при результате False снимок не пишется и журнал
+        не очищается.
+
+        :param snapshot: Снимок состояния сервера.
+        :param ready: Условие записи снимка, например запись на диск данных, исключенных из снимка.
+        :return: None.
+        """
+        self._queue.append((self._last_lsn, snapshot, ready))
+        self._records_since_snapshot = 0
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _write_loop(self) -> None:
+        """
+        Фоновая запись очереди событий пачками.
+
+        :return: None.
+        """
+        while not self._stopping:
+            await self._wakeup.wait()  # type: ignore
+            if not self._stopping:
+                # Короткая пауза собирает в одну пачку события, пришедшие почти одновременно.
+                await sleep(self._flush_interval)
+            self._wakeup.clear()  # type: ignore
+            await self._flush()
+
+    async def _flush(self) -> None:
+        """
+        Запись накопленной очереди в пуле потоков.
+
+        :return: None.
+        """
+        if not self._queue or self._file is None:
+            return
+        queue, self._queue = self._queue, list()
+        queue = [item for item in queue if await self._is_ready(item)]
+        await get_running_loop().run_in_executor(None, self._write_queue, queue)
+
+    @staticmethod
+    async def _is_ready(item: QueueItem) -> bool:
+        """
+        Ожидание условия записи снимка.
+
+        :param item: Элемент очереди.
+        :return: False, если снимок записывать нельзя.
+        """
+        if isinstance(item, bytes) or item[2] is None:
+            return True
+        return await item[2]
+
+    def _write_queue(self, queue: List[QueueItem]) -> None:
+        """
+        Запись очереди на диск: идущие подряд события пишутся одной пачкой с одним fsync.
+
+        :param queue: Очередь событий и снимков.
+        :return: None.
+        """
+        batch: List[bytes] = list()
+        for item in queue:
+            if isinstance(item, bytes):
+                batch.append(item)
+                continue
+            self._write_batch(batch)
+            batch = list()
+            self._write_snapshot(item[0], item[1])
+        self._write_batch(batch)
+
+    def _write_batch(self, batch: List[bytes]) -> None:
+        """
+        Запись пачки событий в журнал.
+
+        :param batch: Закодированные события.
+        :return: None.
+        """
+        if not batch:
+            return
+        data = b''.join(batch)
+        self._file.write(data)  # type: ignore
+        self._file.flush()  # type: ignore
+        fsync(self._file.fileno())  # type: ignore
+        self._records_written += len(batch)
+        self._record_bytes += len(data)
+        self._bytes_written += len(data)
+        self._fsyncs += 1
+
+    def _write_snapshot(self, lsn: int, snapshot: Dict[str, Any]) -> None:
+        """
+        Атомарная запись снимка состояния и очистка журнала.
+
+        Журнал очищается после fsync каталога снимка: при сбое остается либо новый снимок, либо старый снимок
+        с полным журналом. Очистка журнала не синхронизируется: события, уже учтенные в снимке,
+        при восстановлении пропускаются по LSN.
+
+        :param lsn: Номер последнего события, учтенного в снимке.
+        :param snapshot: Снимок состояния сервера.
+        :return: None.
+        """
+        self._bytes_written += Snapshot.write(self._snapshot_path, {**snapshot, 'lsn': lsn})
+        self._file.truncate(0)  # type: ignore
+        self._fsyncs += Snapshot.WRITE_FSYNCS
+        self._snapshots += 1
+
+    def read(self, after_lsn: int = 0) -> Iterator[Dict[str, Any]]:
+        """
+        Чтение событий журнала с номером больше заданного.
+
+        Чтение прекращается на недописанной при сбое последней записи; конец последней целой записи
+        запоминается, чтобы start отрезал недописанный хвост.
+
+        :param after_lsn: Номер последнего уже учтенного события.
+        :return: Итератор событий.
+        """
+        self._valid_size = 0
+        try:
+            with open(self._path, 'rb') as file:
+                for line in file:
+                    if not line.endswith(b'\n'):
+                        return
+                    try:
+                        event = loads(line)
+                    except JSONDecodeError:
+                        return
+                    self._valid_size += len(line)
+                    if event['lsn'] > after_lsn:
+                        yield event
+        except FileNotFoundError:
+            return
@@ -0,0 +1,91 @@
+from atexit import register
+from logging import LogRecord
+from logging import StreamHandler
+from logging import getLogger
+from logging.handlers import QueueHandler
+from logging.handlers import QueueListener
+from queue import SimpleQueue
+from sys import stdout
+from typing import Optional
+from typing import TextIO
+
+from settings import LOG_LEVEL
+from settings import LOG_PAYLOAD_LIMIT
+
+
+class TruncatingQueueHandler(QueueHandler):
+    """
+    Обработчик, передающий записи журнала в очередь.
+
+    Аргументы записи длиннее LOG_PAYLOAD_LIMIT символов обрезаются до форматирования сообщения: строки - сразу,
+    остальные объекты (запросы, закодированные ответы) - по их строковому представлению. Поэтому в очередь
+    и в поток вывода не попадают полные тексты запросов и ответов.
+    """
+
+    def __init__(self, queue: SimpleQueue, payload_limit: int = LOG_PAYLOAD_LIMIT):
+        super().__init__(queue)
+        self._payload_limit = payload_limit
+
+    def _truncate(self, value: object) -> object:
+        """
+        Обрезка длинного аргумента с указанием исходной длины; числа и None передаются как есть.
+
+        :param value: Аргумент записи.
+        :return: Аргумент или обрезанное строковое представление.
+        """
+        if value is None or isinstance(value, (int, float)):
+            return value
+        text = value if isinstance(value, str) else str(value)
+        if len(text) > self._payload_limit:
+            return f'{text[:self._payload_limit]}... ({len(text)} chars)'
+        return value
+
+    def prepare(self, record: LogRecord) -> LogRecord:
+        """
+        Подготовка записи к передаче в очередь: обрезка аргументов и форматирование сообщения.
+
+        :param record: Запись журнала.
+        :return: Подготовленная запись.
+        """
+        if isinstance(record.args, tuple):
+            record.args = tuple(self._truncate(arg) for arg in record.args)
+        return super().prepare(record)
+
+
+class LogPipeline:
+    """
+    Журналирование через очередь: запись в поток вывода выполняет отдельный поток QueueListener,
+    цикл событий только кладет запись в очередь.
+    """
+
+    _listener: Optional[QueueListener] = None
+
+    @classmethod
+    def start(cls, level: str = LOG_LEVEL, stream: TextIO = stdout) -> None:
+        """
+        Настройка корневого журнала на запись через очередь и запуск потока вывода.
+
+        :param level: Уровень журналирования.
+        :param stream: Поток вывода.
+        :return: None.
+        """
+        if cls._listener is not None:
+            return
+        queue: SimpleQueue = SimpleQueue()
+        root_logger = getLogger()
+        root_logger.setLevel(level)
+        root_logger.addHandler(TruncatingQueueHandler(queue))
+        cls._listener = QueueListener(queue, StreamHandler(stream=stream))
+        cls._listener.start()
+        register(cls.stop)
+
+    @classmethod
+    def stop(cls) -> None:
+        """
+        Вывод оставшихся записей и остановка потока вывода.
+
+        :return: None.
+        """
+        if cls._listener is not None:
+            cls._listener.stop()
+            cls._listener = None
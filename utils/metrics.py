@@ -0,0 +1,184 @@
+from asyncio import get_running_loop
+from asyncio import sleep
+from bisect import bisect_left
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from settings import METRICS_BUCKETS
+from settings import METRICS_LOOP_LAG_INTERVAL
+
+
+def format_labels(labels: Dict[str, str]) -> str:
+    """
+    Форматирование меток в текстовом формате Prometheus.
+
+    :param labels: Метки.
+    :return: Строка вида `{name="value",...}` или пустая строка.
+    """
+    if not labels:
+        return ''
+    escaped = (
+        name + '="' + value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for name, value in labels.items()
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+class Histogram:
+    """
+    Гистограмма с фиксированными границами корзин: наблюдение стоит O(log количества корзин).
+    """
+
+    def __init__(self, buckets: Iterable[float] = METRICS_BUCKETS):
+        self._bounds = list(buckets)
+        self._counts = [0] * (len(self._bounds) + 1)
+        self._sum = 0.0
+        self._count = 0
+
+    def observe(self, value: float) -> None:
+        """
+        Учет наблюдения.
+
+        :param value: Значение.
+        :return: None.
+        """
+        self._counts[bisect_left(self._bounds, value)] += 1
+        self._sum += value
+        self._count += 1
+
+    def render(self, name: str, labels: Dict[str, str]) -> List[str]:
+        """
+        Строки гистограммы в текстовом формате Prometheus (корзины накопительные).
+
+        :param name: Имя метрики.
+        :param labels: Метки.
+        :return: Строки метрики.
+        """
+        lines = list()
+        cumulative = 0
+        for bound, bucket_count in zip([*self._bounds, float('inf')], self._counts):
+            cumulative += bucket_count
+            bucket_labels = {**labels, 'le': '+Inf' if bound == float('inf') else repr(bound)}
+            lines.append(f'{name}_bucket{format_labels(bucket_labels)} {cumulative}')
+        lines.append(f'{name}_sum{format_labels(labels)} {self._sum}')
+        lines.append(f'{name}_count{format_labels(labels)} {self._count}')
+        return lines
+
+
+class Metrics:
+    """
+    Метрики сервера: гистограммы времени фаз обработки запросов по эндпоинтам, счетчики, задержка цикла событий,
+    удаления устаревших сообщений и отправки отложенных сообщений.
+    """
+
+    def __init__(self):
+        self._phases: Dict[Tuple[str, str], Histogram] = dict()
+        self._requests: Dict[str, int] = dict()
+        self._loop_lag = Histogram()
+        self._last_loop_lag = 0.0
+        self._max_loop_lag = 0.0
+        self._expiry_lag = Histogram()
+        self._expired_messages = 0
+        self._scheduled_send_lag = Histogram()
+        self._scheduled_sent_messages = 0
+
+    def observe_request(self, endpoint: str, phases: Dict[str, float]) -> None:
+        """
+        Учет времени фаз обработки одного запроса.
+
+        :param endpoint: Эндпоинт.
+        :param phases: Время фаз, с.
+        :return: None.
+        """
+        self._requests[endpoint] = self._requests.get(endpoint, 0) + 1
+        for phase, duration in phases.items():
+            histogram = self._phases.get((endpoint, phase))
+            if histogram is None:
+                histogram = self._phases[(endpoint, phase)] = Histogram()
+            histogram.observe(duration)
+
+    def observe_expiry(self, lag: float, expired: int) -> None:
+        """
+        Учет одного шага удаления устаревших сообщений.
+
+        :param lag: Насколько позже срока устаревания выполнен шаг, с.
+        :param expired: Количество удаленных сообщений.
+        :return: None.
+        """
+        self._expiry_lag.observe(lag)
+        self._expired_messages += expired
+
+    def observe_scheduled_send(self, lag: float, sent: int) -> None:
+        """
+        Учет одной пачки отложенных сообщений.
+
+        :param lag: Насколько позже момента отправки первого сообщения пачки она отправлена, с.
+        :param sent: Количество отправленных сообщений.
+        :return: None.
+        """
+        self._scheduled_send_lag.observe(lag)
+        self._scheduled_sent_messages += sent
+
+    async def watch_loop_lag(self, interval: float = METRICS_LOOP_LAG_INTERVAL) -> None:
+        """
+        Фоновый замер задержки цикла событий: насколько позже запланированного просыпается короткий sleep.
+
+        :param interval: Интервал замеров, с.
+        :return: None.
+        """
+        loop = get_running_loop()
+        while True:
+            started = loop.time()
+            await sleep(interval)
+            lag = max(loop.time() - started - interval, 0.0)
+            self._loop_lag.observe(lag)
+            self._last_loop_lag = lag
+            self._max_loop_lag = max(self._max_loop_lag, lag)
+
+    def render(
+        self, gauges: Dict[str, List[Tuple[Dict[str, str], float]]], counters: Optional[Dict[str, int]] = None
+    ) -> str:
+        """
+        Все метрики в текстовом формате Prometheus.
+
+        :param gauges: Текущие значения метрик состояния сервера: имя - список пар (метки, значение).
+        :param counters: Счетчики сервера.
+        :return: Текст метрик.
+        """
+        lines = [
+            '# HELP chat_request_phase_seconds Request processing time by endpoint and phase.',
+            '# TYPE chat_request_phase_seconds histogram',
+        ]
+        for (endpoint, phase), histogram in sorted(self._phases.items()):
+            lines.extend(histogram.render('chat_request_phase_seconds', {'endpoint': endpoint, 'phase': phase}))
+        lines.extend(
+            ['# HELP chat_requests_total Processed requests by endpoint.', '# TYPE chat_requests_total counter']
+        )
+        for endpoint, requests in sorted(self._requests.items()):
+            lines.append(f'chat_requests_total{format_labels({"endpoint": endpoint})} {requests}')
+        for name, value in (counters or dict()).items():
+            lines.extend([f'# TYPE {name} counter', f'{name} {value}'])
+        lines.extend(['# HELP chat_event_loop_lag_seconds Event loop wake-up delay.',
+                      '# TYPE chat_event_loop_lag_seconds histogram'])
+        lines.extend(self._loop_lag.render('chat_event_loop_lag_seconds', dict()))
+        lines.extend(['# TYPE chat_event_loop_lag_last_seconds gauge',
+                      f'chat_event_loop_lag_last_seconds {self._last_loop_lag}',
+                      '# TYPE chat_event_loop_lag_max_seconds gauge',
+                      f'chat_event_loop_lag_max_seconds {self._max_loop_lag}'])
+        lines.extend(['# HELP chat_expiry_lag_seconds Delay of message expiry after the deadline.',
+                      '# TYPE chat_expiry_lag_seconds histogram'])
+        lines.extend(self._expiry_lag.render('chat_expiry_lag_seconds', dict()))
+        lines.extend(['# TYPE chat_expired_messages_total counter',
+                      f'chat_expired_messages_total {self._expired_messages}'])
+        lines.extend(['# HELP chat_scheduled_send_lag_seconds Delay of scheduled messages after their send time.',
+                      '# TYPE chat_scheduled_send_lag_seconds histogram'])
+        lines.extend(self._scheduled_send_lag.render('chat_scheduled_send_lag_seconds', dict()))
+        lines.extend(['# TYPE chat_scheduled_sent_messages_total counter',
+                      f'chat_scheduled_sent_messages_total {self._scheduled_sent_messages}'])
+        for name, samples in gauges.items():
+            lines.append(f'# TYPE {name} gauge')
+            lines.extend(f'{name}{format_labels(labels)} {value}' for labels, value in samples)
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,70 @@
+from collections import OrderedDict
+from math import inf
+from time import monotonic
+from typing import Tuple
+
+
+class RateLimiter:
+    """
+    Ограничитель частоты запросов по алгоритму token bucket: у каждого ключа корзина на limit жетонов,
+    которая равномерно пополняется за period секунд.
+
+    Для ключа хранится только пара (жетоны, время обновления). Корзины упорядочены по времени последнего
+    обращения: корзина, к которой не обращались period секунд, уже полна и ничем не отличается от новой,
+    поэтому такие корзины удаляются с начала очереди за амортизированное O(1) на запрос.
+    """
+
+    def __init__(self, limit: int, period: float):
+        self._capacity = float(limit)
+        self._rate = limit / period
+        self._period = period
+        self._buckets: 'OrderedDict[str, Tuple[float, float]]' = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def _evict(self, now: float) -> None:
+        """
+        Удаление корзин, к которым не обращались дольше периода пополнения.
+
+        :param now: Текущее время, monotonic.
+        :return: None.
+        """
+        while self._buckets:
+            key, (_, updated) = next(iter(self._buckets.items()))
+            if now - updated < self._period:
+                break
+            del self._buckets[key]
+
+    def acquire(self, key: str, cost: int = 1) -> float:
+        """
+        Списание жетонов из корзины ключа.
+
+        :param key: Ключ (имя пользователя).
+        :param cost: Количество жетонов.
+        :return: 0, если жетоны списаны, иначе - через сколько секунд их будет достаточно
+            (бесконечность, если cost больше емкости корзины).
+        """
+        now = monotonic()
+        self._evict(now)
+        tokens, updated = self._buckets.pop(key, (self._capacity, now))
+        tokens = min(self._capacity, tokens + (now - updated) * self._rate)
+        if tokens >= cost:
+            self._buckets[key] = (tokens - cost, now)
+            return 0.0
+        self._buckets[key] = (tokens, now)
+        if cost > self._capacity:
+            return inf
+        return (cost - tokens) / self._rate
+
+    def refund(self, key: str, cost: int = 1) -> None:
+        """
+        Возврат жетонов, списанных для запроса, который отклонил другой ограничитель.
+
+        :param key: Ключ (имя пользователя).
+        :param cost: Количество жетонов.
+        :return: None.
+        """
+        if key in self._buckets:
+            tokens, updated = self._buckets[key]
+            self._buckets[key] = (min(self._capacity, tokens + cost), updated)
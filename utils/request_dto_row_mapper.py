@@ -1,16 +1,188 @@
+from typing import Any
 from typing import Dict
+from urllib.parse import parse_qsl
 
 from data_transfer_objects.request_dto import RequestDto
 
+try:
+    from orjson import loads
+except ImportError:
+    from json import loads
+
+STRING_FIELDS = ('client_name', 'message', 'recipient', 'chat_name')
+INTEGER_FIELDS = ('since', 'offset', 'limit', 'version', 'delay', 'schedule_id', 'size')
+OPTIONAL_STRING_FIELDS = ('sender', 'start_time', 'end_time', 'send_time', 'attachment')
+STRING_TYPES = frozenset((str, type(None)))
+INTEGER_TYPES = frozenset((int, type(None)))
+LIST_TYPES = frozenset((list, type(None)))
+
+
+class RequestError(ValueError):
+    """
+    Некорректный запрос: ответ на него формируется без обращения к обработчикам.
+    """
+
+    def __init__(self, message: str, request_id: Any = None):
+        super().__init__(message)
+        self.request_id = request_id
+
+    @property
+    def response(self) -> str:
+        return f'Bad request: {self}'
+
 
 class RequestDtoRowMapper:
+    """
+    Разбор запроса в RequestDto с проверкой типов полей.
+
+    JSON разбирается orjson, если он установлен, иначе стандартным модулем json; тело запроса передается
+    в байтах, без промежуточного декодирования в строку.
+    """
+
+    @classmethod
+    def get_from_bytes(cls, data: bytes) -> RequestDto:
+        """
+        Разбор тела запроса.
+
+        :param data: Тело запроса в UTF-8.
+        :return: Объект запроса.
+        :raises RequestError: Тело запроса - не JSON-объект или поля запроса имеют неверный тип.
+        """
+        try:
+            request_data = loads(data)
+        except ValueError:
+            raise RequestError('malformed JSON')
+        return cls.get_from_dict(request_data)
 
     @staticmethod
-    async def get_from_dict(request_data: Dict[str, str]) -> RequestDto:
+    def _parse_query(query: bytes) -> Dict[str, Any]:
+        """
+        Разбор строки HTTP-запроса; значения целочисленных полей приводятся к int.
+
+        :param query: Строка запроса в UTF-8.
+        :return: Поля запроса.
+        :raises RequestError: Строка запроса некорректна или значение целочисленного поля - не число.
+        """
+        try:
+            fields = parse_qsl(query.decode(), keep_blank_values=True, strict_parsing=bool(query))
+        except ValueError:
+            raise RequestError('malformed query string')
+        request_data: Dict[str, Any] = dict()
+        for field, value in fields:
+            if field in INTEGER_FIELDS:
+                try:
+                    value = int(value)
+                except ValueError:
+                    raise RequestError(f'field {field} must be an integer')
+            request_data[field] = value
+        return request_data
+
+    @classmethod
+    def get_from_query(cls, endpoint: str, query: bytes, body: bytes) -> RequestDto:
+        """
+        Разбор HTTP-запроса: поля передаются в строке запроса и (для POST) JSON-объектом в теле,
+        поля тела заменяют одноименные поля строки запроса; эндпоинт определяется путем.
+
+        :param endpoint: Эндпоинт.
+        :param query: Строка запроса (после `?`) в UTF-8.
+        :param body: Тело запроса в UTF-8, может быть пустым.
+        :return: Объект запроса.
+        :raises RequestError: Тело запроса - не JSON-объект или поля запроса имеют неверный тип.
+        """
+        request_data = cls._parse_query(query)
+        if body:
+            try:
+                body_data = loads(body)
+            except ValueError:
+                raise RequestError('malformed JSON')
+            if type(body_data) is not dict:
+                raise RequestError('request must be a JSON object')
+            request_data.update(body_data)
+        request_data['endpoint'] = endpoint
+        return cls.get_from_dict(request_data)
+
+    @staticmethod
+    def _get_error(request_data: Dict[str, Any]) -> RequestError:
+        """
+        Поиск поля неверного типа для ответа об ошибке.
+
+        :param request_data: Разобранный запрос.
+        :return: Ошибка с описанием первого поля неверного типа.
+        """
+        request_id = request_data.get('request_id')
+        if type(request_data.get('endpoint')) is not str:
+            return RequestError('field endpoint must be a string', request_id)
+        for field in STRING_FIELDS + OPTIONAL_STRING_FIELDS:
+            if type(request_data.get(field)) not in STRING_TYPES:
+                return RequestError(f'field {field} must be a string', request_id)
+        for field in INTEGER_FIELDS:
+            if type(request_data.get(field)) not in INTEGER_TYPES:
+                return RequestError(f'field {field} must be an integer', request_id)
+        return RequestError('field messages must be a list', request_id)
+
+    @classmethod
+    def get_from_dict(cls, request_data: Any) -> RequestDto:
+        """
+        Построение объекта запроса из разобранного JSON.
+
+        Обязательно только поле endpoint; отсутствующие строковые поля считаются пустыми строками,
+        кроме полей поиска (sender, start_time, end_time), времени отложенной отправки (send_time) и вложения
+        (attachment).
+        Типы всех полей проверяются одним выражением, поле с ошибкой ищется только для некорректного запроса.
+
+        :param request_data: Разобранный запрос.
+        :return: Объект запроса.
+        :raises RequestError: Запрос - не объект или поля запроса имеют неверный тип.
+        """
+        if type(request_data) is not dict:
+            raise RequestError('request must be a JSON object')
+        get = request_data.get
+        endpoint = get('endpoint')
+        client_name = get('client_name')
+        message = get('message')
+        recipient = get('recipient')
+        chat_name = get('chat_name')
+        since = get('since')
+        messages = get('messages')
+        offset = get('offset')
+        limit = get('limit')
+        version = get('version')
+        sender = get('sender')
+        start_time = get('start_time')
+        end_time = get('end_time')
+        send_time = get('send_time')
+        delay = get('delay')
+        schedule_id = get('schedule_id')
+        attachment = get('attachment')
+        size = get('size')
+        if not (
+            type(endpoint) is str and type(client_name) in STRING_TYPES and type(message) in STRING_TYPES
+            and type(recipient) in STRING_TYPES and type(chat_name) in STRING_TYPES
+            and type(since) in INTEGER_TYPES and type(offset) in INTEGER_TYPES and type(limit) in INTEGER_TYPES
+            and type(version) in INTEGER_TYPES and type(messages) in LIST_TYPES and type(sender) in STRING_TYPES
+            and type(start_time) in STRING_TYPES and type(end_time) in STRING_TYPES
+            and type(send_time) in STRING_TYPES and type(delay) in INTEGER_TYPES and type(schedule_id) in INTEGER_TYPES
+            and type(attachment) in STRING_TYPES and type(size) in INTEGER_TYPES
+        ):
+            raise cls._get_error(request_data)
         return RequestDto(
-            client_name=request_data['client_name'],
-            endpoint=request_data['endpoint'],
-            message=request_data['message'],
-            recipient=request_data['recipient'],
-            chat_name=request_data['chat_name'],
+            client_name=client_name or '',
+            endpoint=endpoint,
+            message=message or '',
+            recipient=recipient or '',
+            chat_name=chat_name or '',
+            since=since,
+            messages=messages,
+            offset=offset,
+            limit=limit,
+            version=version,
+            sender=sender,
+            start_time=start_time,
+            end_time=end_time,
+            send_time=send_time,
+            delay=delay,
+            schedule_id=schedule_id,
+            attachment=attachment,
+            size=size,
+            request_id=get('request_id'),
         )
@@ -0,0 +1,103 @@
+from os.path import basename
+from sys import _current_frames
+from threading import Event
+from threading import Lock
+from threading import Thread
+from threading import main_thread
+from types import FrameType
+from typing import Dict
+from typing import Optional
+
+from settings import PROFILER_INTERVAL
+from settings import PROFILER_REPORT_LIMIT
+
+
+class SamplingProfiler:
+    """
+    Выборочный профилировщик цикла событий.
+
+    Отдельный поток раз в interval секунд снимает стек главного потока и считает одинаковые стеки.
+    Включается и выключается во время работы сервера; пока он выключен, накладных расходов нет.
+    """
+
+    def __init__(self, interval: float = PROFILER_INTERVAL):
+        self._interval = interval
+        self._thread: Optional[Thread] = None
+        self._stopped = Event()
+        self._lock = Lock()
+        self._samples: Dict[str, int] = dict()
+        self._total = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self) -> None:
+        """
+        Запуск сбора: накопленные ранее стеки сбрасываются.
+
+        :return: None.
+        """
+        if self._thread is not None:
+            return
+        with self._lock:
+            self._samples = dict()
+            self._total = 0
+        self._stopped.clear()
+        self._thread = Thread(
+            target=self._run, args=(main_thread().ident,), name='sampling-profiler', daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Остановка сбора; накопленные стеки остаются доступны для отчета.
+
+        :return: None.
+        """
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._thread.join()
+        self._thread = None
+
+    @staticmethod
+    def _format_stack(frame: Optional[FrameType]) -> str:
+        """
+        Стек в свернутом виде (`файл:функция;...` от внешнего вызова к внутреннему).
+
+        :param frame: Текущий кадр потока.
+        :return: Строка стека.
+        """
+        names = list()
+        while frame is not None:
+            names.append(f'{basename(frame.f_code.co_filename)}:{frame.f_code.co_name}')
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def _run(self, thread_id: int) -> None:
+        """
+        Цикл сбора стеков.
+
+        :param thread_id: Идентификатор профилируемого потока.
+        :return: None.
+        """
+        while not self._stopped.wait(self._interval):
+            stack = self._format_stack(_current_frames().get(thread_id))
+            with self._lock:
+                self._samples[stack] = self._samples.get(stack, 0) + 1
+                self._total += 1
+
+    def report(self, limit: int = PROFILER_REPORT_LIMIT) -> str:
+        """
+        Самые частые стеки в свернутом формате (`стек количество`), пригодном для построения flame graph.
+
+        :param limit: Количество стеков в отчете.
+        :return: Текст отчета.
+        """
+        with self._lock:
+            samples = sorted(self._samples.items(), key=lambda item: item[1], reverse=True)[:limit]
+            total = self._total
+        lines = [f'# samples {total}, running {self.running}']
+        lines.extend(f'{stack} {count}' for stack, count in samples)
+        return '\n'.join(lines)
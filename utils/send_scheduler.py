@@ -0,0 +1,170 @@
+from asyncio import Event
+from asyncio import TimeoutError
+from asyncio import sleep
+from asyncio import wait_for
+from heapq import heapify
+from heapq import heappop
+from heapq import heappush
+from logging import getLogger
+from sys import intern
+from time import time
+from typing import Awaitable
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from builtin_types import ScheduledMessage
+from builtin_types.message import MICROSECONDS
+from settings import SCHEDULED_SEND_BATCH_SIZE
+from .metrics import Metrics
+
+scheduler_logger = getLogger(__name__)
+
+
+class SendScheduler:
+    """
+    Отложенная отправка сообщений.
+
+    Все отложенные сообщения лежат в одной куче по моменту отправки, и одна фоновая задача просыпается только
+    к ближайшему из них - без таймера на каждое сообщение. Отмена удаляет сообщение из словаря за O(1), а его
+    запись в куче пропускается при извлечении; когда таких записей становится больше половины, куча
+    перестраивается. Наступившие сообщения отправляются пачками не больше batch_size, между пачками задача
+    уступает цикл событий.
+    """
+
+    def __init__(
+        self,
+        deliver: Callable[[List[ScheduledMessage]], Awaitable[None]],
+        metrics: Metrics,
+        batch_size: int = SCHEDULED_SEND_BATCH_SIZE
+    ):
+        self._deliver = deliver
+        self._metrics = metrics
+        self._batch_size = batch_size
+        self._heap: List[Tuple[int, int]] = list()
+        self._messages: Dict[int, ScheduledMessage] = dict()
+        self._last_id = 0
+        self._wakeup: Optional[Event] = None
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    @property
+    def last_id(self) -> int:
+        return self._last_id
+
+    @last_id.setter
+    def last_id(self, value: int) -> None:
+        self._last_id = max(self._last_id, value)
+
+    @property
+    def messages(self) -> List[ScheduledMessage]:
+        return list(self._messages.values())
+
+    def add(self, message: ScheduledMessage) -> None:
+        """
+        Добавление отложенного сообщения с уже назначенным номером (при восстановлении).
+
+        :param message: Отложенное сообщение.
+        :return: None.
+        """
+        self._messages[message.schedule_id] = message
+        self.last_id = message.schedule_id
+        heappush(self._heap, (message.send_at, message.schedule_id))
+        if self._wakeup is not None and self._heap[0][1] == message.schedule_id:
+            self._wakeup.set()
+
+    def schedule(self, sender_name: str, recipient_name: str, text: str, send_at: int) -> ScheduledMessage:
+        """
+        Постановка сообщения в очередь отправки под следующим номером.
+
+        :param sender_name: Имя отправителя.
+        :param recipient_name: Имя получателя, пустая строка - общий чат.
+        :param text: Текст сообщения.
+        :param send_at: Момент отправки, микросекунды epoch.
+        :return: Отложенное сообщение.
+        """
+        message = ScheduledMessage(
+            schedule_id=self._last_id + 1, sender=intern(sender_name), recipient=intern(recipient_name), text=text,
+            send_at=send_at
+        )
+        self.add(message)
+        return message
+
+    def get(self, schedule_id: int) -> Optional[ScheduledMessage]:
+        """
+        Поиск ожидающего отправки сообщения.
+
+        :param schedule_id: Номер отложенного сообщения.
+        :return: Отложенное сообщение или None, если оно уже отправлено или отменено.
+        """
+        return self._messages.get(schedule_id)
+
+    def cancel(self, schedule_id: int) -> Optional[ScheduledMessage]:
+        """
+        Отмена отправки сообщения.
+
+        :param schedule_id: Номер отложенного сообщения.
+        :return: Отмененное сообщение или None, если его нет в очереди.
+        """
+        message = self._messages.pop(schedule_id, None)
+        if message is not None and len(self._heap) > 2 * len(self._messages):
+            self._heap = [(item.send_at, item.schedule_id) for item in self._messages.values()]
+            heapify(self._heap)
+        return message
+
+    def _pop_due(self, now: int) -> List[ScheduledMessage]:
+        """
+        Извлечение наступивших сообщений в порядке момента отправки.
+
+        :param now: Текущее время, микросекунды epoch.
+        :return: Не больше batch_size сообщений.
+        """
+        batch: List[ScheduledMessage] = list()
+        while self._heap and self._heap[0][0] <= now and len(batch) < self._batch_size:
+            _, schedule_id = heappop(self._heap)
+            message = self._messages.pop(schedule_id, None)
+            if message is not None:
+                batch.append(message)
+        return batch
+
+    async def _wait(self, timeout: Optional[float]) -> None:
+        """
+        Ожидание ближайшего момента отправки или появления более раннего.
+
+        :param timeout: Время до ближайшего момента, с; None - ждать появления сообщения в очереди.
+        :return: None.
+        """
+        self._wakeup.clear()  # type: ignore
+        try:
+            await wait_for(self._wakeup.wait(), timeout)  # type: ignore
+        except TimeoutError:
+            pass
+
+    async def run(self) -> None:
+        """
+        Цикл отправки наступивших сообщений.
+
+        :return: None.
+        """
+        self._wakeup = Event()
+        while True:
+            while self._heap and self._heap[0][1] not in self._messages:
+                heappop(self._heap)
+            if not self._heap:
+                await self._wait(None)
+                continue
+            send_at = self._heap[0][0]
+            now = round(time() * MICROSECONDS)
+            if send_at > now:
+                await self._wait((send_at - now) / MICROSECONDS)
+                continue
+            batch = self._pop_due(now)
+            self._metrics.observe_scheduled_send((now - send_at) / MICROSECONDS, len(batch))
+            try:
+                await self._deliver(batch)
+            except Exception:
+                scheduler_logger.exception('Failed to send %s scheduled messages', len(batch))
+            await sleep(0)
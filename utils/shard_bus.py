@@ -0,0 +1,243 @@
+from asyncio import AbstractServer
+from asyncio import Future
+from asyncio import Queue
+from asyncio import StreamReader
+from asyncio import StreamWriter
+from asyncio import Task
+from asyncio import create_task
+from asyncio import get_running_loop
+from asyncio import open_unix_connection
+from asyncio import sleep
+from asyncio import start_unix_server
+from asyncio import wait_for
+from itertools import count
+from logging import getLogger
+from os import unlink
+from typing import Any
+from typing import Awaitable
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Set
+
+from settings import SHARD_BUS_RECONNECT_DELAY
+from settings import SHARD_BUS_REQUEST_TIMEOUT
+from .framed_connection import FramedConnection
+
+bus_logger = getLogger(__name__)
+
+
+class ShardBus:
+    """
+    Шина обмена между процессами-шардами сервера через Unix-сокеты.
+
+    Каждый шард слушает свой сокет и держит по одному исходящему соединению к остальным шардам.
+    Все кадры к шарду (запросы и события) отправляются одной задачей из очереди, поэтому события
+    доставляются в порядке публикации, а публикация не ждет записи и не блокирует обработку запросов.
+    Ответы на запросы приходят в то же соединение и сопоставляются по request_id; запрос, оставшийся без ответа
+    request_timeout секунд, завершается ошибкой TimeoutError и уже не отправляется, если еще ждал в очереди.
+    """
+
+    def __init__(
+        self,
+        shard_id: int,
+        socket_paths: List[str],
+        request_handler: Callable[[str, Dict[str, Any]], Awaitable[Any]],
+        event_handler: Callable[[Dict[str, Any]], Awaitable[None]],
+        request_timeout: float = SHARD_BUS_REQUEST_TIMEOUT
+    ):
+        self._shard_id = shard_id
+        self._socket_paths = socket_paths
+        self._request_handler = request_handler
+        self._event_handler = event_handler
+        self._request_timeout = request_timeout
+
+        self._server: Optional[AbstractServer] = None
+        self._outboxes: Dict[int, Queue] = dict()
+        self._sender_tasks: Dict[int, Task] = dict()
+        self._pending: Dict[int, Future] = dict()
+        self._in_flight: Dict[int, Set[int]] = dict()
+        self._request_ids = count(1)
+
+    async def start(self) -> None:
+        """
+        Запуск сервера шины и задач отправки к остальным шардам.
+
+        :return: None.
+        """
+        path = self._socket_paths[self._shard_id]
+        try:
+            unlink(path)
+        except FileNotFoundError:
+            pass
+        self._server = await start_unix_server(self._serve_peer, path=path)
+        for shard_id in range(len(self._socket_paths)):
+            if shard_id != self._shard_id:
+                self._outboxes[shard_id] = Queue()
+                self._in_flight[shard_id] = set()
+                self._sender_tasks[shard_id] = create_task(self._send_loop(shard_id))
+
+    async def stop(self) -> None:
+        """
+        Остановка шины.
+
+        :return: None.
+        """
+        for task in self._sender_tasks.values():
+            task.cancel()
+        self._sender_tasks = dict()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def publish(self, event: Dict[str, Any]) -> None:
+        """
+        Рассылка события остальным шардам без ожидания.
+
+        :param event: Событие.
+        :return: None.
+        """
+        for outbox in self._outboxes.values():
+            outbox.put_nowait({'event': event})
+
+    async def request(self, shard_id: int, kind: str, payload: Dict[str, Any]) -> Any:
+        """
+        Запрос к другому шарду с ожиданием ответа.
+
+        :param shard_id: Номер шарда.
+        :param kind: Тип запроса.
+        :param payload: Данные запроса.
+        :return: Результат обработки запроса шардом.
+        :raises TimeoutError: Шард не ответил за request_timeout секунд.
+        """
+        request_id = next(self._request_ids)
+        future = get_running_loop().create_future()
+        self._pending[request_id] = future
+        self._outboxes[shard_id].put_nowait({'request_id': request_id, 'kind': kind, 'payload': payload})
+        try:
+            return await wait_for(future, self._request_timeout)
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def _connect(self, shard_id: int) -> FramedConnection:
+        """
+        Подключение к шарду с повторами, пока он не запустится.
+
+        :param shard_id: Номер шарда.
+        :return: Кадрированное соединение.
+        """
+        while True:
+            try:
+                reader, writer = await open_unix_connection(self._socket_paths[shard_id])
+            except (ConnectionError, FileNotFoundError):
+                await sleep(SHARD_BUS_RECONNECT_DELAY)
+                continue
+            connection = FramedConnection(reader, writer)
+            create_task(self._read_replies(shard_id, connection))
+            return connection
+
+    async def _send_loop(self, shard_id: int) -> None:
+        """
+        Отправка кадров из очереди шарду.
+
+        Если соединение разорвано, кадр отправляется повторно после переподключения; запросы, которые уже
+        не ждут ответа, пропускаются.
+
+        :param shard_id: Номер шарда.
+        :return: None.
+        """
+        outbox = self._outboxes[shard_id]
+        connection: Optional[FramedConnection] = None
+        while True:
+            frame = await outbox.get()
+            if 'request_id' in frame and frame['request_id'] not in self._pending:
+                continue
+            while True:
+                if connection is None or connection.closed:
+                    connection = await self._connect(shard_id)
+                try:
+                    await connection.write_frame(frame)
+                    if 'request_id' in frame:
+                        self._in_flight[shard_id].add(frame['request_id'])
+                    break
+                except ConnectionError as error:
+                    bus_logger.info('Shard bus connection to shard %s broken: %s', shard_id, error)
+                    connection = None
+
+    async def _read_replies(self, shard_id: int, connection: FramedConnection) -> None:
+        """
+        Чтение ответов на запросы из исходящего соединения.
+
+        При разрыве соединения запросы, отправленные, но оставшиеся без ответа, завершаются ошибкой.
+
+        :param shard_id: Номер шарда.
+        :param connection: Кадрированное соединение.
+        :return: None.
+        """
+        in_flight = self._in_flight[shard_id]
+        try:
+            while True:
+                frame = await connection.read_frame()
+                if frame is None:
+                    break
+                in_flight.discard(frame['request_id'])
+                future = self._pending.get(frame['request_id'])
+                if future is None or future.done():
+                    continue
+                if 'error' in frame:
+                    future.set_exception(RuntimeError(f'Shard {shard_id} failed request: {frame["error"]}'))
+                else:
+                    future.set_result(frame['result'])
+        except ConnectionError:
+            pass
+        await connection.close()
+        for request_id in list(in_flight):
+            future = self._pending.get(request_id)
+            if future is not None and not future.done():
+                future.set_exception(ConnectionError(f'Shard {shard_id} disconnected'))
+        in_flight.clear()
+
+    async def _handle_request(self, connection: FramedConnection, frame: Dict[str, Any]) -> None:
+        """
+        Обработка запроса другого шарда и отправка ответа.
+
+        :param connection: Входящее соединение.
+        :param frame: Кадр запроса.
+        :return: None.
+        """
+        try:
+            result = await self._request_handler(frame['kind'], frame['payload'])
+            reply = {'request_id': frame['request_id'], 'result': result}
+        except Exception as error:
+            bus_logger.exception('Shard bus request %s failed', frame['kind'])
+            reply = {'request_id': frame['request_id'], 'error': f'{type(error).__name__}: {error}'}
+        try:
+            await connection.write_frame(reply)
+        except ConnectionError:
+            bus_logger.info('Shard bus peer disconnected before reply to %s', frame['kind'])
+
+    async def _serve_peer(self, reader: StreamReader, writer: StreamWriter) -> None:
+        """
+        Обслуживание входящего соединения другого шарда.
+
+        События применяются по порядку, запросы обрабатываются конкурентно.
+
+        :param reader: Поток чтения.
+        :param writer: Поток записи.
+        :return: None.
+        """
+        connection = FramedConnection(reader, writer)
+        try:
+            while True:
+                frame = await connection.read_frame()
+                if frame is None:
+                    break
+                if 'event' in frame:
+                    await self._event_handler(frame['event'])
+                else:
+                    create_task(self._handle_request(connection, frame))
+        except ConnectionError as error:
+            bus_logger.info('Shard bus peer connection broken: %s', error)
+        await connection.close()
@@ -0,0 +1,180 @@
+from datetime import datetime
+from datetime import timedelta
+from io import SEEK_CUR
+from json import dumps
+from json import loads
+from os import O_RDONLY
+from os import close
+from os import fsync
+from os import open as open_descriptor
+from os import pread
+from os import replace
+from os.path import abspath
+from os.path import dirname
+from typing import Any
+from typing import BinaryIO
+from typing import Dict
+from typing import List
+from typing import Optional
+
+from builtin_types import Message
+
+
+class SnapshotChatSource:
+    """
+    Блок сообщений чата в файле снимка, читаемый по требованию.
+
+    Строка сообщения имеет вид `<время отправки, микросекунды epoch> <номер> <JSON [отправитель, текст, вложение]>`
+    (вложение записывается, только если оно есть; в снимках прежнего формата время - в секундах), поэтому
+    устаревшие сообщения отбрасываются по числовому префиксу без разбора JSON.
+    """
+
+    def __init__(self, file: BinaryIO, offset: int, size: int):
+        self._file = file
+        self._offset = offset
+        self._size = size
+
+    def read_block(self) -> bytes:
+        """
+        Чтение блока сообщений целиком (для переноса в новый снимок без разбора).
+
+        :return: Блок строк сообщений.
+        """
+        return pread(self._file.fileno(), self._size, self._offset)
+
+    def load(self, actuality_period: Optional[timedelta]) -> List[Message]:
+        """
+        Загрузка актуальных сообщений блока.
+
+        :param actuality_period: Период актуальности сообщений, None - загрузить все сообщения.
+        :return: Список сообщений.
+        """
+        deadline = Message.get_timestamp(datetime.now() - actuality_period) if actuality_period is not None else -1
+        messages = list()
+        for line in self.read_block().splitlines():
+            time_end = line.index(b' ')
+            timestamp = Message.get_stored_timestamp(int(line[:time_end]))
+            if timestamp <= deadline:
+                continue
+            seq_end = line.index(b' ', time_end + 1)
+            sender_name, text, *attachment = loads(line[seq_end + 1:])
+            messages.append(
+                Message.from_timestamp(
+                    timestamp=timestamp,
+                    sender_name=sender_name,
+                    text=text,
+                    seq=int(line[time_end + 1:seq_end]),
+                    attachment=attachment[0] if attachment else None
+                )
+            )
+        return messages
+
+
+class Snapshot:
+    """
+    Построчный формат снимка состояния сервера.
+
+    Первая строка - JSON-заголовок сервера, далее строки пользователей, отложенных сообщений и заголовки чатов.
+    За заголовком чата следует блок строк его сообщений, размер блока в байтах указан в заголовке. Это позволяет
+    читать снимок потоково и пропускать блоки сообщений, откладывая их разбор до первого обращения к чату.
+    """
+
+    # Количество fsync при записи снимка: временный файл и каталог после переименования.
+    WRITE_FSYNCS = 2
+
+    @staticmethod
+    def _encode_messages(messages: List[Dict[str, Any]]) -> bytes:
+        """
+        Кодирование сообщений чата в блок строк.
+
+        :param messages: Сообщения в формате словарей.
+        :return: Блок строк сообщений.
+        """
+        lines = list()
+        for message in messages:
+            fields = [message['sender'], message['text']]
+            if 'attachment' in message:
+                fields.append(message['attachment'])
+            lines.append(f'{message["sending_time"]} {message["seq"]} '.encode() + dumps(fields).encode() + b'\n')
+        return b''.join(lines)
+
+    @classmethod
+    def write(cls, path: str, snapshot: Dict[str, Any]) -> int:
+        """
+        Атомарная запись снимка: запись во временный файл, fsync, переименование и fsync каталога, после которого
+        переименование переживет сбой.
+
+        :param path: Путь к файлу снимка.
+        :param snapshot: Снимок состояния сервера.
+        :return: Количество записанных байт.
+        """
+        written = 0
+        temporary_path = f'{path}.tmp'
+        with open(temporary_path, 'wb') as file:
+            lines = [
+                {
+                    'type': 'server',
+                    'host': snapshot['host'],
+                    'port': snapshot['port'],
+                    'lsn': snapshot.get('lsn', 0),
+                    'scheduled_id': snapshot.get('scheduled_id', 0),
+                }
+            ]
+            lines.extend({'type': 'user', **user} for user in snapshot['users'])
+            lines.extend({'type': 'scheduled', **message} for message in snapshot.get('scheduled', list()))
+            for line in lines:
+                written += file.write(dumps(line).encode() + b'\n')
+            for chat in [snapshot['common_chat'], *snapshot['private_chats']]:
+                source = chat.get('messages_source')
+                block = source.read_block() if source is not None else cls._encode_messages(chat['messages'])
+                header = {
+                    'type': 'chat',
+                    'name': chat['name'],
+                    'members': chat.get('members'),
+                    'actuality_period': chat['actuality_period'],
+                    'last_seq': chat['last_seq'],
+                    'size': len(block),
+                }
+                written += file.write(dumps(header).encode() + b'\n')
+                written += file.write(block)
+            file.flush()
+            fsync(file.fileno())
+        replace(temporary_path, path)
+        directory = open_descriptor(dirname(abspath(path)), O_RDONLY)
+        try:
+            fsync(directory)
+        finally:
+            close(directory)
+        return written
+
+    @staticmethod
+    def read(path: str) -> Optional[Dict[str, Any]]:
+        """
+        Потоковое чтение снимка без разбора сообщений.
+
+        Файл остается открытым: из него по требованию читаются блоки сообщений чатов,
+        даже если к тому времени снимок будет заменен новым.
+
+        :param path: Путь к файлу снимка.
+        :return: Заголовок сервера, пользователи, отложенные сообщения и заголовки чатов с источниками сообщений
+            или None.
+        """
+        try:
+            file = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+        snapshot: Dict[str, Any] = {'users': list(), 'scheduled': list(), 'chats': list()}
+        for line in iter(file.readline, b''):
+            record = loads(line)
+            record_type = record.pop('type')
+            if record_type == 'server':
+                snapshot.update(record)
+            elif record_type == 'user':
+                snapshot['users'].append(record)
+            elif record_type == 'scheduled':
+                snapshot['scheduled'].append(record)
+            elif record_type == 'chat':
+                record['messages_source'] = SnapshotChatSource(file, file.tell(), record['size'])
+                snapshot['chats'].append(record)
+                file.seek(record['size'], SEEK_CUR)
+        return snapshot
@@ -0,0 +1,143 @@
+from asyncio import Queue
+from asyncio import QueueFull
+from asyncio import Task
+from asyncio import create_task
+from typing import Any
+from typing import Hashable
+from typing import Optional
+
+from builtin_types import EncodedText
+from builtin_types import Message
+from settings import SUBSCRIBER_OVERFLOW_POLICY
+from settings import SUBSCRIBER_QUEUE_SIZE
+from .framed_connection import FramedConnection
+
+
+class Subscriber:
+    """
+    Подписчик на новые сообщения чата.
+
+    Сообщения складываются в ограниченную очередь и отправляются отдельной задачей, поэтому медленный
+    подписчик не задерживает отправителя. При переполнении очереди подписчик либо пропускает самые старые
+    сообщения (политика "skip"), либо отключается (политика "disconnect") с завершающим событием "dropped".
+    """
+
+    def __init__(
+        self,
+        connection: FramedConnection,
+        request_id: Any,
+        chat_name: str,
+        chat_key: Hashable,
+        queue_size: int = SUBSCRIBER_QUEUE_SIZE,
+        overflow_policy: str = SUBSCRIBER_OVERFLOW_POLICY
+    ):
+        self._connection = connection
+        self._request_id = request_id
+        self._chat_name = chat_name
+        self._chat_key = chat_key
+        self._queue: Queue = Queue(maxsize=queue_size)
+        self._overflow_policy = overflow_policy
+        self._skipped = 0
+        self._task: Optional[Task] = None
+
+    @property
+    def chat_name(self) -> str:
+        return self._chat_name
+
+    @property
+    def chat_key(self) -> Hashable:
+        return self._chat_key
+
+    @property
+    def connection(self) -> FramedConnection:
+        return self._connection
+
+    @property
+    def active(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        """
+        Запуск задачи доставки сообщений.
+
+        :return: None.
+        """
+        self._task = create_task(self._deliver())
+
+    def stop(self) -> None:
+        """
+        Остановка задачи доставки сообщений.
+
+        :return: None.
+        """
+        if self._task is not None:
+            self._task.cancel()
+
+    def drop(self) -> None:
+        """
+        Отключение подписчика с отправкой завершающего события, чтобы клиент перестал ждать сообщений.
+
+        :return: None.
+        """
+        self.stop()
+        self._task = create_task(self._notify_dropped())
+
+    def push(self, message: Message) -> bool:
+        """
+        Постановка сообщения в очередь доставки без ожидания.
+
+        :param message: Объект сообщения.
+        :return: False, если подписчик должен быть отключен.
+        """
+        if not self.active:
+            return False
+        try:
+            self._queue.put_nowait(message)
+        except QueueFull:
+            if self._overflow_policy != 'skip':
+                return False
+            self._queue.get_nowait()
+            self._skipped += 1
+            self._queue.put_nowait(message)
+        return True
+
+    async def _deliver(self) -> None:
+        """
+        Отправка сообщений из очереди подписчику.
+
+        :return: None.
+        """
+        try:
+            while True:
+                message = await self._queue.get()
+                if self._skipped:
+                    skipped, self._skipped = self._skipped, 0
+                    await self._connection.write_frame({
+                        'request_id': self._request_id,
+                        'event': 'skipped',
+                        'chat_name': self._chat_name,
+                        'response': f'Skipped {skipped} messages',
+                    })
+                await self._connection.write_frame_parts(self._connection.encode_text_frame(
+                    {'request_id': self._request_id, 'event': 'message', 'chat_name': self._chat_name},
+                    'response',
+                    EncodedText([message.encode()])
+                ))
+        except ConnectionError:
+            pass
+
+    async def _notify_dropped(self) -> None:
+        """
+        Отправка подписчику завершающего события об отключении от рассылки.
+
+        :return: None.
+        """
+        try:
+            await self._connection.write_frame({
+                'request_id': self._request_id,
+                'event': 'dropped',
+                'chat_name': self._chat_name,
+                'response': 'Subscription dropped: delivery queue overflow',
+            })
+        except ConnectionError:
+            pass